@@ -0,0 +1,43 @@
+"""Emisión y verificación local de los tokens JWT.
+
+Los tokens llevan los claims ``sub`` (email), ``uid``, ``type``, ``iat`` y
+``exp``, y en la cabecera el ``kid`` de la clave con que se firmaron. Para
+verificarlos basta con la clave compartida (``JWT_SECRET``): la firma y la
+expiración se comprueban sin consultar la base de datos ni llamar a este
+servicio.
+
+``verify.py`` contiene solo la parte de verificación y se copia tal cual en
+los demás servicios, que la usan como dependencia de FastAPI::
+
+    from app.verify import ClaimsDep
+
+    @app.get("/privado")
+    def privado(claims: ClaimsDep):
+        ...
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+from jose import jwt
+
+from app.verify import JWT_ALGORITHM, JWT_KEY_ID, JWT_KEYS
+
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+
+
+def create_access_token(uid: int, email: str, type: str) -> str:
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": email,
+        "uid": uid,
+        "type": type,
+        "iat": now,
+        "exp": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    }
+    return jwt.encode(
+        claims,
+        JWT_KEYS[JWT_KEY_ID],
+        algorithm=JWT_ALGORITHM,
+        headers={"kid": JWT_KEY_ID},
+    )
@@ -0,0 +1,82 @@
+"""Caché en memoria acotada, con TTL y ventana de datos obsoletos.
+
+Cada entrada es fresca durante ``ttl`` segundos y, pasado ese tiempo, sigue
+disponible como obsoleta durante ``stale_ttl`` segundos más. Quien la
+consulta decide si sirve el dato obsoleto mientras lo revalida
+(stale-while-revalidate). Con ``stale_ttl=0`` las entradas expiran sin más.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """Caché LRU acotada por número de entradas y con expiración por TTL."""
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación para no guardar resultados que
+        # se cargaron antes de una escritura concurrente
+        self.generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_entry(self, key: Hashable) -> tuple[Any, bool] | None:
+        """Devolver ``(valor, es_fresco)`` o ``None`` si no hay entrada usable."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] + self.stale_ttl < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            fresh = entry[0] >= now
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return entry[1], fresh
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None):
+        """Guardar ``value`` si no hubo invalidaciones desde ``generation``."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+            }
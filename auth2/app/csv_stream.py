@@ -0,0 +1,49 @@
+"""Lectura incremental de CSV desde el cuerpo de una petición.
+
+El cuerpo se decodifica trozo a trozo y cada fila se entrega en cuanto llega
+su salto de línea, de modo que la memoria usada no depende del tamaño del
+fichero. La primera línea es la cabecera con los nombres de las columnas.
+Cada fila debe ocupar una sola línea (no se admiten saltos de línea dentro de
+campos entrecomillados).
+"""
+
+import codecs
+import csv
+from typing import AsyncIterable, AsyncIterator
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_csv_rows(chunks: AsyncIterable[bytes]) -> AsyncIterator[dict]:
+    """Filas del CSV como diccionarios ``columna -> valor``."""
+    fieldnames = None
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if fieldnames is None:
+            fieldnames = [name.strip() for name in values]
+            continue
+        yield dict(zip(fieldnames, values))
+
+
+async def batched(rows: AsyncIterable, size: int) -> AsyncIterator[list]:
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from app.models.user_db import UserType
+
+
+class UserSearchParams(BaseModel):
+    """Filtros comunes al listado y a la exportación de usuarios."""
+
+    type: Optional[UserType] = None
+    email_prefix: Optional[str] = Field(None, min_length=1)
+    name: Optional[str] = Field(
+        None, min_length=1, description="Texto contenido en el nombre"
+    )
+
+
+class UserFilterParams(UserSearchParams):
+    """Parámetros para listar usuarios.
+
+    Para obtener todos los usuarios sin paginar está ``/users/export``.
+    """
+
+    limit: int = Field(100, gt=0, le=1000)
+    cursor: Optional[str] = Field(None, description="Cursor de X-Next-Cursor")
@@ -0,0 +1,168 @@
+"""Hash y verificación de contraseñas con bcrypt en un pool acotado.
+
+bcrypt consume decenas o cientos de ms de CPU por llamada. Para que una
+ráfaga de logins no acapare los hilos (o el bucle de eventos) que atienden
+el resto de peticiones, todas las operaciones se ejecutan en un pool propio
+de ``HASH_WORKERS`` hilos; bcrypt libera el GIL, así que los hilos trabajan
+en paralelo. Como mucho se admiten ``HASH_MAX_PENDING`` operaciones a la vez
+(en curso o en cola): por encima de eso se responde 503 con ``Retry-After``
+en lugar de encolar sin límite. Las operaciones en bloque (importación de
+usuarios) esperan hueco en vez de fallar, pero nunca ocupan más de
+``HASH_WORKERS`` plazas para no dejar sin sitio a los logins.
+
+Los handlers esperan el resultado con ``await`` en lugar de bloquear un hilo
+del threadpool de anyio (40 por defecto) con ``Future.result()``: así las
+operaciones pendientes no agotan ese threadpool aunque ``HASH_MAX_PENDING``
+lo supere.
+
+Por defecto ``HASH_WORKERS`` es el número de CPUs que el contenedor puede usar
+según su cuota de cgroup (``cpu.max`` en cgroup v2, ``cpu.cfs_quota_us`` en
+v1), redondeado hacia arriba y como mínimo 1, y no ``os.cpu_count()``, que
+cuenta los núcleos del nodo: con un límite de 500m en un nodo de 16 núcleos
+serían 16 hilos repartiéndose medio núcleo y 64 operaciones admitidas de
+~0,5 s cada una antes de responder 503. ``HASH_MAX_PENDING`` es por defecto
+``4 * HASH_WORKERS``.
+
+El coste se configura con ``BCRYPT_ROUNDS``. Si cambia, los hashes antiguos
+siguen siendo válidos y se recalculan con el coste nuevo en el siguiente
+login correcto de cada usuario.
+"""
+
+import asyncio
+import math
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+
+def _cgroup_cpu_quota(root: str = "/sys/fs/cgroup") -> float | None:
+    """CPUs permitidas por la cuota de cgroup, o ``None`` si no hay límite."""
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = f.read().strip()
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+    if quota in ("max", "-1"):
+        return None
+    try:
+        return int(quota) / int(period)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def available_cpus(root: str = "/sys/fs/cgroup") -> int:
+    """CPUs que puede usar el proceso: afinidad y cuota de cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota(root)
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(available_cpus())))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 4)))
+HASH_RETRY_AFTER_SECONDS = int(os.getenv("HASH_RETRY_AFTER_SECONDS", "1"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+
+class HashingPool:
+    """Pool de hilos con un máximo de operaciones pendientes."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._bulk_slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many concurrent password operations",
+                headers={"Retry-After": str(HASH_RETRY_AFTER_SECONDS)},
+            )
+        return self._submit(fn, *args)
+
+    def map(self, fn: Callable, items: list) -> list:
+        """Aplicar ``fn`` a cada elemento en el pool, esperando hueco si hace falta."""
+        futures = []
+        for item in items:
+            self._bulk_slots.acquire()
+            self._slots.acquire()
+            future = self._submit(fn, item)
+            future.add_done_callback(lambda _: self._bulk_slots.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+pool = HashingPool(HASH_WORKERS, HASH_MAX_PENDING)
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(pool.submit(pwd_context.hash, password))
+
+
+def hash_many(passwords: list[str]) -> list[str]:
+    return pool.map(pwd_context.hash, passwords)
+
+
+async def verify_password_async(
+    password: str, hashed: str
+) -> tuple[bool, str | None]:
+    """Devolver ``(es_válida, hash_nuevo)``; ``hash_nuevo`` si cambió el coste."""
+    return await asyncio.wrap_future(
+        pool.submit(pwd_context.verify_and_update, password, hashed)
+    )
@@ -1,17 +1,43 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
 from typing import Optional
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from app.auth import create_access_token
+from app.cache import TTLCache
+from app import hashing
+from app.csv_stream import batched, iter_csv_rows
 from app.models.user_db import UserDB, UserType
-from app.db import get_session, create_db_and_tables
+from app.verify import ClaimsDep
+from app.filters import UserFilterParams, UserSearchParams
+from app.pagination import apply_cursor, set_next_cursor
+from app.responses import json_response
+from app.db import (
+    DB_ASYNC,
+    get_async_session,
+    get_pool_stats,
+    get_session,
+    create_db_and_tables,
+    engine,
+    async_engine,
+)
+from app import metrics
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Annotated, List
+from collections import Counter
+import json
+import orjson
+import os
+import tempfile
 
 
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
 app = FastAPI(root_path="/api/auth")
 
@@ -23,17 +49,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Antes de las rutas, para que /metrics no quede tapada por rutas como /{id}
+metrics.instrument(app, engine, async_engine)
+
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
 
 
-SECRET_KEY = "your-secret-key"
-ALGORITHM = "HS256"
+@app.on_event("shutdown")
+def on_shutdown():
+    hashing.pool.shutdown()
+
+
+@app.get("/db/pool")
+def get_db_pool():
+    return get_pool_stats()
+
+
+@app.get("/hashing/stats")
+def get_hashing_stats():
+    return hashing.pool.stats()
+
+
+# Caché del JSON de /me por id de usuario; USER_CACHE_MAX_ENTRIES=0 la desactiva.
+# Cualquier UPDATE o DELETE de un UserDB hecho con el ORM en esta réplica
+# invalida su entrada al confirmarse la transacción; en las demás réplicas el
+# cambio se ve como mucho USER_CACHE_TTL_SECONDS después.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+user_cache = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+
+CHANGED_USERS_KEY = "changed_user_ids"
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
+@event.listens_for(UserDB, "after_update")
+@event.listens_for(UserDB, "after_delete")
+def _track_changed_user(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(CHANGED_USERS_KEY, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    # Tras el commit, para que una lectura posterior vea ya el valor nuevo. Un
+    # /me que leyó el valor anterior antes del commit no lo guarda: la
+    # invalidación cambia la generación que tomó antes de leer
+    for user_id in session.info.pop(CHANGED_USERS_KEY, ()):
+        user_cache.discard(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop(CHANGED_USERS_KEY, None)
+
+# Filas por lote en la importación masiva (una consulta de duplicados y un
+# INSERT por lote)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Tamaño máximo del cuerpo JSON de la importación (el array se parsea entero;
+# los ficheros grandes deben enviarse como CSV, que se lee por trozos)
+IMPORT_MAX_JSON_BYTES = int(os.getenv("IMPORT_MAX_JSON_BYTES", str(10 * 1024 * 1024)))
+# Filas por viaje al cursor de servidor en la exportación
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return user_cache.stats()
 
 
 class Token(BaseModel):
@@ -48,6 +132,11 @@ class UserOut(BaseModel):
     type: UserType
 
 
+def issue_token(user_db: UserDB) -> dict:
+    access_token = create_access_token(user_db.id, user_db.email, user_db.type.value)
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
 class LoginRequest(BaseModel):
     email: str
     password: str
@@ -60,64 +149,289 @@ class UserCreate(BaseModel):
     type: UserType
 
 
+def find_user(session: Session, email: str) -> UserDB | None:
+    return session.exec(select(UserDB).where(UserDB.email == email)).first()
+
+
+def save_user(session: Session, user_db: UserDB) -> UserDB:
+    session.add(user_db)
+    session.commit()
+    session.refresh(user_db)
+    return user_db
+
+
+# register y login son async aunque usen la sesión síncrona: las consultas van
+# al threadpool y el hash se espera en el bucle de eventos, sin retener un hilo
+# del threadpool mientras bcrypt trabaja o espera plaza en el pool de hashing.
 @app.post("/register", response_model=UserOut)
-def register(user: UserCreate, session: Session = Depends(get_session)):
-    statement = select(UserDB).where(UserDB.email == user.email)
-    existing_user = session.exec(statement).first()
-    if existing_user:
+async def register(user: UserCreate, session: SessionDep):
+    if await run_in_threadpool(find_user, session, user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await hashing.hash_password_async(user.password)
     user_db = UserDB(
         email=user.email, name=user.name, password=hashed_password, type=user.type
     )
-    session.add(user_db)
-    session.commit()
-    session.refresh(user_db)
+    user_db = await run_in_threadpool(save_user, session, user_db)
     return UserOut(
         id=user_db.id, email=user_db.email, name=user_db.name, type=user_db.type
     )
 
 
-@app.post("/login", response_model=Token)
-def login(data: LoginRequest, session: Session = Depends(get_session)):
+async def login(data: LoginRequest, session: SessionDep):
+    user_db = await run_in_threadpool(find_user, session, data.email)
+    if not user_db:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    valid, new_hash = await hashing.verify_password_async(
+        data.password, user_db.password
+    )
+    if not valid:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    if new_hash:
+        # BCRYPT_ROUNDS cambió: guardar el hash con el coste actual
+        user_db.password = new_hash
+        await run_in_threadpool(save_user, session, user_db)
+    return issue_token(user_db)
+
+
+async def login_async(data: LoginRequest, session: AsyncSessionDep):
     statement = select(UserDB).where(UserDB.email == data.email)
-    user_db = session.exec(statement).first()
+    user_db = (await session.exec(statement)).first()
     if not user_db:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    if not pwd_context.verify(data.password, user_db.password):
+    valid, new_hash = await hashing.verify_password_async(
+        data.password, user_db.password
+    )
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    token_data = {"sub": user_db.email, "type": user_db.type}
-    access_token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
-    return {"access_token": access_token, "token_type": "bearer"}
+    if new_hash:
+        user_db.password = new_hash
+        session.add(user_db)
+        await session.commit()
+    return issue_token(user_db)
 
 
-@app.get("/me", response_model=UserOut)
-def read_users_me(
-    token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)
-):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        statement = select(UserDB).where(UserDB.email == email)
-        user_db = session.exec(statement).first()
-        if user_db is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return UserOut(
-            id=user_db.id, email=user_db.email, name=user_db.name, type=user_db.type
+app.post("/login", response_model=Token)(login_async if DB_ASYNC else login)
+
+
+def cache_user_out(user_db: UserDB, generation: int) -> Response:
+    """Serializar el ``UserOut`` de ``/me`` y guardar el JSON en la caché.
+
+    Los aciertos de la caché devuelven esos bytes sin volver a serializar.
+    ``generation`` es la de la caché antes de leer el usuario: si entretanto
+    se invalidó alguna entrada, el JSON se devuelve sin guardarlo.
+    """
+    response = json_response(
+        {
+            "id": user_db.id,
+            "email": user_db.email,
+            "name": user_db.name,
+            "type": user_db.type,
+        }
+    )
+    user_cache.set(user_db.id, response.body, generation)
+    return response
+
+
+def read_users_me(claims: ClaimsDep, session: Session = Depends(get_session)):
+    entry = user_cache.get_entry(claims.uid)
+    if entry is not None:
+        return Response(entry[0], media_type="application/json")
+    generation = user_cache.generation
+    user_db = session.get(UserDB, claims.uid)
+    if user_db is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return cache_user_out(user_db, generation)
+
+
+async def read_users_me_async(claims: ClaimsDep, session: AsyncSessionDep):
+    entry = user_cache.get_entry(claims.uid)
+    if entry is not None:
+        return Response(entry[0], media_type="application/json")
+    generation = user_cache.generation
+    user_db = await session.get(UserDB, claims.uid)
+    if user_db is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return cache_user_out(user_db, generation)
+
+
+app.get("/me", response_model=UserOut)(
+    read_users_me_async if DB_ASYNC else read_users_me
+)
+
+
+def users_query(filters: UserSearchParams):
+    query = select(UserDB.id, UserDB.email, UserDB.name, UserDB.type)
+    if filters.type:
+        query = query.where(UserDB.type == filters.type)
+    if filters.email_prefix:
+        query = query.where(
+            UserDB.email.startswith(filters.email_prefix, autoescape=True)
         )
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    if filters.name:
+        query = query.where(UserDB.name.icontains(filters.name, autoescape=True))
+    return query
 
 
 @app.get("/users", response_model=list[UserOut])
-def get_users(session: Session = Depends(get_session)):
-    users_db = session.exec(select(UserDB)).all()
-    users = [
-        UserOut(id=u.id, email=u.email, name=u.name, type=u.type) for u in users_db
-    ]
-    return users
+def get_users(
+    response: Response,
+    filters: Annotated[UserFilterParams, Depends()],
+    session: Session = Depends(get_session),
+):
+    query = apply_cursor(users_query(filters), filters.cursor, UserDB.id)
+    users_db = session.exec(query.limit(filters.limit)).all()
+    set_next_cursor(response, users_db, filters.limit, UserDB.id)
+    # Las filas ya tienen los campos de UserOut: se serializan directamente
+    return json_response([user._asdict() for user in users_db], response)
+
+
+@app.get("/users/export")
+def export_users(
+    filters: Annotated[UserSearchParams, Depends()],
+    session: Session = Depends(get_session),
+):
+    """Todos los usuarios que cumplen los filtros, como NDJSON.
+
+    Las filas se leen con un cursor de servidor (``yield_per``) y se envían a
+    medida que llegan, así que la memoria no crece con el número de usuarios.
+    """
+    query = users_query(filters).order_by(UserDB.id)
+    rows = session.exec(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+    def iter_users():
+        for user in rows:
+            yield orjson.dumps(user._asdict()) + b"\n"
+
+    return StreamingResponse(iter_users(), media_type="application/x-ndjson")
+
+
+def import_users_batch(
+    session: Session, rows: list[tuple[int, dict]], retry: bool = True
+) -> list[dict]:
+    """Importar un lote de filas ``(número, datos)`` y devolver su resultado."""
+    results = []
+    nuevos: dict[str, tuple[int, UserCreate]] = {}
+    for row, data in rows:
+        try:
+            user = UserCreate.model_validate(data)
+        except ValidationError as e:
+            detail = "; ".join(
+                ".".join(str(loc) for loc in error["loc"]) + ": " + error["msg"]
+                if error["loc"]
+                else error["msg"]
+                for error in e.errors()
+            )
+            results.append({"row": row, "status": "invalid", "detail": detail})
+            continue
+        if user.email in nuevos:
+            results.append({"row": row, "email": user.email, "status": "duplicate"})
+        else:
+            nuevos[user.email] = (row, user)
+
+    existentes = set(
+        session.exec(select(UserDB.email).where(UserDB.email.in_(nuevos))).all()
+    )
+    for email in existentes:
+        row, _ = nuevos.pop(email)
+        results.append({"row": row, "email": email, "status": "duplicate"})
+
+    if nuevos:
+        hashes = hashing.hash_many([user.password for _, user in nuevos.values()])
+        values = [
+            {
+                "email": user.email,
+                "name": user.name,
+                "password": hashed,
+                "type": user.type,
+            }
+            for (_, user), hashed in zip(nuevos.values(), hashes)
+        ]
+        try:
+            ids = dict(
+                session.execute(
+                    insert(UserDB).returning(UserDB.email, UserDB.id), values
+                ).all()
+            )
+            session.commit()
+        except IntegrityError:
+            # Un registro concurrente insertó alguno de los emails del lote
+            session.rollback()
+            if retry:
+                return import_users_batch(session, rows, retry=False)
+            raise
+        for email, (row, _) in nuevos.items():
+            results.append(
+                {"row": row, "email": email, "status": "created", "id": ids[email]}
+            )
+
+    return sorted(results, key=lambda result: result["row"])
+
+
+async def read_limited_body(request: Request, limit: int) -> bytes:
+    """Leer el cuerpo por trozos, con 413 en cuanto supera ``limit`` bytes."""
+    too_large = HTTPException(
+        status_code=413, detail=f"Body larger than {limit} bytes; use CSV"
+    )
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise too_large
+    return bytes(body)
+
+
+@app.post("/users/import")
+async def import_users(request: Request, session: Session = Depends(get_session)):
+    """Alta masiva de usuarios desde un array JSON o un CSV.
+
+    El CSV (``Content-Type: text/csv``) lleva cabecera
+    ``email,name,password,type`` y se procesa por lotes a medida que llega.
+    La respuesta es NDJSON: una línea por fila con su resultado (``created``,
+    ``duplicate`` o ``invalid``) y una última línea con el resumen. El
+    informe se va escribiendo en un fichero temporal (en memoria hasta 1 MB)
+    para no acumularlo entero en memoria. El array JSON se parsea entero, así
+    que su tamaño se limita a ``IMPORT_MAX_JSON_BYTES`` (413 si lo supera).
+    """
+    if "csv" in request.headers.get("content-type", ""):
+        rows = iter_csv_rows(request.stream())
+    else:
+        body = await read_limited_body(request, IMPORT_MAX_JSON_BYTES)
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=422, detail="Invalid JSON body")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array")
+
+        async def iter_json_rows():
+            for row in data:
+                yield row
+
+        rows = iter_json_rows()
+
+    report = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode="w+")
+    totals = Counter()
+    row_number = 0
+    async for batch in batched(rows, IMPORT_BATCH_SIZE):
+        numbered = list(enumerate(batch, start=row_number + 1))
+        row_number += len(batch)
+        # Consultas y bcrypt bloquean: fuera del bucle de eventos
+        results = await run_in_threadpool(import_users_batch, session, numbered)
+        for result in results:
+            totals[result["status"]] += 1
+            report.write(json.dumps(result) + "\n")
+    report.write(json.dumps({"summary": {"rows": row_number, **totals}}) + "\n")
+    report.seek(0)
+
+    def iter_report():
+        with report:
+            yield from report
+
+    return StreamingResponse(iter_report(), media_type="application/x-ndjson")
+
 
 @app.delete("/users/{user_id}", status_code=204)
 def delete_user(user_id: int, session: Session = Depends(get_session)):
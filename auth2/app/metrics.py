@@ -0,0 +1,220 @@
+"""Métricas de Prometheus comunes a los servicios.
+
+``instrument(app, *engines)`` monta ``GET /metrics`` (formato de texto de
+Prometheus) y mide:
+
+- ``http_request_duration_seconds{method,route,status}``: latencia por ruta,
+  etiquetada con la plantilla (``/{reserva_id}``) y no con la URL.
+- ``http_requests_in_progress{method}``: peticiones en curso.
+- ``db_query_duration_seconds``: cada consulta, con los eventos
+  ``before_cursor_execute``/``after_cursor_execute`` de los engines.
+- ``db_queries_per_request{method,route}`` y
+  ``db_time_per_request_seconds{method,route}``: consultas y tiempo en la base
+  de datos de cada petición. Se acumulan en una ``ContextVar``, que también
+  ven los handlers síncronos (el threadpool copia el contexto) y los engines
+  asíncronos.
+
+Las peticiones que tardan ``SLOW_REQUEST_SECONDS`` o más (1 s por defecto;
+0 lo desactiva) se registran en el logger ``app.metrics`` con su ruta y su
+tiempo en la base de datos.
+
+Las llamadas salientes se miden envolviendo el transporte del cliente httpx
+con ``InstrumentedTransport`` o ``AsyncInstrumentedTransport``:
+``http_client_request_duration_seconds{host,method,status}`` cubre hasta
+recibir las cabeceras de la respuesta.
+
+Cada proceso expone sus propias métricas (uvicorn corre un proceso por pod).
+"""
+
+import logging
+import os
+from contextvars import ContextVar
+from time import perf_counter
+
+import httpx
+from fastapi import FastAPI, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from sqlalchemy import event
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1"))
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Duración de las peticiones HTTP por ruta",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Peticiones HTTP en curso", ["method"]
+)
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Duración de cada consulta a la base de datos",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+QUERY_ERRORS = Counter("db_query_errors_total", "Consultas que han fallado")
+QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "Consultas a la base de datos por petición",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Tiempo en la base de datos por petición",
+    ["method", "route"],
+)
+CLIENT_REQUEST_DURATION = Histogram(
+    "http_client_request_duration_seconds",
+    "Duración de las peticiones HTTP salientes hasta recibir la respuesta",
+    ["host", "method", "status"],
+)
+
+# [consultas, segundos] de la petición en curso
+_request_db: ContextVar[list | None] = ContextVar("request_db", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    elapsed = perf_counter() - conn.info["query_start"].pop()
+    QUERY_DURATION.observe(elapsed)
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def _handle_error(exception_context):
+    QUERY_ERRORS.inc()
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start"):
+        connection.info["query_start"].pop()
+
+
+def instrument_engine(engine):
+    """Medir las consultas de un engine (síncrono o asíncrono)."""
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - start
+            in_progress.dec()
+            _request_db.reset(token)
+            # El router deja en el scope la ruta que atendió la petición
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            REQUEST_DURATION.labels(method, route, status).observe(elapsed)
+            QUERIES_PER_REQUEST.labels(method, route).observe(stats[0])
+            DB_TIME_PER_REQUEST.labels(method, route).observe(stats[1])
+            if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+                logger.warning(
+                    "Petición lenta: %s %s (%s) %d en %.3f s, %d consultas en %.3f s",
+                    method,
+                    scope["path"],
+                    route,
+                    status,
+                    elapsed,
+                    stats[0],
+                    stats[1],
+                )
+
+
+def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app: FastAPI, *engines):
+    """Montar ``GET /metrics`` y medir las peticiones y las consultas.
+
+    Hay que llamarla antes de declarar las rutas, para que ``/metrics`` no
+    quede tapada por rutas como ``/{id}``.
+    """
+    for engine in engines:
+        if engine is not None:
+            instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", get_metrics, include_in_schema=False)
+
+
+def _observe_client(request: httpx.Request, status, start: float):
+    CLIENT_REQUEST_DURATION.labels(request.url.host, request.method, status).observe(
+        perf_counter() - start
+    )
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """Transporte httpx que mide cada petición saliente."""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = perf_counter()
+        status = "error"
+        try:
+            response = self._transport.handle_request(request)
+            status = response.status_code
+            return response
+        finally:
+            _observe_client(request, status, start)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncInstrumentedTransport(httpx.AsyncBaseTransport):
+    """Versión asíncrona de ``InstrumentedTransport``."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = perf_counter()
+        status = "error"
+        try:
+            response = await self._transport.handle_async_request(request)
+            status = response.status_code
+            return response
+        finally:
+            _observe_client(request, status, start)
+
+    async def aclose(self):
+        await self._transport.aclose()
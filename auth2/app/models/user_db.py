@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from enum import Enum
 from typing import Optional
@@ -8,6 +9,17 @@ class UserType(str, Enum):
     ESTUDIANTE = "ESTUDIANTE"
 
 class UserDB(SQLModel, table=True):
+    __table_args__ = (
+        # Listado filtrado por tipo con paginación por id
+        Index("ix_userdb_type_id", "type", "id"),
+        # Búsqueda por prefijo de email (LIKE 'abc%') en Postgres
+        Index(
+            "ix_userdb_email_pattern",
+            "email",
+            postgresql_ops={"email": "text_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     email: str = Field(index=True, unique=True)
     name: str
@@ -1,26 +1,432 @@
+import json
+import os
+
+import pytest
 from fastapi.testclient import TestClient
-from app.main import app
-from app.models.user import UserType
+from passlib.context import CryptContext
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app import hashing, main
+from app.auth import create_access_token
+from app.db import get_session
+from app.main import app, user_cache
+from app.models.user_db import UserDB, UserType
+from app.verify import decode_token
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
 
-client = TestClient(app)
+@pytest.fixture(name="client")
+def client_fixture(session: Session):
+    app.dependency_overrides[get_session] = lambda: session
+    user_cache.clear()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
 
-def test_register_and_login():
+
+def test_register_and_login(client: TestClient):
     # Register a new user
-    response = client.post("/register", json={
-        "email": "test@example.com",
-        "name": "Test User",
-        "password": "testpass",
-        "type": UserType.ESTUDIANTE.value
-    })
+    response = client.post(
+        "/register",
+        json={
+            "email": "test@example.com",
+            "name": "Test User",
+            "password": "testpass",
+            "type": UserType.ESTUDIANTE.value,
+        },
+    )
     assert response.status_code == 200
     # Login with the new user
-    response = client.post("/token", data={
-        "username": "test@example.com",
-        "password": "testpass"
-    })
+    response = client.post(
+        "/login", json={"email": "test@example.com", "password": "testpass"}
+    )
     assert response.status_code == 200
     token = response.json()["access_token"]
     # Get current user
     response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 200
     assert response.json()["email"] == "test@example.com"
+
+    wrong = client.post(
+        "/login", json={"email": "test@example.com", "password": "wrong"}
+    )
+    assert wrong.status_code == 400
+
+
+def test_password_operations_over_limit_are_rejected(client, monkeypatch):
+    # Sin plazas libres en el pool de hashing: 503 con Retry-After, sin encolar
+    saturated = hashing.HashingPool(workers=1, max_pending=0)
+    monkeypatch.setattr(hashing, "pool", saturated)
+    try:
+        response = client.post(
+            "/login", json={"email": "nobody@example.com", "password": "x"}
+        )
+        # El usuario no existe: no se llega a hashear
+        assert response.status_code == 400
+
+        response = client.post(
+            "/register",
+            json={
+                "email": "busy@example.com",
+                "name": "Busy",
+                "password": "testpass",
+                "type": UserType.ESTUDIANTE.value,
+            },
+        )
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(
+            hashing.HASH_RETRY_AFTER_SECONDS
+        )
+        assert saturated.stats()["rejected"] == 1
+    finally:
+        saturated.shutdown()
+
+
+def test_login_rehashes_password_with_current_cost(client, session, monkeypatch):
+    cheap = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    session.add(
+        UserDB(
+            email="old@example.com",
+            name="Old",
+            password=cheap.hash("testpass"),
+            type=UserType.ESTUDIANTE,
+        )
+    )
+    session.commit()
+
+    response = client.post(
+        "/login", json={"email": "old@example.com", "password": "testpass"}
+    )
+    assert response.status_code == 200
+
+    user_db = session.exec(
+        select(UserDB).where(UserDB.email == "old@example.com")
+    ).one()
+    session.refresh(user_db)
+    assert user_db.password.startswith(f"$2b${hashing.BCRYPT_ROUNDS:02d}$")
+    assert hashing.pwd_context.verify("testpass", user_db.password)
+    # Un login con contraseña incorrecta no toca el hash
+    rehashed = user_db.password
+    response = client.post(
+        "/login", json={"email": "old@example.com", "password": "wrong"}
+    )
+    assert response.status_code == 400
+    session.refresh(user_db)
+    assert user_db.password == rehashed
+
+
+def read_ndjson(response) -> list[dict]:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_import_users_reports_each_row(client, session):
+    client.post(
+        "/register",
+        json={
+            "email": "existing@example.com",
+            "name": "Existing",
+            "password": "testpass",
+            "type": UserType.ESTUDIANTE.value,
+        },
+    )
+    student = UserType.ESTUDIANTE.value
+    rows = [
+        {"email": "a@example.com", "name": "A", "password": "pa", "type": student},
+        {"email": "b@example.com", "name": "B", "password": "pb", "type": student},
+        {"email": "a@example.com", "name": "A2", "password": "pa", "type": student},
+        {
+            "email": "existing@example.com",
+            "name": "E",
+            "password": "pe",
+            "type": student,
+        },
+        {"email": "c@example.com", "name": "C", "type": student},
+    ]
+
+    response = client.post("/users/import", json=rows)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    *results, summary = read_ndjson(response)
+    assert [(r["row"], r["status"]) for r in results] == [
+        (1, "created"),
+        (2, "created"),
+        (3, "duplicate"),
+        (4, "duplicate"),
+        (5, "invalid"),
+    ]
+    assert results[2]["email"] == "a@example.com"
+    assert results[3]["email"] == "existing@example.com"
+    assert "password" in results[4]["detail"]
+    assert summary == {
+        "summary": {"rows": 5, "created": 2, "duplicate": 2, "invalid": 1}
+    }
+
+    created = {r["email"]: r["id"] for r in results if r["status"] == "created"}
+    users = session.exec(select(UserDB).where(UserDB.id.in_(created.values())))
+    assert {user.email: user.id for user in users} == created
+    # Las contraseñas importadas se guardan hasheadas y permiten el login
+    response = client.post("/login", json={"email": "a@example.com", "password": "pa"})
+    assert response.status_code == 200
+
+
+def test_import_users_from_csv(client):
+    body = (
+        "email,name,password,type\n"
+        f"csv@example.com,Csv,secret,{UserType.ESTUDIANTE.value}\n"
+        "bad@example.com,Bad,secret,not-a-type\n"
+    )
+    response = client.post(
+        "/users/import", content=body, headers={"Content-Type": "text/csv"}
+    )
+    *results, summary = read_ndjson(response)
+    assert [r["status"] for r in results] == ["created", "invalid"]
+    assert summary == {"summary": {"rows": 2, "created": 1, "invalid": 1}}
+
+
+def test_import_users_rejects_oversized_or_invalid_json(client, monkeypatch):
+    monkeypatch.setattr(main, "IMPORT_MAX_JSON_BYTES", 64)
+    rows = [{"email": f"u{i}@example.com", "name": "U"} for i in range(5)]
+    response = client.post("/users/import", json=rows)
+    assert response.status_code == 413
+
+    response = client.post("/users/import", json={"email": "x@example.com"})
+    assert response.status_code == 422
+    response = client.post(
+        "/users/import", content=b"[{", headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 422
+
+
+@pytest.fixture(name="users")
+def users_fixture(session: Session) -> list[UserDB]:
+    users = [
+        UserDB(
+            email=f"{prefix}{i}@example.com",
+            name=name,
+            password="x",
+            type=user_type,
+        )
+        for i in range(5)
+        for prefix, name, user_type in (
+            ("ana", f"Ana García {i}", UserType.ESTUDIANTE),
+            ("luis", f"Luis Pérez {i}", UserType.PROFESOR),
+            ("a_b", f"Ana_B {i}", UserType.ESTUDIANTE),
+        )
+    ]
+    session.add_all(users)
+    session.commit()
+    return sorted(users, key=lambda user: user.id)
+
+
+def user_out(user: UserDB) -> dict:
+    return {"id": user.id, "email": user.email, "name": user.name, "type": user.type}
+
+
+def test_list_users_paginates_with_cursor(client, users):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 4, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/users", params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [4, 4, 4, 3]
+    assert [user for page in pages for user in page] == [
+        user_out(user) for user in users
+    ]
+
+    # Una página completa que resulta ser la última deja una página vacía
+    response = client.get("/users", params={"limit": 15})
+    assert len(response.json()) == 15
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/users", params={"limit": 15, "cursor": cursor})
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_list_users_filters(client, users):
+    def emails(**params):
+        response = client.get("/users", params=params)
+        assert response.status_code == 200
+        return [user["email"] for user in response.json()]
+
+    profesores = [u.email for u in users if u.type == UserType.PROFESOR]
+    assert emails(type="PROFESOR") == profesores
+    assert emails(email_prefix="ana") == [
+        u.email for u in users if u.email.startswith("ana")
+    ]
+    # "_" se busca literalmente, no como comodín de LIKE
+    assert emails(email_prefix="a_") == [
+        u.email for u in users if u.email.startswith("a_")
+    ]
+    assert emails(name="garcía 3") == ["ana3@example.com"]
+    assert emails(type="ESTUDIANTE", name="ana", email_prefix="a_b") == [
+        u.email for u in users if u.email.startswith("a_b")
+    ]
+    assert emails(type="PROFESOR", name="Ana") == []
+
+    # El cursor respeta los filtros
+    response = client.get("/users", params={"type": "PROFESOR", "limit": 3})
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        "/users", params={"type": "PROFESOR", "limit": 3, "cursor": cursor}
+    )
+    assert [u["email"] for u in response.json()] == profesores[3:]
+
+
+@pytest.mark.parametrize(
+    "cursor", ["not-base64!", "bm90LWpzb24", "WzEsIDJd", "WyJhYmMiXQ"]
+)
+def test_list_users_rejects_invalid_cursor(client, users, cursor):
+    # Basura, JSON inválido, [1, 2] (longitud incorrecta) y ["abc"] (no entero)
+    response = client.get("/users", params={"cursor": cursor})
+    assert response.status_code == 422
+
+
+def test_export_users_streams_filtered_ndjson(client, users, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_BATCH_SIZE", 2)
+    response = client.get("/users/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert read_ndjson(response) == [user_out(user) for user in users]
+
+    response = client.get(
+        "/users/export", params={"type": "ESTUDIANTE", "email_prefix": "ana"}
+    )
+    assert read_ndjson(response) == [
+        user_out(user) for user in users if user.email.startswith("ana")
+    ]
+
+
+def login_token(client: TestClient, email: str, password: str = "testpass") -> str:
+    response = client.post("/login", json={"email": email, "password": password})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+
+def test_me_reads_token_claims(client, users):
+    user = users[1]
+    token = create_access_token(user.id, user.email, user.type.value)
+    claims = decode_token(token)
+    assert (claims.uid, claims.sub, claims.type) == (
+        user.id,
+        user.email,
+        user.type.value,
+    )
+    response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == user_out(user)
+
+    # /me busca por el uid del token, no por el email
+    other = users[2]
+    token = create_access_token(other.id, user.email, user.type.value)
+    response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["email"] == other.email
+
+    response = client.get("/me", headers={"Authorization": "Bearer not-a-jwt"})
+    assert response.status_code == 401
+
+
+def test_cached_me_reflects_updates_and_deletes(client, session):
+    client.post(
+        "/register",
+        json={
+            "email": "me@example.com",
+            "name": "Before",
+            "password": "testpass",
+            "type": UserType.ESTUDIANTE.value,
+        },
+    )
+    token = login_token(client, "me@example.com")
+    headers = {"Authorization": f"Bearer {token}"}
+    uid = decode_token(token).uid
+
+    assert client.get("/me", headers=headers).json()["name"] == "Before"
+    hits = user_cache.hits
+    assert client.get("/me", headers=headers).json()["name"] == "Before"
+    assert user_cache.hits == hits + 1
+
+    user_db = session.get(UserDB, uid)
+    user_db.name = "After"
+    session.add(user_db)
+    session.commit()
+    assert client.get("/me", headers=headers).json()["name"] == "After"
+
+    # Un cambio que se deshace no invalida la entrada
+    user_db.name = "Rolled back"
+    session.flush()
+    session.rollback()
+    hits = user_cache.hits
+    assert client.get("/me", headers=headers).json()["name"] == "After"
+    assert user_cache.hits == hits + 1
+
+    assert client.delete(f"/users/{uid}").status_code == 204
+    response = client.get("/me", headers=headers)
+    assert response.status_code == 401
+
+
+def test_me_does_not_cache_a_row_read_before_a_concurrent_commit(
+    client, session, monkeypatch
+):
+    client.post(
+        "/register",
+        json={
+            "email": "race@example.com",
+            "name": "Before",
+            "password": "testpass",
+            "type": UserType.ESTUDIANTE.value,
+        },
+    )
+    token = login_token(client, "race@example.com")
+    headers = {"Authorization": f"Bearer {token}"}
+    uid = decode_token(token).uid
+    cache_user_out = main.cache_user_out
+
+    def commit_between_read_and_cache(user_db, generation):
+        # Otra petición confirma un cambio después de que /me leyera la fila
+        with Session(session.get_bind()) as other:
+            other_user = other.get(UserDB, uid)
+            other_user.name = "After"
+            other.add(other_user)
+            other.commit()
+        return cache_user_out(user_db, generation)
+
+    monkeypatch.setattr(main, "cache_user_out", commit_between_read_and_cache)
+    assert client.get("/me", headers=headers).json()["name"] == "Before"
+    monkeypatch.setattr(main, "cache_user_out", cache_user_out)
+
+    # El valor leído antes del commit no quedó en la caché
+    session.expire_all()
+    assert client.get("/me", headers=headers).json()["name"] == "After"
+
+
+@pytest.mark.parametrize(
+    "files, expected",
+    [
+        ({"cpu.max": "50000 100000\n"}, 1),
+        ({"cpu.max": "250000 100000\n"}, 3),
+        ({"cpu.max": "max 100000\n"}, None),
+        ({"cpu/cpu.cfs_quota_us": "150000", "cpu/cpu.cfs_period_us": "100000"}, 2),
+        ({"cpu/cpu.cfs_quota_us": "-1", "cpu/cpu.cfs_period_us": "100000"}, None),
+        ({}, None),
+    ],
+)
+def test_hash_workers_follow_cgroup_cpu_quota(tmp_path, files, expected):
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    cpus = len(os.sched_getaffinity(0))
+    # La cuota acota los núcleos visibles; sin cuota se usan todos
+    assert hashing.available_cpus(str(tmp_path)) == min(cpus, expected or cpus)
@@ -0,0 +1,66 @@
+"""Verificación local de los tokens JWT emitidos por el servicio de auth.
+
+Este módulo es idéntico en los tres servicios. Comprueba la firma y la
+expiración del token con la clave compartida, sin consultar la base de datos
+de usuarios, y expone los claims como dependencia de FastAPI (``ClaimsDep``).
+
+La clave con que se firma se elige por ``kid``: ``JWT_SECRET`` es la clave
+actual (identificada por ``JWT_KEY_ID``) y ``JWT_PREVIOUS_KEYS`` admite
+claves anteriores como ``kid1:secreto1,kid2:secreto2``, de modo que los
+tokens ya emitidos siguen siendo válidos durante una rotación.
+"""
+
+import os
+from typing import Annotated
+
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from pydantic import BaseModel, ValidationError
+
+JWT_ALGORITHM = "HS256"
+JWT_KEY_ID = os.getenv("JWT_KEY_ID", "default")
+JWT_KEYS = {
+    kid: secret
+    for kid, _, secret in (
+        entry.partition(":")
+        for entry in os.getenv("JWT_PREVIOUS_KEYS", "").split(",")
+        if entry
+    )
+}
+JWT_KEYS[JWT_KEY_ID] = os.getenv("JWT_SECRET", "your-secret-key")
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+
+
+class TokenClaims(BaseModel):
+    sub: str
+    uid: int
+    type: str
+    exp: int
+
+
+def decode_token(token: str) -> TokenClaims:
+    """Validar firma y expiración del token y devolver sus claims."""
+    credentials_error = HTTPException(
+        status_code=401,
+        detail="Invalid token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        key = JWT_KEYS.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise credentials_error
+        payload = jwt.decode(
+            token, key, algorithms=[JWT_ALGORITHM], options={"require_exp": True}
+        )
+        return TokenClaims.model_validate(payload)
+    except (JWTError, ValidationError):
+        raise credentials_error
+
+
+def get_token_claims(token: str = Depends(oauth2_scheme)) -> TokenClaims:
+    return decode_token(token)
+
+
+ClaimsDep = Annotated[TokenClaims, Depends(get_token_claims)]
@@ -0,0 +1,153 @@
+"""Comparar el rendimiento del modo síncrono y el modo asíncrono (DB_ASYNC).
+
+Levanta el servicio de laboratorios con uvicorn en cada modo sobre una base
+SQLite temporal, la puebla con datos sintéticos y lanza carga concurrente
+contra una ruta de lectura con 50, 200 y 1000 conexiones simultáneas.
+
+Uso (desde la raíz del repositorio)::
+
+    python benchmarks/async_vs_sync.py
+    python benchmarks/async_vs_sync.py --concurrency 50 200 --duration 5 \\
+        --path "/equipos/1"
+
+Imprime un JSON con peticiones por segundo y latencias p50/p99 por modo y
+nivel de concurrencia.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent / "laboratorios2"
+
+
+def start_server(database_url: str, async_mode: bool, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "DB_ASYNC": "true" if async_mode else "false",
+        # Sin caché para medir el acceso a la base de datos
+        "CACHE_MAX_ENTRIES": "0",
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=SERVICE_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/cache/stats", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("El servicio no arrancó a tiempo")
+
+
+def seed(base_url: str, laboratorios: int, equipos: int):
+    with httpx.Client(base_url=base_url) as client:
+        for i in range(laboratorios):
+            laboratorio = client.post(
+                "/", json={"nombre": f"Lab {i}", "descripcion": "Sintético"}
+            ).json()
+            for j in range(equipos):
+                client.post(
+                    "/equipos/",
+                    json={
+                        "nombre": f"Equipo {i}-{j}",
+                        "modelo": "M",
+                        "id_laboratorio": laboratorio["id"],
+                    },
+                )
+
+
+async def run_load(base_url: str, path: str, concurrency: int, duration: float):
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    r = await client.get(path)
+                    if r.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--laboratorios", type=int, default=10)
+    parser.add_argument("--equipos", type=int, default=20)
+    parser.add_argument(
+        "--path",
+        default="/equipos/batch?ids=" + ",".join(str(i) for i in range(1, 51)),
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = {}
+    for async_mode in (False, True):
+        mode = "async" if async_mode else "sync"
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f"sqlite:///{tmp}/laboratorios.db"
+            process = start_server(database_url, async_mode, args.port)
+            try:
+                base_url = f"http://127.0.0.1:{args.port}"
+                seed(base_url, args.laboratorios, args.equipos)
+                results[mode] = [
+                    asyncio.run(run_load(base_url, args.path, c, args.duration))
+                    for c in args.concurrency
+                ]
+            finally:
+                process.terminate()
+                process.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
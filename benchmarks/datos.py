@@ -0,0 +1,140 @@
+"""Generador de datos sintéticos reproducibles para los benchmarks.
+
+Con la misma semilla y los mismos tamaños se generan siempre los mismos
+laboratorios, equipos, horarios de clase, reservas y usuarios, así que los
+resultados de distintas versiones se pueden comparar. Los datos son
+coherentes con las reglas de los servicios:
+
+- las sesiones de clase ocupan franjas de 2 h entre las 8:00 y las 14:00, de
+  lunes a viernes, sin solaparse en un mismo laboratorio;
+- las reservas ocupan franjas de 1 h entre las 14:00 y las 20:00, de lunes a
+  sábado, durante ``SEMANAS`` semanas desde ``INICIO``, así que no chocan con
+  las clases ni entre sí;
+- los equipos tienen ids ``1..equipos`` en el orden generado, los mismos que
+  devuelve ``laboratorios_stub.py`` y los que asigna el servicio de
+  laboratorios a una base vacía.
+"""
+
+import random
+from datetime import datetime, time, timedelta
+
+INICIO = datetime(2025, 3, 3)  # lunes
+SEMANAS = 16
+PASSWORD = "benchmark"
+
+TIPOS = [
+    "Osciloscopio",
+    "Multímetro",
+    "Fuente de alimentación",
+    "Generador de señales",
+    "Microscopio",
+    "Computador",
+    "Router",
+    "Impresora 3D",
+]
+MARCAS = ["Tektronix", "Fluke", "Rigol", "Keysight", "Olympus", "Dell", "Cisco"]
+MATERIAS = ["Redes", "Física", "Química", "Electrónica", "Biología", "Robótica"]
+DIAS_CLASE = ["lunes", "martes", "miercoles", "jueves", "viernes"]
+HORAS_CLASE = [8, 10, 12]
+HORAS_RESERVA = range(14, 20)
+
+
+def _rng(semilla: int, nombre: str) -> random.Random:
+    # Un generador por tipo de dato: cambiar un tamaño no altera los demás
+    return random.Random(f"{semilla}-{nombre}")
+
+
+def laboratorios(n: int) -> list[dict]:
+    return [
+        {"nombre": f"Laboratorio {i}", "descripcion": "Sintético"}
+        for i in range(1, n + 1)
+    ]
+
+
+def equipos(semilla: int, laboratorios: int, n: int) -> list[dict]:
+    rng = _rng(semilla, "equipos")
+    return [
+        {
+            "id": i,
+            "nombre": f"{rng.choice(TIPOS)} {i}",
+            "modelo": f"{rng.choice(MARCAS)} {rng.randint(100, 999)}",
+            "estado": "Operativo",
+            "id_laboratorio": rng.randint(1, laboratorios),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def horarios(semilla: int, laboratorios: int, n: int) -> list[dict]:
+    """``n`` horarios de una o dos sesiones en franjas libres."""
+    rng = _rng(semilla, "horarios")
+    franjas = [
+        (lab, dia, hora)
+        for lab in range(1, laboratorios + 1)
+        for dia in DIAS_CLASE
+        for hora in HORAS_CLASE
+    ]
+    rng.shuffle(franjas)
+    resultado = []
+    for i in range(1, n + 1):
+        sesiones = []
+        for _ in range(rng.randint(1, 2)):
+            if not franjas:
+                break
+            lab, dia, hora = franjas.pop()
+            sesiones.append(
+                {
+                    "dia_semana": dia,
+                    "hora_inicio": time(hora).isoformat(),
+                    "hora_fin": time(hora + 2).isoformat(),
+                    "id_ubicacion": lab,
+                }
+            )
+        resultado.append(
+            {
+                "nombre_materia": f"{rng.choice(MATERIAS)} {i}",
+                "id_usuario": rng.randint(1, 50),
+                "sesiones": sesiones,
+            }
+        )
+    return resultado
+
+
+def reservas(semilla: int, laboratorios: int, equipos: int, n: int) -> list[dict]:
+    """``n`` reservas en franjas distintas; el 70 % completadas."""
+    rng = _rng(semilla, "reservas")
+    franjas = laboratorios * SEMANAS * 6 * len(HORAS_RESERVA)
+    if n > franjas:
+        raise ValueError(f"Como mucho {franjas} reservas con {laboratorios} labs")
+    por_reserva = min(3, equipos)
+    resultado = []
+    for franja in rng.sample(range(franjas), n):
+        franja, hora = divmod(franja, len(HORAS_RESERVA))
+        franja, dia = divmod(franja, 6 * SEMANAS)
+        inicio = INICIO + timedelta(days=dia + dia // 6, hours=HORAS_RESERVA[hora])
+        resultado.append(
+            {
+                "fecha_inicio": inicio.isoformat(),
+                "fecha_fin": (inicio + timedelta(hours=1)).isoformat(),
+                "id_usuario": rng.randint(1, 500),
+                "id_ubicacion": franja + 1,
+                "status": "completed" if rng.random() < 0.7 else "pending",
+                "equipos": rng.sample(
+                    range(1, equipos + 1), rng.randint(0, por_reserva)
+                ),
+            }
+        )
+    return resultado
+
+
+def usuarios(semilla: int, n: int) -> list[dict]:
+    rng = _rng(semilla, "usuarios")
+    return [
+        {
+            "email": f"usuario{i}@benchmark.test",
+            "name": f"Usuario {i}",
+            "password": PASSWORD,
+            "type": rng.choice(["ESTUDIANTE", "PROFESOR"]),
+        }
+        for i in range(1, n + 1)
+    ]
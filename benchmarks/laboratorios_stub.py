@@ -0,0 +1,62 @@
+"""Sustituto local del servicio de laboratorios para medir reservas.
+
+Sirve ``GET /equipos/batch?ids=...`` y ``GET /equipos/{id}`` con los equipos
+de ``datos.equipos`` desde memoria, con una latencia fija opcional, para que
+las medidas de reservas no dependan de un despliegue real de laboratorios.
+Reservas lo usa con ``LABS_URL=http://127.0.0.1:<puerto>/equipos/``.
+
+Uso (lo arranca ``load_test.py``; a mano)::
+
+    python benchmarks/laboratorios_stub.py --port 8771 --latencia-ms 5
+"""
+
+import argparse
+import asyncio
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+
+import datos
+
+
+def crear_app(semilla: int, laboratorios: int, equipos: int, latencia_ms: float):
+    por_id = {
+        equipo["id"]: equipo for equipo in datos.equipos(semilla, laboratorios, equipos)
+    }
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"equipos": len(por_id)}
+
+    @app.get("/equipos/batch")
+    async def get_equipos_batch(ids: str):
+        await asyncio.sleep(latencia_ms / 1000)
+        return [
+            por_id[int(id)] for id in ids.split(",") if id and int(id) in por_id
+        ]
+
+    @app.get("/equipos/{equipo_id}")
+    async def get_equipo(equipo_id: int):
+        await asyncio.sleep(latencia_ms / 1000)
+        if equipo_id not in por_id:
+            raise HTTPException(status_code=404, detail="Equipo no encontrado")
+        return por_id[equipo_id]
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--laboratorios", type=int, default=20)
+    parser.add_argument("--equipos", type=int, default=2000)
+    parser.add_argument("--latencia-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8771)
+    args = parser.parse_args()
+    app = crear_app(args.semilla, args.laboratorios, args.equipos, args.latencia_ms)
+    uvicorn.run(app, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
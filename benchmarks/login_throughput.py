@@ -0,0 +1,162 @@
+"""Medir el rendimiento de ``POST /login`` del servicio de auth.
+
+Levanta el servicio de auth con uvicorn sobre una base SQLite temporal,
+registra usuarios sintéticos y lanza logins concurrentes durante un tiempo
+fijo. Sirve para dimensionar réplicas: el rendimiento de login lo limita
+bcrypt, así que escala con ``--workers`` (``HASH_WORKERS``) hasta el número
+de núcleos y cae a la mitad por cada ronda más de ``--rounds``.
+
+Uso (desde la raíz del repositorio)::
+
+    python benchmarks/login_throughput.py
+    python benchmarks/login_throughput.py --rounds 10 12 --workers 2 \\
+        --concurrency 20 100 --duration 5
+
+Imprime un JSON con logins por segundo, latencias p50/p99 y respuestas 503
+(pool de hash saturado) por coste de bcrypt y nivel de concurrencia.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent / "auth2"
+
+
+def start_server(
+    database_url: str, rounds: int, workers: int | None, port: int
+) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "BCRYPT_ROUNDS": str(rounds),
+    }
+    if workers:
+        env["HASH_WORKERS"] = str(workers)
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=SERVICE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/hashing/stats", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("El servicio no arrancó a tiempo")
+
+
+def seed(base_url: str, users: int) -> list[dict]:
+    credentials = [
+        {"email": f"user{i}@example.com", "password": f"password-{i}"}
+        for i in range(users)
+    ]
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        for i, data in enumerate(credentials):
+            client.post(
+                "/register",
+                json={**data, "name": f"User {i}", "type": "ESTUDIANTE"},
+            )
+    return credentials
+
+
+async def run_load(
+    base_url: str, credentials: list[dict], concurrency: int, duration: float
+):
+    latencies: list[float] = []
+    errors = 0
+    rejected = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+
+        async def worker(n: int):
+            nonlocal errors, rejected
+            i = n
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    r = await client.post(
+                        "/login", json=credentials[i % len(credentials)]
+                    )
+                    if r.status_code == 503:
+                        rejected += 1
+                    elif r.status_code != 200:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+                i += concurrency
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    return {
+        "concurrency": concurrency,
+        "logins": len(latencies),
+        "rejected_503": rejected,
+        "errors": errors,
+        "logins_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 2) if quantiles else None,
+        "p99_ms": round(quantiles[98] * 1000, 2) if quantiles else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    results = {}
+    for rounds in args.rounds:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f"sqlite:///{tmp}/auth.db"
+            process = start_server(database_url, rounds, args.workers, args.port)
+            try:
+                base_url = f"http://127.0.0.1:{args.port}"
+                credentials = seed(base_url, args.users)
+                results[f"rounds={rounds}"] = [
+                    asyncio.run(run_load(base_url, credentials, c, args.duration))
+                    for c in args.concurrency
+                ]
+            finally:
+                process.terminate()
+                process.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
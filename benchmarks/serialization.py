@@ -0,0 +1,215 @@
+"""Medir el coste de serializar la respuesta de cada endpoint, por fila.
+
+Compara, con los mismos datos sintéticos y sin red ni base de datos, los dos
+caminos de serialización:
+
+- ``modelo``: el handler construye los modelos de respuesta
+  (``model_dump()`` + ``Modelo(**datos)``) y FastAPI los valida contra
+  ``response_model`` antes de convertirlos a JSON, como hacían antes los
+  handlers.
+- ``orjson``: el handler construye los diccionarios una vez y los serializa
+  con ``json_response``; en ``/me`` los aciertos de caché devuelven los bytes
+  ya serializados.
+
+Como los servicios de reservas y de auth tienen ambos el paquete ``app``, cada
+uno se mide en un proceso aparte. Uso (desde la raíz del repositorio)::
+
+    python benchmarks/serialization.py
+    python benchmarks/serialization.py --filas 100 --repeticiones 200
+
+Imprime un JSON con microsegundos por fila de cada camino y endpoint.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICIOS = ("reservas", "auth2")
+
+
+def medir(funcion, filas: int, repeticiones: int) -> float:
+    """Microsegundos por fila de la mejor de 5 tandas de ``repeticiones``."""
+    mejor = min(timeit.repeat(funcion, number=repeticiones, repeat=5))
+    return round(mejor / repeticiones / filas * 1e6, 3)
+
+
+def medir_endpoint(filas: int, repeticiones: int, modelo, orjson) -> dict:
+    # Los dos caminos deben producir el mismo JSON
+    assert json.loads(modelo()) == json.loads(orjson())
+    return {
+        "filas": filas,
+        "modelo_us_por_fila": medir(modelo, filas, repeticiones),
+        "orjson_us_por_fila": medir(orjson, filas, repeticiones),
+    }
+
+
+def bench_reservas(filas: int, repeticiones: int) -> dict:
+    from pydantic import TypeAdapter
+
+    from app.main import build_reserva_public, reserva_dict
+    from app.models.reserva import Reserva, ReservaPublic
+    from app.responses import json_response
+
+    inicio = datetime(2025, 3, 3, 8)
+    reservas = [
+        Reserva(
+            id=n,
+            fecha_creacion=inicio - timedelta(days=1, microseconds=n),
+            fecha_inicio=inicio + timedelta(hours=n),
+            fecha_fin=inicio + timedelta(hours=n + 2),
+            id_usuario=n % 7,
+            id_ubicacion=n % 5,
+            status="completed",
+        )
+        for n in range(filas)
+    ]
+    equipos_ids = [1, 2, 3]
+    detalles = {
+        id: {"id": id, "nombre": f"Equipo {id}", "estado": "Operativo"}
+        for id in equipos_ids
+    }
+    lista = TypeAdapter(list[ReservaPublic])
+    una = TypeAdapter(ReservaPublic)
+
+    def modelo_publico(reserva: Reserva, equipos: list) -> ReservaPublic:
+        datos = reserva.model_dump()
+        datos["equipos"] = equipos
+        return ReservaPublic(**datos)
+
+    def validar_y_serializar(adapter, contenido) -> bytes:
+        return adapter.dump_json(adapter.validate_python(contenido))
+
+    equipos = [detalles[id] for id in equipos_ids]
+    return {
+        "GET /": medir_endpoint(
+            filas,
+            repeticiones,
+            lambda: validar_y_serializar(
+                lista, [modelo_publico(r, equipos) for r in reservas]
+            ),
+            lambda: json_response(
+                [build_reserva_public(r, equipos_ids, detalles) for r in reservas]
+            ).body,
+        ),
+        "GET /{reserva_id}": medir_endpoint(
+            1,
+            repeticiones,
+            lambda: validar_y_serializar(una, modelo_publico(reservas[0], equipos)),
+            lambda: json_response(
+                build_reserva_public(reservas[0], equipos_ids, detalles)
+            ).body,
+        ),
+        "POST /series": medir_endpoint(
+            16,
+            repeticiones,
+            lambda: validar_y_serializar(
+                lista, [modelo_publico(r, equipos_ids) for r in reservas[:16]]
+            ),
+            lambda: json_response(
+                [reserva_dict(r, equipos_ids) for r in reservas[:16]]
+            ).body,
+        ),
+    }
+
+
+def bench_auth2(filas: int, repeticiones: int) -> dict:
+    from pydantic import TypeAdapter
+    from sqlmodel import Session, SQLModel, create_engine, select
+    from starlette.responses import Response
+
+    from app.main import UserOut
+    from app.models.user_db import UserDB, UserType
+    from app.responses import json_response
+
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            UserDB(
+                email=f"usuario{n}@example.com",
+                name=f"Usuario {n}",
+                password="x",
+                type=UserType.ESTUDIANTE,
+            )
+            for n in range(filas)
+        )
+        session.commit()
+        users = session.exec(
+            select(UserDB.id, UserDB.email, UserDB.name, UserDB.type)
+        ).all()
+
+    lista = TypeAdapter(list[UserOut])
+    uno = TypeAdapter(UserOut)
+    cacheado = UserOut(**users[0]._asdict())
+    body = json_response(users[0]._asdict()).body
+    return {
+        "GET /users": medir_endpoint(
+            filas,
+            repeticiones,
+            lambda: lista.dump_json(
+                lista.validate_python(
+                    [
+                        UserOut(id=u.id, email=u.email, name=u.name, type=u.type)
+                        for u in users
+                    ]
+                )
+            ),
+            lambda: json_response([u._asdict() for u in users]).body,
+        ),
+        "GET /me (caché)": medir_endpoint(
+            1,
+            repeticiones,
+            lambda: uno.dump_json(uno.validate_python(cacheado)),
+            lambda: Response(body, media_type="application/json").body,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=100)
+    parser.add_argument("--repeticiones", type=int, default=100)
+    parser.add_argument("--servicio", choices=SERVICIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servicio:
+        sys.path.insert(0, str(ROOT / args.servicio))
+        bench = bench_reservas if args.servicio == "reservas" else bench_auth2
+        print(json.dumps(bench(args.filas, args.repeticiones)))
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for servicio in SERVICIOS:
+            salida = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--servicio",
+                    servicio,
+                    "--filas",
+                    str(args.filas),
+                    "--repeticiones",
+                    str(args.repeticiones),
+                ],
+                cwd=ROOT / servicio,
+                env={**os.environ, "DATABASE_URL": f"sqlite:///{tmp}/{servicio}.db"},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            # El resultado es la última línea: al importarse, app.db puede
+            # imprimir por la salida estándar
+            results[servicio] = json.loads(salida.splitlines()[-1])
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Caché en memoria (LRU con TTL) para las lecturas de laboratorios y equipos.
+
+Las respuestas se guardan ya serializadas a JSON junto con su ETag, de modo
+que un acierto no toca la base de datos ni vuelve a serializar. Los handlers
+de escritura invalidan las entradas afectadas por prefijo de clave.
+
+La caché es local a cada proceso: otras réplicas pueden servir datos
+desactualizados como mucho durante ``CACHE_TTL_SECONDS``.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+
+class TTLCache:
+    """Caché LRU acotada por número de entradas y con expiración por TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación para no guardar resultados que
+        # se cargaron antes de una escritura concurrente
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, generation: int | None = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, *keys: str):
+        """Eliminar las entradas con las claves indicadas."""
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def discard_prefix(self, *prefixes: str):
+        """Eliminar las entradas cuya clave empiece por alguno de los prefijos."""
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._data if k.startswith(prefixes)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+
+@lru_cache
+def _type_adapter(response_model: Any) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _store(
+    key: str,
+    response_model: Any,
+    data: Any,
+    generation: int,
+    extra_headers: Callable[[Any], dict] | None,
+) -> tuple:
+    adapter = _type_adapter(response_model)
+    body = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+    headers = extra_headers(data) if extra_headers else {}
+    entry = (body, f'"{hashlib.sha1(body).hexdigest()}"', headers)
+    cache.set(key, entry, generation)
+    return entry
+
+
+def _respond(request: Request, entry: tuple) -> Response:
+    body, etag, extra_headers = entry
+    headers = {"ETag": etag, **extra_headers}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached_response(
+    request: Request,
+    key: str,
+    response_model: Any,
+    loader: Callable[[], Any],
+    extra_headers: Callable[[Any], dict] | None = None,
+) -> Response:
+    """Responder desde la caché o cargar, serializar y guardar el resultado.
+
+    ``loader`` devuelve los objetos a serializar con ``response_model``; si
+    lanza una excepción (por ejemplo un 404) no se guarda nada. Si el cliente
+    envía un ``If-None-Match`` que coincide con el ETag se responde 304.
+    ``extra_headers`` calcula, a partir de esos objetos, cabeceras que se
+    guardan junto a la respuesta (por ejemplo el cursor de la página siguiente).
+    """
+    entry = cache.get(key)
+    if entry is None:
+        generation = cache.generation
+        entry = _store(key, response_model, loader(), generation, extra_headers)
+    return _respond(request, entry)
+
+
+async def cached_response_async(
+    request: Request,
+    key: str,
+    response_model: Any,
+    loader: Callable[[], Awaitable[Any]],
+    extra_headers: Callable[[Any], dict] | None = None,
+) -> Response:
+    """Igual que ``cached_response`` pero con un ``loader`` asíncrono."""
+    entry = cache.get(key)
+    if entry is None:
+        generation = cache.generation
+        data = await loader()
+        entry = _store(key, response_model, data, generation, extra_headers)
+    return _respond(request, entry)
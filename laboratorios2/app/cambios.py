@@ -0,0 +1,168 @@
+"""Feed de cambios de equipos y laboratorios.
+
+Cada fila de ``equipo`` y ``laboratorio`` guarda la ``version`` de su último
+cambio y su ``updated_at``; cada borrado deja una lápida en ``eliminacion``
+con su propia versión. ``GET /changes?since=<cursor>`` devuelve, en orden de
+versión, las filas y lápidas con ``version > since`` (un ``UNION ALL`` de
+búsquedas en el índice de ``version`` de cada tabla, en una sola sentencia) y
+el cursor para la siguiente llamada, así que una réplica sólo lee lo que ha
+cambiado desde su última sincronización.
+Cada fila aparece una vez, con su estado actual.
+
+Las versiones salen de un contador global (``contador_version``) que se
+incrementa con ``UPDATE ... RETURNING`` en la misma transacción que la
+escritura. El bloqueo de esa fila serializa las escrituras hasta el commit, de
+modo que las versiones se confirman en orden y ``version > since`` no puede
+saltarse un cambio confirmado más tarde con una versión menor (lo que sí
+ocurriría con una secuencia de Postgres).
+
+Las escrituras del ORM reciben su versión en ``before_flush``; las sentencias
+``INSERT``/``UPDATE`` masivas la reservan con ``reservar_versiones``.
+"""
+
+from sqlalchemy import (
+    String,
+    event,
+    false,
+    literal,
+    null,
+    true,
+    union_all,
+    update,
+)
+from sqlmodel import Session, select
+
+from app.models.cambio import Cambio, ContadorVersion, Eliminacion, PaginaCambios
+from app.models.laboratorio import (
+    Equipo,
+    EquipoRead,
+    Laboratorio,
+    LaboratorioRead,
+    naive_utc,
+)
+
+VERSIONADOS = (Equipo, Laboratorio)
+
+
+def reservar_versiones(session: Session, n: int) -> int:
+    """Reservar ``n`` versiones consecutivas y devolver la primera."""
+    contador = ContadorVersion.__table__
+    ultima = session.execute(
+        update(contador)
+        .values(valor=contador.c.valor + n)
+        .returning(contador.c.valor)
+    ).scalar_one()
+    return ultima - n + 1
+
+
+@event.listens_for(Session, "before_flush")
+def _versionar(session, flush_context, instances):
+    modificados = [
+        obj
+        for obj in (*session.new, *session.dirty)
+        if isinstance(obj, VERSIONADOS)
+        and (obj in session.new or session.is_modified(obj, include_collections=False))
+    ]
+    # Incluye los equipos borrados en cascada con su laboratorio
+    eliminados = [obj for obj in session.deleted if isinstance(obj, VERSIONADOS)]
+    if not modificados and not eliminados:
+        return
+    version = reservar_versiones(session, len(modificados) + len(eliminados))
+    ahora = naive_utc()
+    for obj in modificados:
+        obj.version = version
+        obj.updated_at = ahora
+        version += 1
+    for obj in eliminados:
+        session.add(
+            Eliminacion(
+                tabla=obj.__tablename__,
+                id_registro=obj.id,
+                version=version,
+                deleted_at=ahora,
+            )
+        )
+        version += 1
+
+
+def cambios_query(since: int, limit: int):
+    """Filas y lápidas con ``version > since``, en una sola sentencia.
+
+    Con una consulta por tabla, un cambio confirmado entre dos lecturas
+    podría quedar en una tabla ya leída con una versión menor que la última
+    devuelta, y el cursor lo saltaría. Una sola sentencia ve una única
+    instantánea. Se pide una fila más para saber si hay más cambios.
+    """
+    equipos = select(
+        Equipo.version,
+        literal("equipo", String).label("tipo"),
+        Equipo.id,
+        false().label("eliminado"),
+        Equipo.updated_at,
+        Equipo.nombre,
+        Equipo.modelo,
+        Equipo.estado,
+        Equipo.id_laboratorio,
+        null().label("descripcion"),
+    ).where(Equipo.version > since)
+    laboratorios = select(
+        Laboratorio.version,
+        literal("laboratorio", String),
+        Laboratorio.id,
+        false(),
+        Laboratorio.updated_at,
+        Laboratorio.nombre,
+        null(),
+        null(),
+        null(),
+        Laboratorio.descripcion,
+    ).where(Laboratorio.version > since)
+    eliminaciones = select(
+        Eliminacion.version,
+        Eliminacion.tabla,
+        Eliminacion.id_registro,
+        true(),
+        Eliminacion.deleted_at,
+        null(),
+        null(),
+        null(),
+        null(),
+        null(),
+    ).where(Eliminacion.version > since)
+    cambios = union_all(equipos, laboratorios, eliminaciones).subquery()
+    return select(cambios).order_by(cambios.c.version).limit(limit + 1)
+
+
+def _datos(fila) -> EquipoRead | LaboratorioRead | None:
+    if fila.eliminado:
+        return None
+    if fila.tipo == "equipo":
+        return EquipoRead(
+            id=fila.id,
+            nombre=fila.nombre,
+            modelo=fila.modelo,
+            estado=fila.estado,
+            id_laboratorio=fila.id_laboratorio,
+        )
+    return LaboratorioRead(id=fila.id, nombre=fila.nombre, descripcion=fila.descripcion)
+
+
+def pagina_cambios(since: int, limit: int, filas) -> PaginaCambios:
+    """Construir la página a partir de las filas de ``cambios_query``."""
+    cambios = [
+        Cambio(
+            version=fila.version,
+            tipo=fila.tipo,
+            id=fila.id,
+            eliminado=fila.eliminado,
+            updated_at=fila.updated_at,
+            datos=_datos(fila),
+        )
+        for fila in filas
+    ]
+    pagina = cambios[:limit]
+    return PaginaCambios(
+        cambios=pagina,
+        cursor=pagina[-1].version if pagina else since,
+        hay_mas=len(cambios) > limit,
+    )
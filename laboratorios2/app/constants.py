@@ -1 +1,10 @@
 # Este archivo puede contener constantes para la aplicación de laboratorios.
+
+# Máximo de equipos que se pueden solicitar en GET /equipos/batch
+MAX_EQUIPOS_BATCH = 100
+
+# Máximo de equipos por petición en POST y PATCH /equipos/bulk
+MAX_EQUIPOS_BULK = 1000
+
+# Máximo de cambios por página en GET /changes
+MAX_CAMBIOS = 1000
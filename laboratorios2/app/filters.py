@@ -8,8 +8,12 @@ class LaboratorioFilterParams(BaseModel):
 
     limit: int = Field(100, gt=0, le=100)
     offset: int = Field(0, ge=0)
+    cursor: Optional[str] = Field(None, description="Cursor de X-Next-Cursor")
     order_by: Literal["nombre"] = "nombre"
-    nombre: Optional[str] = None
+    nombre: Optional[str] = Field(None, description="Texto contenido en el nombre")
+    q: Optional[str] = Field(
+        None, min_length=1, description="Búsqueda por relevancia (ignora order_by)"
+    )
 
 
 class EquipoFilterParams(BaseModel):
@@ -17,6 +21,13 @@ class EquipoFilterParams(BaseModel):
 
     limit: int = Field(100, gt=0, le=100)
     offset: int = Field(0, ge=0)
+    cursor: Optional[str] = Field(None, description="Cursor de X-Next-Cursor")
     order_by: Literal["nombre"] = "nombre"
+    nombre: Optional[str] = Field(None, description="Texto contenido en el nombre")
+    q: Optional[str] = Field(
+        None,
+        min_length=1,
+        description="Búsqueda por relevancia en nombre y modelo (ignora order_by)",
+    )
     estado: Optional[EstadoEquipo] = None
     id_laboratorio: Optional[int] = None
@@ -1,8 +1,21 @@
-from fastapi import FastAPI, Depends, HTTPException
+from collections import defaultdict
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Session, select
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List, Annotated
-from app.db import get_session, create_db_and_tables
+from app.db import (
+    DB_ASYNC,
+    get_async_session,
+    get_pool_stats,
+    get_session,
+    create_db_and_tables,
+    engine,
+    async_engine,
+)
+from app import metrics
 from app.models.laboratorio import (
     Laboratorio,
     LaboratorioCreate,
@@ -13,11 +26,22 @@ from app.models.laboratorio import (
     EquipoCreate,
     EquipoRead,
     EquipoUpdate,
+    EquipoBulkUpdate,
     EquipoReadWithLaboratorio,
+    EstadoEquipo,
+    EstadoEquiposLaboratorio,
+    naive_utc,
 )
+from app.models.cambio import PaginaCambios
 from app.filters import LaboratorioFilterParams, EquipoFilterParams
+from app.constants import MAX_CAMBIOS, MAX_EQUIPOS_BATCH, MAX_EQUIPOS_BULK
+from app.cambios import cambios_query, pagina_cambios, reservar_versiones
+from app.cache import cache, cached_response, cached_response_async
+from app.pagination import apply_cursor, next_cursor_headers
+from app.search import buscar, coincide
 
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
 app = FastAPI(root_path="/api/laboratorios")
 
@@ -29,12 +53,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Antes de las rutas, para que /metrics no quede tapada por rutas como /{id}
+metrics.instrument(app, engine, async_engine)
+
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
 
 
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Contadores de aciertos, fallos y desalojos de la caché de lecturas."""
+    return cache.stats()
+
+
+@app.get("/db/pool")
+def get_db_pool():
+    """Conexiones en uso y tiempos de espera del pool de la base de datos."""
+    return get_pool_stats()
+
+
+def invalidate_laboratorio(*laboratorio_ids: int | None):
+    """Invalidar las lecturas cacheadas que incluyen a los laboratorios dados."""
+    cache.discard(*(f"laboratorio:{id}" for id in laboratorio_ids if id))
+    cache.discard_prefix("laboratorios:")
+
+
+def invalidate_equipo(equipo_id: int | None, *laboratorio_ids: int | None):
+    """Invalidar las lecturas cacheadas que incluyen al equipo dado."""
+    if equipo_id:
+        cache.discard(f"equipo:{equipo_id}")
+    cache.discard(*(f"laboratorio:{id}" for id in laboratorio_ids if id))
+    cache.discard_prefix("equipos:")
+
+
+# --- Feed de cambios ---
+# Antes de GET /{laboratorio_id}, que también atendería /changes
+
+Since = Annotated[
+    int, Query(ge=0, description="Cursor devuelto por la llamada anterior")
+]
+LimiteCambios = Annotated[int, Query(ge=1, le=MAX_CAMBIOS)]
+
+
+def get_changes(session: SessionDep, since: Since = 0, limit: LimiteCambios = 100):
+    """Equipos y laboratorios creados, modificados o eliminados tras ``since``.
+
+    Los cambios van en orden de versión; ``cursor`` es el ``since`` de la
+    siguiente llamada y ``hay_mas`` indica si quedan más cambios ya
+    confirmados. Ver ``app.cambios``.
+    """
+    filas = session.execute(cambios_query(since, limit)).all()
+    return pagina_cambios(since, limit, filas)
+
+
+async def get_changes_async(
+    session: AsyncSessionDep, since: Since = 0, limit: LimiteCambios = 100
+):
+    """Equipos y laboratorios creados, modificados o eliminados tras ``since``."""
+    filas = (await session.execute(cambios_query(since, limit))).all()
+    return pagina_cambios(since, limit, filas)
+
+
+app.get("/changes", response_model=PaginaCambios)(
+    get_changes_async if DB_ASYNC else get_changes
+)
+
+
 # --- CRUD para Laboratorios ---
 
 
@@ -44,31 +130,106 @@ def create_laboratorio(laboratorio: LaboratorioCreate, session: SessionDep):
     session.add(db_laboratorio)
     session.commit()
     session.refresh(db_laboratorio)
+    invalidate_laboratorio()
     return db_laboratorio
 
 
-@app.get("/", response_model=List[LaboratorioRead])
+def laboratorios_orden(filters: LaboratorioFilterParams) -> tuple:
+    return getattr(Laboratorio, filters.order_by), Laboratorio.id
+
+
+def laboratorios_query(filters: LaboratorioFilterParams):
+    if filters.q:
+        # Por relevancia no hay orden estable para el cursor: se pagina con offset
+        query = buscar(select(Laboratorio), filters.q, Laboratorio.nombre)
+        query = query.order_by(Laboratorio.id).offset(filters.offset)
+    else:
+        query = apply_cursor(
+            select(Laboratorio), filters.cursor, *laboratorios_orden(filters)
+        )
+        if not filters.cursor:
+            query = query.offset(filters.offset)
+    if filters.nombre:
+        query = query.where(coincide(Laboratorio.nombre, filters.nombre))
+    return query.limit(filters.limit)
+
+
 def get_laboratorios(
-    session: SessionDep, filters: Annotated[LaboratorioFilterParams, Depends()]
+    request: Request,
+    session: SessionDep,
+    filters: Annotated[LaboratorioFilterParams, Depends()],
+):
+    def load():
+        return session.exec(laboratorios_query(filters)).all()
+
+    def headers(laboratorios):
+        if filters.q:
+            return {}
+        orden = laboratorios_orden(filters)
+        return next_cursor_headers(laboratorios, filters.limit, *orden)
+
+    key = f"laboratorios:{filters.model_dump_json()}"
+    return cached_response(request, key, List[LaboratorioRead], load, headers)
+
+
+async def get_laboratorios_async(
+    request: Request,
+    session: AsyncSessionDep,
+    filters: Annotated[LaboratorioFilterParams, Depends()],
+):
+    async def load():
+        return (await session.exec(laboratorios_query(filters))).all()
+
+    def headers(laboratorios):
+        if filters.q:
+            return {}
+        orden = laboratorios_orden(filters)
+        return next_cursor_headers(laboratorios, filters.limit, *orden)
+
+    key = f"laboratorios:{filters.model_dump_json()}"
+    return await cached_response_async(
+        request, key, List[LaboratorioRead], load, headers
+    )
+
+
+app.get("/", response_model=List[LaboratorioRead])(
+    get_laboratorios_async if DB_ASYNC else get_laboratorios
+)
+
+
+def get_laboratorio(laboratorio_id: int, request: Request, session: SessionDep):
+    def load():
+        laboratorio = session.get(
+            Laboratorio, laboratorio_id, options=[selectinload(Laboratorio.equipos)]
+        )
+        if not laboratorio:
+            raise HTTPException(status_code=404, detail="Laboratorio no encontrado")
+        return laboratorio
+
+    key = f"laboratorio:{laboratorio_id}"
+    return cached_response(request, key, LaboratorioReadWithEquipos, load)
+
+
+async def get_laboratorio_async(
+    laboratorio_id: int, request: Request, session: AsyncSessionDep
 ):
-    query = (
-        select(Laboratorio)
-        .offset(filters.offset)
-        .limit(filters.limit)
-        .order_by(getattr(Laboratorio, filters.order_by))
+    async def load():
+        laboratorio = await session.get(
+            Laboratorio, laboratorio_id, options=[selectinload(Laboratorio.equipos)]
+        )
+        if not laboratorio:
+            raise HTTPException(status_code=404, detail="Laboratorio no encontrado")
+        return laboratorio
+
+    key = f"laboratorio:{laboratorio_id}"
+    return await cached_response_async(
+        request, key, LaboratorioReadWithEquipos, load
     )
-    if filters.nombre:
-        query = query.where(Laboratorio.nombre.contains(filters.nombre))
-    laboratorios = session.exec(query).all()
-    return laboratorios
 
 
-@app.get("/{laboratorio_id}", response_model=LaboratorioReadWithEquipos)
-def get_laboratorio(laboratorio_id: int, session: SessionDep):
-    laboratorio = session.get(Laboratorio, laboratorio_id)
-    if not laboratorio:
-        raise HTTPException(status_code=404, detail="Laboratorio no encontrado")
-    return laboratorio
+app.get("/{laboratorio_id}", response_model=LaboratorioReadWithEquipos)(
+    get_laboratorio_async if DB_ASYNC else get_laboratorio
+)
 
 
 @app.patch("/{laboratorio_id}", response_model=LaboratorioRead)
@@ -83,6 +244,9 @@ def update_laboratorio(
     session.add(db_laboratorio)
     session.commit()
     session.refresh(db_laboratorio)
+    invalidate_laboratorio(laboratorio_id)
+    # El detalle de cada equipo incluye a su laboratorio
+    cache.discard_prefix("equipo:")
     return db_laboratorio
 
 
@@ -93,6 +257,9 @@ def delete_laboratorio(laboratorio_id: int, session: SessionDep):
         raise HTTPException(status_code=404, detail="Laboratorio no encontrado")
     session.delete(laboratorio)
     session.commit()
+    invalidate_laboratorio(laboratorio_id)
+    # Sus equipos se eliminan en cascada
+    cache.discard_prefix("equipo:", "equipos:")
     return
 
 
@@ -105,31 +272,343 @@ def create_equipo(equipo: EquipoCreate, session: SessionDep):
     session.add(db_equipo)
     session.commit()
     session.refresh(db_equipo)
+    invalidate_equipo(None, db_equipo.id_laboratorio)
     return db_equipo
 
 
-@app.get("/equipos/", response_model=List[EquipoRead])
-def get_equipos(session: SessionDep, filters: Annotated[EquipoFilterParams, Depends()]):
-    query = (
-        select(Equipo)
-        .offset(filters.offset)
-        .limit(filters.limit)
-        .order_by(getattr(Equipo, filters.order_by))
+def laboratorios_inexistentes(session: Session, ids: set[int | None]) -> set[int]:
+    """Ids de laboratorio de ``ids`` que no existen, con una sola consulta."""
+    ids = {id for id in ids if id is not None}
+    if not ids:
+        return set()
+    existentes = session.exec(
+        select(Laboratorio.id).where(col(Laboratorio.id).in_(ids))
+    ).all()
+    return ids - set(existentes)
+
+
+def rechazar_errores(errores: list[dict]):
+    if errores:
+        raise HTTPException(status_code=422, detail=errores)
+
+
+EquiposBulkCreate = Annotated[
+    List[EquipoCreate], Body(min_length=1, max_length=MAX_EQUIPOS_BULK)
+]
+EquiposBulkUpdate = Annotated[
+    List[EquipoBulkUpdate], Body(min_length=1, max_length=MAX_EQUIPOS_BULK)
+]
+
+
+@app.post("/equipos/bulk", response_model=List[EquipoRead])
+def create_equipos_bulk(equipos: EquiposBulkCreate, session: SessionDep):
+    """Crear varios equipos en una transacción con un único INSERT.
+
+    Si algún equipo no es válido no se crea ninguno y la respuesta 422 indica
+    el error de cada uno por su posición (``index``) en la petición.
+    """
+    inexistentes = laboratorios_inexistentes(
+        session, {equipo.id_laboratorio for equipo in equipos}
     )
+    rechazar_errores(
+        [
+            {"index": i, "msg": f"Laboratorio {equipo.id_laboratorio} no encontrado"}
+            for i, equipo in enumerate(equipos)
+            if equipo.id_laboratorio in inexistentes
+        ]
+    )
+    # Sin eventos del ORM: las versiones del feed de cambios se asignan aquí
+    primera = reservar_versiones(session, len(equipos))
+    ahora = naive_utc()
+    db_equipos = session.scalars(
+        insert(Equipo).returning(Equipo, sort_by_parameter_order=True),
+        [
+            {**equipo.model_dump(), "version": version, "updated_at": ahora}
+            for version, equipo in enumerate(equipos, primera)
+        ],
+    ).all()
+    session.commit()
+    invalidate_equipo(None, *{equipo.id_laboratorio for equipo in equipos})
+    return db_equipos
+
+
+@app.patch("/equipos/bulk", response_model=List[EquipoRead])
+def update_equipos_bulk(equipos: EquiposBulkUpdate, session: SessionDep):
+    """Modificar varios equipos en una transacción.
+
+    Los equipos con los mismos cambios se actualizan con un único
+    ``UPDATE ... WHERE id IN (...)``. Si algún cambio no es válido no se
+    aplica ninguno y la respuesta 422 indica el error de cada uno.
+    """
+    ids = [equipo.id for equipo in equipos]
+    laboratorios_anteriores = dict(
+        session.exec(
+            select(Equipo.id, Equipo.id_laboratorio).where(col(Equipo.id).in_(ids))
+        ).all()
+    )
+    inexistentes = laboratorios_inexistentes(
+        session,
+        {
+            equipo.id_laboratorio
+            for equipo in equipos
+            if "id_laboratorio" in equipo.model_fields_set
+        },
+    )
+    errores = []
+    vistos = set()
+    cambios_por_grupo: dict[tuple, list[int]] = defaultdict(list)
+    for i, equipo in enumerate(equipos):
+        cambios = equipo.model_dump(exclude_unset=True, exclude={"id"})
+        if equipo.id not in laboratorios_anteriores:
+            errores.append({"index": i, "msg": f"Equipo {equipo.id} no encontrado"})
+        elif equipo.id in vistos:
+            errores.append({"index": i, "msg": f"Equipo {equipo.id} repetido"})
+        elif cambios.get("id_laboratorio") in inexistentes:
+            errores.append(
+                {
+                    "index": i,
+                    "msg": f"Laboratorio {cambios['id_laboratorio']} no encontrado",
+                }
+            )
+        elif cambios:
+            cambios_por_grupo[tuple(sorted(cambios.items()))].append(equipo.id)
+        vistos.add(equipo.id)
+    rechazar_errores(errores)
+
+    # Una versión por equipo modificado, asignada en el mismo UPDATE del grupo
+    version = reservar_versiones(
+        session, sum(len(grupo) for grupo in cambios_por_grupo.values())
+    )
+    ahora = naive_utc()
+    for cambios, grupo in cambios_por_grupo.items():
+        versiones = dict(zip(grupo, range(version, version + len(grupo))))
+        version += len(grupo)
+        session.execute(
+            update(Equipo)
+            .where(col(Equipo.id).in_(grupo))
+            .values(
+                **dict(cambios),
+                version=case(versiones, value=Equipo.id),
+                updated_at=ahora,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    session.commit()
+
+    db_equipos = session.exec(
+        select(Equipo).where(col(Equipo.id).in_(ids)).order_by(Equipo.id)
+    ).all()
+    cache.discard(*(f"equipo:{id}" for id in ids))
+    invalidate_equipo(
+        None,
+        *laboratorios_anteriores.values(),
+        *(equipo.id_laboratorio for equipo in db_equipos),
+    )
+    return db_equipos
+
+
+def equipos_orden(filters: EquipoFilterParams) -> tuple:
+    return getattr(Equipo, filters.order_by), Equipo.id
+
+
+def equipos_query(filters: EquipoFilterParams):
+    if filters.q:
+        query = buscar(select(Equipo), filters.q, Equipo.nombre, Equipo.modelo)
+        query = query.order_by(Equipo.id).offset(filters.offset)
+    else:
+        query = apply_cursor(select(Equipo), filters.cursor, *equipos_orden(filters))
+        if not filters.cursor:
+            query = query.offset(filters.offset)
+    query = query.limit(filters.limit)
+    if filters.nombre:
+        query = query.where(coincide(Equipo.nombre, filters.nombre))
     if filters.estado:
         query = query.where(Equipo.estado == filters.estado)
     if filters.id_laboratorio:
         query = query.where(Equipo.id_laboratorio == filters.id_laboratorio)
-    equipos = session.exec(query).all()
+    return query
+
+
+def get_equipos(
+    request: Request,
+    session: SessionDep,
+    filters: Annotated[EquipoFilterParams, Depends()],
+):
+    def load():
+        return session.exec(equipos_query(filters)).all()
+
+    def headers(equipos):
+        if filters.q:
+            return {}
+        return next_cursor_headers(equipos, filters.limit, *equipos_orden(filters))
+
+    key = f"equipos:{filters.model_dump_json()}"
+    return cached_response(request, key, List[EquipoRead], load, headers)
+
+
+async def get_equipos_async(
+    request: Request,
+    session: AsyncSessionDep,
+    filters: Annotated[EquipoFilterParams, Depends()],
+):
+    async def load():
+        return (await session.exec(equipos_query(filters))).all()
+
+    def headers(equipos):
+        if filters.q:
+            return {}
+        return next_cursor_headers(equipos, filters.limit, *equipos_orden(filters))
+
+    key = f"equipos:{filters.model_dump_json()}"
+    return await cached_response_async(
+        request, key, List[EquipoRead], load, headers
+    )
+
+
+app.get("/equipos/", response_model=List[EquipoRead])(
+    get_equipos_async if DB_ASYNC else get_equipos
+)
+
+
+def estado_equipos_query(id_laboratorio: int | None):
+    query = select(Equipo.id_laboratorio, Equipo.estado, func.count()).group_by(
+        Equipo.id_laboratorio, Equipo.estado
+    )
+    if id_laboratorio is not None:
+        query = query.where(Equipo.id_laboratorio == id_laboratorio)
+    return query.order_by(Equipo.id_laboratorio)
+
+
+def agrupar_estados(filas) -> list[EstadoEquiposLaboratorio]:
+    por_laboratorio: dict[int | None, dict[EstadoEquipo, int]] = {}
+    for id_laboratorio, estado, cantidad in filas:
+        estados = por_laboratorio.setdefault(
+            id_laboratorio, dict.fromkeys(EstadoEquipo, 0)
+        )
+        estados[estado] = cantidad
+    return [
+        EstadoEquiposLaboratorio(
+            id_laboratorio=id_laboratorio,
+            total=sum(estados.values()),
+            por_estado=estados,
+        )
+        for id_laboratorio, estados in por_laboratorio.items()
+    ]
+
+
+def get_estado_equipos(
+    request: Request, session: SessionDep, id_laboratorio: int | None = None
+):
+    """Número de equipos de cada laboratorio en cada estado.
+
+    Se calcula con un ``GROUP BY`` y queda en la caché hasta que cambie algún
+    equipo, así que las consultas repetidas no llegan a la base de datos.
+    """
+
+    def load():
+        return agrupar_estados(session.exec(estado_equipos_query(id_laboratorio)))
+
+    key = f"equipos:stats:{id_laboratorio}"
+    return cached_response(request, key, List[EstadoEquiposLaboratorio], load)
+
+
+async def get_estado_equipos_async(
+    request: Request, session: AsyncSessionDep, id_laboratorio: int | None = None
+):
+    """Número de equipos de cada laboratorio en cada estado."""
+
+    async def load():
+        filas = await session.exec(estado_equipos_query(id_laboratorio))
+        return agrupar_estados(filas)
+
+    key = f"equipos:stats:{id_laboratorio}"
+    return await cached_response_async(
+        request, key, List[EstadoEquiposLaboratorio], load
+    )
+
+
+app.get("/equipos/stats", response_model=List[EstadoEquiposLaboratorio])(
+    get_estado_equipos_async if DB_ASYNC else get_estado_equipos
+)
+
+
+def equipos_batch_query(ids: str):
+    """Construir la consulta de ``GET /equipos/batch`` a partir de los ids."""
+    try:
+        equipo_ids = {int(id) for id in ids.split(",") if id.strip()}
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Ids de equipos inválidos")
+    if len(equipo_ids) > MAX_EQUIPOS_BATCH:
+        raise HTTPException(
+            status_code=422,
+            detail=f"No se pueden solicitar más de {MAX_EQUIPOS_BATCH} equipos",
+        )
+    return (
+        select(Equipo)
+        .where(col(Equipo.id).in_(equipo_ids))
+        .options(joinedload(Equipo.laboratorio))
+        .order_by(Equipo.id)
+    )
+
+
+def get_equipos_batch(
+    session: SessionDep,
+    ids: Annotated[str, Query(description="Ids de equipos separados por comas")],
+):
+    """Obtener varios equipos por id, con su laboratorio, en una sola consulta.
+
+    Los ids que no existen se omiten de la respuesta.
+    """
+    equipos = session.exec(equipos_batch_query(ids)).all()
     return equipos
 
 
-@app.get("/equipos/{equipo_id}", response_model=EquipoReadWithLaboratorio)
-def get_equipo(equipo_id: int, session: SessionDep):
-    equipo = session.get(Equipo, equipo_id)
-    if not equipo:
-        raise HTTPException(status_code=404, detail="Equipo no encontrado")
-    return equipo
+async def get_equipos_batch_async(
+    session: AsyncSessionDep,
+    ids: Annotated[str, Query(description="Ids de equipos separados por comas")],
+):
+    """Obtener varios equipos por id, con su laboratorio, en una sola consulta.
+
+    Los ids que no existen se omiten de la respuesta.
+    """
+    equipos = (await session.exec(equipos_batch_query(ids))).all()
+    return equipos
+
+
+app.get("/equipos/batch", response_model=List[EquipoReadWithLaboratorio])(
+    get_equipos_batch_async if DB_ASYNC else get_equipos_batch
+)
+
+
+def get_equipo(equipo_id: int, request: Request, session: SessionDep):
+    def load():
+        equipo = session.get(
+            Equipo, equipo_id, options=[joinedload(Equipo.laboratorio)]
+        )
+        if not equipo:
+            raise HTTPException(status_code=404, detail="Equipo no encontrado")
+        return equipo
+
+    key = f"equipo:{equipo_id}"
+    return cached_response(request, key, EquipoReadWithLaboratorio, load)
+
+
+async def get_equipo_async(equipo_id: int, request: Request, session: AsyncSessionDep):
+    async def load():
+        equipo = await session.get(
+            Equipo, equipo_id, options=[joinedload(Equipo.laboratorio)]
+        )
+        if not equipo:
+            raise HTTPException(status_code=404, detail="Equipo no encontrado")
+        return equipo
+
+    key = f"equipo:{equipo_id}"
+    return await cached_response_async(request, key, EquipoReadWithLaboratorio, load)
+
+
+app.get("/equipos/{equipo_id}", response_model=EquipoReadWithLaboratorio)(
+    get_equipo_async if DB_ASYNC else get_equipo
+)
 
 
 @app.patch("/equipos/{equipo_id}", response_model=EquipoRead)
@@ -137,11 +616,13 @@ def update_equipo(equipo_id: int, equipo: EquipoUpdate, session: SessionDep):
     db_equipo = session.get(Equipo, equipo_id)
     if not db_equipo:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    id_laboratorio_anterior = db_equipo.id_laboratorio
     equipo_data = equipo.model_dump(exclude_unset=True)
     db_equipo.sqlmodel_update(equipo_data)
     session.add(db_equipo)
     session.commit()
     session.refresh(db_equipo)
+    invalidate_equipo(equipo_id, id_laboratorio_anterior, db_equipo.id_laboratorio)
     return db_equipo
 
 
@@ -150,6 +631,8 @@ def delete_equipo(equipo_id: int, session: SessionDep):
     equipo = session.get(Equipo, equipo_id)
     if not equipo:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    id_laboratorio = equipo.id_laboratorio
     session.delete(equipo)
     session.commit()
+    invalidate_equipo(equipo_id, id_laboratorio)
     return
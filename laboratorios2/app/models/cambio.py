@@ -0,0 +1,47 @@
+from sqlalchemy import DDL, event
+from sqlmodel import Field, SQLModel
+from typing import List, Optional, Union
+from datetime import datetime
+from app.models.laboratorio import EquipoRead, LaboratorioRead
+
+
+# --- Modelos del feed de cambios ---
+class ContadorVersion(SQLModel, table=True):
+    """Última versión asignada; una sola fila con ``id = 1``."""
+
+    __tablename__ = "contador_version"
+
+    id: int = Field(default=1, primary_key=True)
+    valor: int = 0
+
+
+event.listen(
+    ContadorVersion.__table__,
+    "after_create",
+    DDL("INSERT INTO contador_version (id, valor) VALUES (1, 0)"),
+)
+
+
+class Eliminacion(SQLModel, table=True):
+    """Lápida de un equipo o laboratorio eliminado."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tabla: str
+    id_registro: int
+    version: int = Field(index=True)
+    deleted_at: datetime
+
+
+# --- Esquemas para la API ---
+class Cambio(SQLModel):
+    version: int
+    tipo: str
+    id: int
+    eliminado: bool
+    updated_at: datetime
+    datos: Optional[Union[EquipoRead, LaboratorioRead]] = None
+
+class PaginaCambios(SQLModel):
+    cambios: List[Cambio]
+    cursor: int
+    hay_mas: bool
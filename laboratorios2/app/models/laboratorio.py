@@ -1,6 +1,14 @@
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
-from typing import Optional, List
+from typing import Dict, Optional, List
+from datetime import datetime, timezone
 from enum import Enum
+from app.search import indice_trigram
+
+
+def naive_utc() -> datetime:
+    """Hora actual en UTC sin zona horaria, como se guarda en la base de datos."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
 class EstadoEquipo(str, Enum):
@@ -19,8 +27,20 @@ class EquipoBase(SQLModel):
 
 class Equipo(EquipoBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Versión del último cambio y su hora, para el feed de cambios (app.cambios)
+    version: int = Field(default=0, index=True)
+    updated_at: datetime = Field(default_factory=naive_utc)
     laboratorio: "Laboratorio" = Relationship(back_populates="equipos")
 
+    __table_args__ = (
+        # Índices para la paginación por cursor sobre (nombre, id), también
+        # dentro de un laboratorio
+        Index("ix_equipo_nombre_id", "nombre", "id"),
+        Index("ix_equipo_laboratorio_nombre_id", "id_laboratorio", "nombre", "id"),
+        # Índice para el recuento de equipos por laboratorio y estado
+        Index("ix_equipo_laboratorio_estado", "id_laboratorio", "estado"),
+    )
+
 
 # --- Modelo para Laboratorio ---
 class LaboratorioBase(SQLModel):
@@ -30,11 +50,18 @@ class LaboratorioBase(SQLModel):
 
 class Laboratorio(LaboratorioBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    version: int = Field(default=0, index=True)
+    updated_at: datetime = Field(default_factory=naive_utc)
     equipos: List["Equipo"] = Relationship(
         back_populates="laboratorio", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
     )
 
 
+# Índices de trigramas para la búsqueda por texto (solo en Postgres)
+indice_trigram(Equipo.__table__, "nombre", "modelo")
+indice_trigram(Laboratorio.__table__, "nombre")
+
+
 # --- Esquemas para la API ---
 
 # Esquemas de Equipo
@@ -50,6 +77,14 @@ class EquipoUpdate(SQLModel):
     estado: Optional[EstadoEquipo] = None
     id_laboratorio: Optional[int] = None
 
+class EquipoBulkUpdate(EquipoUpdate):
+    id: int
+
+class EstadoEquiposLaboratorio(SQLModel):
+    id_laboratorio: Optional[int]
+    total: int
+    por_estado: Dict[EstadoEquipo, int]
+
 
 # Esquemas de Laboratorio
 class LaboratorioRead(LaboratorioBase):
@@ -0,0 +1,130 @@
+"""Búsqueda por texto insensible a mayúsculas y acentos.
+
+El texto buscado y las columnas se comparan normalizados: en minúsculas y sin
+acentos, de modo que "danado" encuentra "Dañado".
+
+- En Postgres se usan las extensiones ``unaccent`` y ``pg_trgm``. Cada columna
+  buscable tiene un índice GIN de trigramas sobre ``f_unaccent(lower(col))``
+  que sirve tanto para ``LIKE '%texto%'`` como para el operador de similitud
+  ``<%``, que además tolera errores de escritura. Los resultados se ordenan
+  por ``word_similarity``.
+- En SQLite ``f_unaccent`` se registra como función Python en cada conexión.
+  No hay índice de trigramas, así que la búsqueda recorre la tabla; la
+  relevancia es mayor si el texto aparece al principio.
+"""
+
+import operator
+import unicodedata
+from functools import reduce
+
+from sqlalchemy import DDL, Boolean, Float, event, func, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+def normalizar(texto: str) -> str:
+    """Pasar a minúsculas y quitar acentos y diéresis (ñ -> n)."""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+@event.listens_for(Engine, "connect")
+def _registrar_f_unaccent(dbapi_connection, connection_record):
+    if hasattr(dbapi_connection, "create_function"):
+        dbapi_connection.create_function(
+            "f_unaccent", 1, lambda texto: texto and normalizar(texto)
+        )
+
+
+def indice_trigram(table, *columns: str):
+    """Crear en Postgres el índice de trigramas de ``columns`` junto a la tabla."""
+    event.listen(
+        table,
+        "before_create",
+        DDL(
+            "CREATE EXTENSION IF NOT EXISTS unaccent;"
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
+            # unaccent() no es IMMUTABLE y no puede usarse en un índice
+            "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS "
+            "$$ SELECT public.unaccent('public.unaccent', $1) $$ "
+            "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT"
+        ).execute_if(dialect="postgresql"),
+    )
+    for column in columns:
+        event.listen(
+            table,
+            "after_create",
+            DDL(
+                f"CREATE INDEX IF NOT EXISTS ix_{table.name}_{column}_trgm "
+                f"ON {table.name} USING gin (f_unaccent(lower({column})) "
+                "gin_trgm_ops)"
+            ).execute_if(dialect="postgresql"),
+        )
+
+
+class similitud(FunctionElement):
+    """Relevancia entre 0 y 1 de ``texto`` en ``columna``, ya normalizados."""
+
+    type = Float()
+    inherit_cache = True
+
+
+class parecido(FunctionElement):
+    """Si ``texto`` aparece en ``columna`` aunque sea con errores."""
+
+    type = Boolean()
+    inherit_cache = True
+
+
+@compiles(similitud, "postgresql")
+def _similitud_postgresql(element, compiler, **kw):
+    return "word_similarity(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(similitud)
+def _similitud(element, compiler, **kw):
+    texto, columna = (compiler.process(c, **kw) for c in element.clauses)
+    posicion = f"instr({columna}, {texto})"
+    return (
+        f"(CASE WHEN {posicion} = 1 THEN 1.0 "
+        f"WHEN {posicion} > 0 THEN 0.5 ELSE 0.0 END)"
+    )
+
+
+@compiles(parecido, "postgresql")
+def _parecido_postgresql(element, compiler, **kw):
+    texto, columna = element.clauses
+    # Con op() el compilador escapa el % según el paramstyle del driver
+    return compiler.process(texto.op("<%", is_comparison=True)(columna), **kw)
+
+
+@compiles(parecido)
+def _parecido(element, compiler, **kw):
+    texto, columna = (compiler.process(c, **kw) for c in element.clauses)
+    return f"(instr({columna}, {texto}) > 0)"
+
+
+def _normalizada(column):
+    return func.f_unaccent(func.lower(column))
+
+
+def coincide(column, texto: str):
+    """Condición ``column`` contiene ``texto``, sin distinguir acentos."""
+    return _normalizada(column).contains(normalizar(texto), autoescape=True)
+
+
+def buscar(query, texto: str, *columns):
+    """Filtrar ``query`` por ``texto`` en ``columns`` y ordenar por relevancia."""
+    texto = normalizar(texto)
+    condiciones, relevancia = [], []
+    for column in columns:
+        normalizada = _normalizada(column)
+        condiciones += [
+            normalizada.contains(texto, autoescape=True),
+            parecido(texto, normalizada),
+        ]
+        relevancia.append(similitud(texto, normalizada))
+    return query.where(or_(*condiciones)).order_by(
+        reduce(operator.add, relevancia).desc()
+    )
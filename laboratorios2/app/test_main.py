@@ -0,0 +1,395 @@
+from contextlib import contextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import main
+from app.cache import cache
+from app.db import InstrumentedQueuePool, get_async_session, get_session
+from app.main import app
+from app.models.laboratorio import Equipo, EquipoReadWithLaboratorio, Laboratorio
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture(name="client")
+def client_fixture(session: Session):
+    app.dependency_overrides[get_session] = lambda: session
+    cache.clear()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@contextmanager
+def count_queries(session: Session):
+    """Contar las sentencias SQL ejecutadas sobre el engine de ``session``."""
+    queries: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    engine = session.get_bind()
+    # Sin objetos en la sesión, cada relación cargada de forma perezosa se
+    # ve como una consulta más
+    session.expunge_all()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(name="laboratorio")
+def laboratorio_fixture(session: Session):
+    laboratorio = Laboratorio(nombre="Redes", descripcion="Laboratorio de redes")
+    laboratorio.equipos = [
+        Equipo(nombre="Router", modelo="R1"),
+        Equipo(nombre="Switch", modelo="S1"),
+        Equipo(nombre="Servidor", modelo="X1"),
+    ]
+    session.add(laboratorio)
+    session.commit()
+    session.refresh(laboratorio)
+    return laboratorio
+
+
+def test_get_equipos_batch(client: TestClient, laboratorio: Laboratorio):
+    ids = [equipo.id for equipo in laboratorio.equipos]
+
+    response = client.get("/equipos/batch", params={"ids": f"{ids[2]},{ids[0]},999"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [e["id"] for e in data] == sorted([ids[0], ids[2]])
+    assert all(e["laboratorio"]["nombre"] == "Redes" for e in data)
+
+
+def test_get_equipos_batch_rejects_invalid_ids(client: TestClient):
+    assert client.get("/equipos/batch", params={"ids": "1,a"}).status_code == 422
+    too_many = ",".join(str(i) for i in range(1, 102))
+    assert client.get("/equipos/batch", params={"ids": too_many}).status_code == 422
+
+
+def test_get_equipo_is_cached_and_invalidated(
+    client: TestClient, laboratorio: Laboratorio
+):
+    equipo_id = laboratorio.equipos[0].id
+
+    first = client.get(f"/equipos/{equipo_id}")
+    etag = first.headers["etag"]
+    hits = cache.hits
+    second = client.get(f"/equipos/{equipo_id}", headers={"If-None-Match": etag})
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert cache.hits == hits + 1
+
+    client.patch(f"/equipos/{equipo_id}", json={"estado": "Mantenimiento"})
+    third = client.get(f"/equipos/{equipo_id}", headers={"If-None-Match": etag})
+
+    assert third.status_code == 200
+    assert third.json()["estado"] == "Mantenimiento"
+
+
+def test_get_laboratorio_invalidated_by_new_equipo(
+    client: TestClient, laboratorio: Laboratorio
+):
+    assert len(client.get(f"/{laboratorio.id}").json()["equipos"]) == 3
+
+    client.post(
+        "/equipos/",
+        json={"nombre": "Firewall", "modelo": "F1", "id_laboratorio": laboratorio.id},
+    )
+
+    assert len(client.get(f"/{laboratorio.id}").json()["equipos"]) == 4
+
+
+def test_async_handlers(tmp_path):
+    database = tmp_path / "laboratorios.db"
+    with Session(create_engine(f"sqlite:///{database}")) as session:
+        SQLModel.metadata.create_all(session.get_bind())
+        laboratorio = Laboratorio(nombre="Redes", descripcion="Laboratorio de redes")
+        laboratorio.equipos = [Equipo(nombre="Router", modelo="R1")]
+        session.add(laboratorio)
+        session.commit()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+    # En modo DB_ASYNC la aplicación registra estas variantes de los handlers
+    async_app = FastAPI()
+    async_app.get("/equipos/batch", response_model=list[EquipoReadWithLaboratorio])(
+        main.get_equipos_batch_async
+    )
+    async_app.get("/equipos/{equipo_id}")(main.get_equipo_async)
+    async_app.get("/{laboratorio_id}")(main.get_laboratorio_async)
+    async_app.dependency_overrides[get_async_session] = get_async_session_override
+    cache.clear()
+    with TestClient(async_app) as client:
+        laboratorio = client.get("/1").json()
+        equipo = client.get("/equipos/1").json()
+        batch = client.get("/equipos/batch", params={"ids": "1"}).json()
+
+    assert [e["nombre"] for e in laboratorio["equipos"]] == ["Router"]
+    assert equipo["laboratorio"]["nombre"] == "Redes"
+    assert batch[0]["laboratorio"]["nombre"] == "Redes"
+
+
+def test_pool_records_checkout_waits(tmp_path):
+    pool_engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    before = InstrumentedQueuePool.stats.snapshot()
+
+    with pool_engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            pool_engine.connect()
+
+    after = InstrumentedQueuePool.stats.snapshot()
+    assert after["checkouts"] == before["checkouts"] + 1
+    assert after["timeouts"] == before["timeouts"] + 1
+    assert after["wait_seconds_max"] >= 0.05
+
+
+def test_get_equipos_cursor_pagination(client: TestClient, laboratorio: Laboratorio):
+    primera = client.get("/equipos/", params={"limit": 2})
+    segunda = client.get(
+        "/equipos/", params={"limit": 2, "cursor": primera.headers["x-next-cursor"]}
+    )
+
+    assert [e["nombre"] for e in primera.json()] == ["Router", "Servidor"]
+    assert [e["nombre"] for e in segunda.json()] == ["Switch"]
+    assert "x-next-cursor" not in segunda.headers
+
+
+def test_detail_endpoints_load_relations_eagerly(
+    session: Session, client: TestClient, laboratorio: Laboratorio
+):
+    with count_queries(session) as queries:
+        detalle = client.get(f"/{laboratorio.id}").json()
+    with count_queries(session) as queries_equipo:
+        equipo = client.get(f"/equipos/{detalle['equipos'][0]['id']}").json()
+
+    assert len(detalle["equipos"]) == 3
+    assert equipo["laboratorio"]["nombre"] == "Redes"
+    assert len(queries) == 2
+    assert len(queries_equipo) == 1
+
+
+def test_equipos_bulk_create_and_update(
+    session: Session, client: TestClient, laboratorio: Laboratorio
+):
+    creados = client.post(
+        "/equipos/bulk",
+        json=[
+            {"nombre": f"PC {i}", "modelo": "P1", "id_laboratorio": laboratorio.id}
+            for i in range(4)
+        ],
+    ).json()
+    ids = [equipo["id"] for equipo in creados]
+    client.get(f"/equipos/{ids[0]}")
+
+    with count_queries(session) as queries:
+        response = client.patch(
+            "/equipos/bulk",
+            json=[{"id": id, "estado": "Mantenimiento"} for id in ids[:3]]
+            + [{"id": ids[3], "modelo": "P2"}],
+        )
+
+    assert response.status_code == 200
+    assert [e["estado"] for e in response.json()] == ["Mantenimiento"] * 3 + [
+        "Operativo"
+    ]
+    # Un UPDATE por grupo de cambios, no uno por equipo
+    assert sum(q.startswith("UPDATE equipo") for q in queries) == 2
+    assert client.get(f"/equipos/{ids[0]}").json()["estado"] == "Mantenimiento"
+
+    errores = client.patch(
+        "/equipos/bulk",
+        json=[
+            {"id": ids[0], "estado": "Dañado"},
+            {"id": 9999, "estado": "Dañado"},
+            {"id": ids[1], "id_laboratorio": 9999},
+        ],
+    )
+    assert errores.status_code == 422
+    assert [e["index"] for e in errores.json()["detail"]] == [1, 2]
+    # Nada se aplica si algún cambio no es válido
+    assert client.get(f"/equipos/{ids[0]}").json()["estado"] == "Mantenimiento"
+    assert client.post(
+        "/equipos/bulk", json=[{"nombre": "X", "modelo": "X", "id_laboratorio": 9999}]
+    ).status_code == 422
+
+
+def test_search_ignores_case_and_accents(client: TestClient, laboratorio: Laboratorio):
+    for nombre in ("Electrónica", "Física", "Electricidad básica"):
+        client.post("/", json={"nombre": nombre, "descripcion": "-"})
+    client.post(
+        "/equipos/",
+        json={"nombre": "Osciloscopio", "modelo": "Señal", "id_laboratorio": 1},
+    )
+
+    buscados = client.get("/", params={"q": "ELECTR"})
+    filtrados = client.get("/", params={"nombre": "fisica"})
+    equipos = client.get("/equipos/", params={"q": "senal"})
+
+    assert [lab["nombre"] for lab in buscados.json()] == [
+        "Electrónica",
+        "Electricidad básica",
+    ]
+    assert "x-next-cursor" not in buscados.headers
+    assert [lab["nombre"] for lab in filtrados.json()] == ["Física"]
+    assert [equipo["nombre"] for equipo in equipos.json()] == ["Osciloscopio"]
+
+
+def test_estado_equipos_counts_by_laboratorio(
+    client: TestClient, laboratorio: Laboratorio
+):
+    equipos = client.get("/equipos/", params={"id_laboratorio": laboratorio.id}).json()
+    client.patch(f"/equipos/{equipos[0]['id']}", json={"estado": "Dañado"})
+
+    stats = client.get("/equipos/stats").json()
+    client.patch(f"/equipos/{equipos[1]['id']}", json={"estado": "Mantenimiento"})
+
+    assert stats == [
+        {
+            "id_laboratorio": laboratorio.id,
+            "total": 3,
+            "por_estado": {"Operativo": 2, "Mantenimiento": 0, "Dañado": 1},
+        }
+    ]
+    # Las escrituras invalidan el resultado cacheado
+    assert client.get("/equipos/stats").json()[0]["por_estado"]["Mantenimiento"] == 1
+
+
+def test_changes_feed_is_incremental(
+    session: Session, client: TestClient, laboratorio: Laboratorio
+):
+    laboratorio_id = laboratorio.id
+    inicial = client.get("/changes").json()
+    # El laboratorio y sus tres equipos, cada uno con su versión
+    assert sorted((c["tipo"], c["id"]) for c in inicial["cambios"]) == [
+        ("equipo", 1),
+        ("equipo", 2),
+        ("equipo", 3),
+        ("laboratorio", laboratorio_id),
+    ]
+    assert len({c["version"] for c in inicial["cambios"]}) == 4
+    assert not inicial["hay_mas"]
+    cursor = inicial["cursor"]
+    assert client.get("/changes", params={"since": cursor}).json()["cambios"] == []
+
+    client.patch("/equipos/1", json={"estado": "Mantenimiento"})
+    client.patch("/equipos/bulk", json=[{"id": 2, "modelo": "S2"}])
+    nuevo = client.post(
+        "/equipos/bulk",
+        json=[{"nombre": "PC", "modelo": "P1", "id_laboratorio": laboratorio_id}],
+    ).json()[0]
+    client.delete("/equipos/3")
+
+    with count_queries(session) as queries:
+        cambios = client.get("/changes", params={"since": cursor}).json()["cambios"]
+    assert [(c["id"], c["eliminado"]) for c in cambios] == [
+        (1, False),
+        (2, False),
+        (nuevo["id"], False),
+        (3, True),
+    ]
+    assert cambios[0]["datos"]["estado"] == "Mantenimiento"
+    assert cambios[1]["datos"]["modelo"] == "S2"
+    assert cambios[3]["datos"] is None
+    # Las tres tablas en una sola sentencia
+    assert len(queries) == 1
+    versiones = [c["version"] for c in cambios]
+    assert versiones == sorted(set(versiones)) and versiones[0] > cursor
+
+    # Borrar el laboratorio deja lápidas también para sus equipos
+    client.delete(f"/{laboratorio_id}")
+    pagina = client.get("/changes", params={"since": versiones[-1], "limit": 2}).json()
+    assert pagina["hay_mas"]
+    resto = client.get("/changes", params={"since": pagina["cursor"]}).json()
+    eliminados = pagina["cambios"] + resto["cambios"]
+    assert all(c["eliminado"] for c in eliminados)
+    assert sorted((c["tipo"], c["id"]) for c in eliminados) == [
+        ("equipo", 1),
+        ("equipo", 2),
+        ("equipo", nuevo["id"]),
+        ("laboratorio", laboratorio_id),
+    ]
+
+
+def test_changes_feed_does_not_skip_concurrent_writes(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/cambios.db", connect_args={"check_same_thread": False}
+    )
+
+    @event.listens_for(engine, "connect")
+    def wal(dbapi_connection, connection_record):
+        # En WAL un escritor puede confirmar mientras otra conexión lee
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        laboratorio = Laboratorio(nombre="Redes", descripcion="Laboratorio de redes")
+        laboratorio.equipos = [Equipo(nombre="Router", modelo="R1")]
+        session.add(laboratorio)
+        session.commit()
+        ids = laboratorio.id, laboratorio.equipos[0].id
+
+    def get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    client = TestClient(app)
+    cursor = client.get("/changes").json()["cursor"]
+
+    escrito = False
+
+    def escribir(conn, cursor, statement, *args):
+        # Mientras se lee el feed, otra transacción cambia primero el equipo
+        # (versión menor) y después el laboratorio (versión mayor)
+        nonlocal escrito
+        if escrito or "UNION ALL" not in statement:
+            return
+        escrito = True
+        with Session(engine) as otra:
+            otra.get(Equipo, ids[1]).modelo = "R2"
+            otra.commit()
+            otra.get(Laboratorio, ids[0]).descripcion = "Renovado"
+            otra.commit()
+
+    event.listen(engine, "after_cursor_execute", escribir)
+    try:
+        primera = client.get("/changes", params={"since": cursor}).json()
+    finally:
+        event.remove(engine, "after_cursor_execute", escribir)
+    segunda = client.get("/changes", params={"since": primera["cursor"]}).json()
+    app.dependency_overrides.clear()
+
+    assert escrito
+    recibidos = {
+        (c["tipo"], c["datos"]["modelo"] if c["tipo"] == "equipo" else None)
+        for c in primera["cambios"] + segunda["cambios"]
+    }
+    assert recibidos == {("equipo", "R2"), ("laboratorio", None)}
@@ -1,4 +1,14 @@
+from datetime import timedelta
+
+
 class StatusReserva:
     COMPLETED = "completed"
     PENDING = "pending"
     CANCELLED = "cancelled"
+
+
+# Rango máximo que se puede consultar en GET /disponibilidad/{id_ubicacion}
+MAX_RANGO_DISPONIBILIDAD = timedelta(days=31)
+
+# Número máximo de ocurrencias de una serie de reservas (POST /series)
+MAX_OCURRENCIAS_SERIE = 200
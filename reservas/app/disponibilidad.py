@@ -0,0 +1,272 @@
+"""Índice en memoria de ocupación por laboratorio para consultar disponibilidad.
+
+Por cada ``id_ubicacion`` se mantienen:
+
+- las reservas completadas (las únicas que bloquean un laboratorio, igual que
+  en la detección de choques de ``create_reserva``) como lista ordenada de
+  intervalos ``(inicio, fin, id)``. Como no pueden solaparse entre sí, una
+  búsqueda binaria localiza la primera que toca el rango consultado y basta
+  recorrer las ``k`` siguientes: O(log n + k).
+- las sesiones de clase activas agrupadas por día de la semana y ordenadas
+  por hora de inicio, que se expanden sobre los días del rango consultado.
+
+El índice de un laboratorio se carga de la base de datos la primera vez que
+se consulta y después se actualiza de forma incremental desde los handlers
+de escritura. Como es local al proceso, se recarga cada
+``DISPONIBILIDAD_TTL_SECONDS`` para recoger cambios hechos por otras réplicas.
+
+Solo se cargan las reservas que terminan a partir del día actual (UTC), así
+que el coste de cada recarga no crece con el histórico. Las consultas que
+empiezan antes se resuelven con una carga puntual del rango pedido, que no se
+guarda en el índice. Las actualizaciones que llegan mientras se carga un
+laboratorio se guardan y se aplican sobre el índice nuevo antes de
+publicarlo, de modo que no se pierden al sustituir el anterior.
+"""
+
+import os
+import threading
+import time as monotonic_time
+from bisect import bisect_right, insort
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable
+
+from sqlmodel import Session, select
+
+from app.constants import StatusReserva
+from app.filters import naive_utc
+from app.models.horario_clase import DiaSemana, EstadoSesion, SesionClase
+from app.models.reserva import Reserva
+
+DISPONIBILIDAD_TTL_SECONDS = float(os.getenv("DISPONIBILIDAD_TTL_SECONDS", "60"))
+
+# Día de la semana según ``date.weekday()``; el domingo no tiene clases
+DIAS_SEMANA = {
+    0: DiaSemana.lunes,
+    1: DiaSemana.martes,
+    2: DiaSemana.miercoles,
+    3: DiaSemana.jueves,
+    4: DiaSemana.viernes,
+    5: DiaSemana.sabado,
+}
+
+
+class OcupacionLaboratorio:
+    """Intervalos ocupados de un laboratorio a partir de ``desde``."""
+
+    def __init__(self, desde: datetime):
+        self.desde = desde
+        self.loaded_at = monotonic_time.monotonic()
+        self.reservas: list[tuple[datetime, datetime, int]] = []
+        self.reservas_por_id: dict[int, tuple[datetime, datetime, int]] = {}
+        self.sesiones: dict[DiaSemana, list[tuple[time, time, int]]] = defaultdict(
+            list
+        )
+        self.sesiones_por_id: dict[int, tuple[DiaSemana, tuple[time, time, int]]] = {}
+
+    def add_reserva(self, intervalo: tuple[datetime, datetime, int]):
+        reserva_id = intervalo[2]
+        self.remove_reserva(reserva_id)
+        insort(self.reservas, intervalo)
+        self.reservas_por_id[reserva_id] = intervalo
+
+    def remove_reserva(self, reserva_id: int):
+        intervalo = self.reservas_por_id.pop(reserva_id, None)
+        if intervalo is not None:
+            self.reservas.remove(intervalo)
+
+    def add_sesion(self, dia: DiaSemana, intervalo: tuple[time, time, int]):
+        sesion_id = intervalo[2]
+        self.remove_sesion(sesion_id)
+        insort(self.sesiones[dia], intervalo)
+        self.sesiones_por_id[sesion_id] = (dia, intervalo)
+
+    def remove_sesion(self, sesion_id: int):
+        entry = self.sesiones_por_id.pop(sesion_id, None)
+        if entry is not None:
+            dia, intervalo = entry
+            self.sesiones[dia].remove(intervalo)
+
+    def ocupados(self, desde: datetime, hasta: datetime) -> list[tuple]:
+        """Intervalos ``(inicio, fin, tipo, id)`` que tocan ``[desde, hasta)``."""
+        ocupados = []
+        # La reserva anterior a ``desde`` puede terminar dentro del rango
+        i = max(bisect_right(self.reservas, (desde,)) - 1, 0)
+        while i < len(self.reservas) and self.reservas[i][0] < hasta:
+            inicio, fin, reserva_id = self.reservas[i]
+            if fin > desde:
+                ocupados.append((inicio, fin, "reserva", reserva_id))
+            i += 1
+
+        dia: date = desde.date()
+        while dia < hasta.date() or (dia == hasta.date() and hasta.time() > time()):
+            dia_semana = DIAS_SEMANA.get(dia.weekday())
+            for hora_inicio, hora_fin, sesion_id in self.sesiones.get(dia_semana, []):
+                inicio = datetime.combine(dia, hora_inicio)
+                fin = datetime.combine(dia, hora_fin)
+                if inicio < hasta and fin > desde:
+                    ocupados.append((inicio, fin, "clase", sesion_id))
+            dia += timedelta(days=1)
+
+        ocupados.sort()
+        return ocupados
+
+
+def intervalos_libres(
+    ocupados: list[tuple], desde: datetime, hasta: datetime, duracion_minima: timedelta
+) -> list[tuple[datetime, datetime]]:
+    """Calcular los huecos libres de ``[desde, hasta)`` entre los ocupados."""
+    libres = []
+    cursor = desde
+    for inicio, fin, *_ in ocupados:
+        if inicio > cursor and inicio - cursor >= duracion_minima:
+            libres.append((cursor, min(inicio, hasta)))
+        cursor = max(cursor, fin)
+    if hasta > cursor and hasta - cursor >= duracion_minima:
+        libres.append((cursor, hasta))
+    return libres
+
+
+def intervalo_reserva(reserva: Reserva) -> tuple[datetime, datetime, int]:
+    return (reserva.fecha_inicio, reserva.fecha_fin, reserva.id)
+
+
+def intervalo_sesion(sesion: SesionClase) -> tuple[time, time, int]:
+    return (sesion.hora_inicio, sesion.hora_fin, sesion.id)
+
+
+def inicio_ventana() -> datetime:
+    """Comienzo del día actual en UTC, desde el que se cargan las reservas."""
+    return datetime.combine(naive_utc(datetime.now(timezone.utc)).date(), time())
+
+
+# Cambio pendiente de aplicar sobre el índice de un laboratorio
+Actualizacion = Callable[[int, OcupacionLaboratorio], None]
+
+
+class IndiceOcupacion:
+    """Índices de ocupación de todos los laboratorios consultados."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._laboratorios: dict[int, OcupacionLaboratorio] = {}
+        # Actualizaciones recibidas durante cada carga en curso
+        self._cargas: list[list[Actualizacion]] = []
+        self._lock = threading.Lock()
+
+    def _load(
+        self,
+        session: Session,
+        id_ubicacion: int,
+        desde: datetime,
+        hasta: datetime | None = None,
+    ) -> OcupacionLaboratorio:
+        ocupacion = OcupacionLaboratorio(desde)
+        query = select(Reserva).where(
+            Reserva.id_ubicacion == id_ubicacion,
+            Reserva.status == StatusReserva.COMPLETED,
+            Reserva.fecha_fin > desde,
+        )
+        if hasta is not None:
+            query = query.where(Reserva.fecha_inicio < hasta)
+        for reserva in session.exec(query).all():
+            ocupacion.add_reserva(intervalo_reserva(reserva))
+        sesiones = session.exec(
+            select(SesionClase).where(
+                SesionClase.id_ubicacion == id_ubicacion,
+                SesionClase.estado == EstadoSesion.activa,
+            )
+        ).all()
+        for sesion in sesiones:
+            ocupacion.add_sesion(sesion.dia_semana, intervalo_sesion(sesion))
+        return ocupacion
+
+    def _reload(self, session: Session, id_ubicacion: int) -> OcupacionLaboratorio:
+        pendientes: list[Actualizacion] = []
+        with self._lock:
+            self._cargas.append(pendientes)
+        ocupacion = None
+        try:
+            ocupacion = self._load(session, id_ubicacion, inicio_ventana())
+        finally:
+            # Bajo el mismo lock que la publicación: ninguna actualización
+            # puede colarse entre la repetición y la sustitución
+            with self._lock:
+                # Por identidad: dos listas vacías son iguales
+                self._cargas = [c for c in self._cargas if c is not pendientes]
+                if ocupacion is not None:
+                    for actualizar in pendientes:
+                        actualizar(id_ubicacion, ocupacion)
+                    self._laboratorios[id_ubicacion] = ocupacion
+        return ocupacion
+
+    def ocupados(
+        self, session: Session, id_ubicacion: int, desde: datetime, hasta: datetime
+    ) -> list[tuple]:
+        with self._lock:
+            ocupacion = self._laboratorios.get(id_ubicacion)
+            expired = (
+                ocupacion is None
+                or ocupacion.loaded_at + self.ttl < monotonic_time.monotonic()
+            )
+        if expired:
+            ocupacion = self._reload(session, id_ubicacion)
+        if desde < ocupacion.desde:
+            # Rango anterior a la ventana del índice: carga puntual
+            return self._load(session, id_ubicacion, desde, hasta).ocupados(
+                desde, hasta
+            )
+        with self._lock:
+            return ocupacion.ocupados(desde, hasta)
+
+    def _aplicar(self, actualizar: Actualizacion):
+        """Aplicar un cambio a los índices cargados y a las cargas en curso."""
+        with self._lock:
+            for id_ubicacion, ocupacion in self._laboratorios.items():
+                actualizar(id_ubicacion, ocupacion)
+            for pendientes in self._cargas:
+                pendientes.append(actualizar)
+
+    def update_reserva(self, reserva: Reserva):
+        """Reflejar el estado actual de una reserva en el índice."""
+        # Los valores se copian ahora: el cambio puede aplicarse más tarde,
+        # con la sesión de la petición ya cerrada
+        intervalo = intervalo_reserva(reserva)
+        ubicacion = (
+            reserva.id_ubicacion
+            if reserva.status == StatusReserva.COMPLETED
+            else None
+        )
+
+        def actualizar(id_ubicacion: int, ocupacion: OcupacionLaboratorio):
+            if id_ubicacion == ubicacion:
+                ocupacion.add_reserva(intervalo)
+            else:
+                ocupacion.remove_reserva(intervalo[2])
+
+        self._aplicar(actualizar)
+
+    def update_sesion(self, sesion: SesionClase):
+        """Reflejar el estado actual de una sesión de clase en el índice."""
+        dia, intervalo = sesion.dia_semana, intervalo_sesion(sesion)
+        ubicacion = (
+            sesion.id_ubicacion if sesion.estado == EstadoSesion.activa else None
+        )
+
+        def actualizar(id_ubicacion: int, ocupacion: OcupacionLaboratorio):
+            if id_ubicacion == ubicacion:
+                ocupacion.add_sesion(dia, intervalo)
+            else:
+                ocupacion.remove_sesion(intervalo[2])
+
+        self._aplicar(actualizar)
+
+    def remove_sesion(self, sesion_id: int):
+        self._aplicar(lambda _, ocupacion: ocupacion.remove_sesion(sesion_id))
+
+    def clear(self):
+        with self._lock:
+            self._laboratorios.clear()
+
+
+indice_ocupacion = IndiceOcupacion(DISPONIBILIDAD_TTL_SECONDS)
@@ -0,0 +1,125 @@
+"""Exportación de reservas en CSV o NDJSON.
+
+Las filas se leen con un cursor de servidor (``yield_per``) y se envían por
+lotes a medida que llegan, así que la memoria no depende del número de
+reservas. Los ids de los equipos de cada reserva se agregan en SQL con una
+subconsulta correlacionada sobre ``ix_equiposreservabase_id_reserva``: un
+array (``array_agg``) en Postgres y una cadena ``group_concat`` en SQLite.
+A diferencia de un ``GROUP BY`` sobre toda la exportación, esto permite
+devolver las primeras filas sin esperar a agregar el resto.
+"""
+
+import csv
+import io
+import os
+from typing import Iterable, Iterator
+
+import orjson
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlmodel import select
+
+from app.filters import ReservaExportParams
+from app.models.equipos_reserva import EquiposReservaBase
+from app.models.reserva import Reserva
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+COLUMNAS = (
+    "id",
+    "fecha_creacion",
+    "fecha_inicio",
+    "fecha_fin",
+    "id_usuario",
+    "id_ubicacion",
+    "status",
+    "equipos",
+)
+
+
+class ids_equipos(FunctionElement):
+    """Ids de los equipos de la reserva ``id_reserva``, agregados en SQL."""
+
+    inherit_cache = True
+
+
+def _equipos_de(element, columna):
+    (id_reserva,) = element.clauses
+    return (
+        select(columna)
+        .where(EquiposReservaBase.id_reserva == id_reserva)
+        .scalar_subquery()
+    )
+
+
+@compiles(ids_equipos, "postgresql")
+def _ids_equipos_postgresql(element, compiler, **kw):
+    id_equipo = EquiposReservaBase.id_equipo
+    array = func.array_agg(aggregate_order_by(id_equipo, id_equipo))
+    return compiler.process(_equipos_de(element, array), **kw)
+
+
+@compiles(ids_equipos)
+def _ids_equipos(element, compiler, **kw):
+    concatenados = func.group_concat(EquiposReservaBase.id_equipo)
+    return compiler.process(_equipos_de(element, concatenados), **kw)
+
+
+def lista_equipos(valor) -> list[int]:
+    """Normalizar el resultado de ``ids_equipos`` a una lista ordenada."""
+    if not valor:
+        return []
+    if isinstance(valor, str):
+        return sorted(int(id_equipo) for id_equipo in valor.split(","))
+    return list(valor)
+
+
+def export_query(params: ReservaExportParams):
+    query = select(
+        *(getattr(Reserva, columna) for columna in COLUMNAS[:-1]),
+        ids_equipos(Reserva.id).label("equipos"),
+    )
+    if params.desde:
+        query = query.where(Reserva.fecha_inicio >= params.desde)
+    if params.hasta:
+        query = query.where(Reserva.fecha_inicio < params.hasta)
+    if params.id_ubicacion is not None:
+        query = query.where(Reserva.id_ubicacion == params.id_ubicacion)
+    if params.status:
+        query = query.where(Reserva.status == params.status)
+    return query.order_by(Reserva.fecha_inicio, Reserva.id).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+
+
+def iter_ndjson(lotes: Iterable[list]) -> Iterator[bytes]:
+    for lote in lotes:
+        yield b"".join(
+            orjson.dumps({**fila._asdict(), "equipos": lista_equipos(fila.equipos)})
+            + b"\n"
+            for fila in lote
+        )
+
+
+def iter_csv(lotes: Iterable[list]) -> Iterator[str]:
+    """CSV con cabecera; los ids de equipos van separados por ``;``."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS)
+    # La cabecera sale antes de leer la primera fila
+    yield buffer.getvalue()
+    for lote in lotes:
+        buffer.seek(0)
+        buffer.truncate()
+        for fila in lote:
+            *valores, equipos = fila
+            writer.writerow(
+                [
+                    valor.isoformat() if hasattr(valor, "isoformat") else valor
+                    for valor in valores
+                ]
+                + [";".join(map(str, lista_equipos(equipos)))]
+            )
+        yield buffer.getvalue()
@@ -1,13 +1,24 @@
-from pydantic import BaseModel, Field
+from datetime import date, datetime, timezone
+from pydantic import BaseModel, Field, field_validator
 from typing import Literal
+from app.constants import StatusReserva
+from app.models.estadisticas import Periodo
 from app.models.horario_clase import DiaSemana, EstadoSesion
 
 
+def naive_utc(value: datetime) -> datetime:
+    # Las fechas se guardan sin zona horaria, en UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 class ReservaFilterParams(BaseModel):
     """Parámetros para filtrar reservas."""
 
     limit: int = Field(100, gt=0, le=100)
     offset: int = Field(0, ge=0)
+    cursor: str | None = Field(None, description="Cursor de X-Next-Cursor")
     order_by: Literal["fecha_creacion", "fecha_inicio"] = "fecha_inicio"
     status: Literal["pending", "confirmed", "cancelled"] | None = None
     id_laboratorio: int | None = None
@@ -18,8 +29,14 @@ class HorarioClaseFilterParams(BaseModel):
 
     limit: int = Field(100, gt=0, le=100)
     offset: int = Field(0, ge=0)
+    cursor: str | None = Field(None, description="Cursor de X-Next-Cursor")
     order_by: Literal["nombre_materia"] = "nombre_materia"
-    nombre_materia: str | None = None
+    nombre_materia: str | None = Field(
+        None, description="Texto contenido en la materia"
+    )
+    q: str | None = Field(
+        None, min_length=1, description="Búsqueda por relevancia (ignora order_by)"
+    )
     id_usuario: int | None = None
 
 
@@ -34,3 +51,43 @@ class SesionClaseFilterParams(BaseModel):
     id_horario_clase: int | None = None
     estado: EstadoSesion | None = None
 
+
+
+class DisponibilidadParams(BaseModel):
+    """Parámetros para consultar la disponibilidad de un laboratorio."""
+
+    desde: datetime
+    hasta: datetime
+    duracion_minima: int = Field(0, ge=0, description="Duración mínima en minutos")
+
+    @field_validator("desde", "hasta")
+    @classmethod
+    def to_naive_utc(cls, value: datetime) -> datetime:
+        return naive_utc(value)
+
+
+class ReservaExportParams(BaseModel):
+    """Parámetros de GET /export."""
+
+    formato: Literal["ndjson", "csv"] = "ndjson"
+    desde: datetime | None = Field(None, description="Reservas que empiezan desde")
+    hasta: datetime | None = Field(None, description="Reservas que empiezan antes de")
+    id_ubicacion: int | None = None
+    status: str | None = None
+
+    @field_validator("desde", "hasta")
+    @classmethod
+    def to_naive_utc(cls, value: datetime | None) -> datetime | None:
+        return value and naive_utc(value)
+
+
+class OcupacionParams(BaseModel):
+    """Parámetros de GET /stats/ocupacion."""
+
+    periodo: Periodo = Periodo.semana
+    desde: date | None = None
+    hasta: date | None = None
+    id_ubicacion: int | None = None
+    status: str = Field(
+        StatusReserva.COMPLETED, description="Estado de las reservas a contar"
+    )
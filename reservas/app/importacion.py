@@ -0,0 +1,203 @@
+"""Importación masiva de horarios de clase con sus sesiones.
+
+Los horarios llegan como array JSON (``HorarioClaseCreate``) o como CSV con
+una fila por sesión y cabecera::
+
+    nombre_materia,id_usuario,dia_semana,hora_inicio,hora_fin,id_ubicacion,estado
+
+Las filas con la misma ``nombre_materia`` e ``id_usuario`` forman un horario;
+``estado`` es opcional.
+
+Antes de insertar se buscan los choques entre sesiones activas: las nuevas
+entre sí y con las que ya existen. Por cada ``(id_ubicacion, dia_semana)`` se
+ordenan los intervalos por hora de inicio y se recorren una vez llevando el
+que termina más tarde; un intervalo que empieza antes de ese final choca con
+él. Así cada sesión en conflicto aparece en algún choque con un coste
+O(n log n), sin comparar todas las parejas.
+"""
+
+import csv
+import io
+import os
+from collections import defaultdict
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
+
+from app.models.horario_clase import (
+    ConflictoSesion,
+    EstadoSesion,
+    HorarioClase,
+    HorarioClaseCreate,
+    HorarioClaseReadWithSesiones,
+    SesionClase,
+    SesionClaseRead,
+)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+
+def lotes(filas: list, size: int = IMPORT_BATCH_SIZE):
+    for inicio in range(0, len(filas), size):
+        yield filas[inicio : inicio + size]
+
+
+def leer_json(data) -> list[dict]:
+    if not isinstance(data, list):
+        raise ValueError("Se esperaba un array JSON")
+    return data
+
+
+def leer_csv(texto: str) -> list[dict]:
+    """Agrupar las filas del CSV (una por sesión) en horarios."""
+    horarios: dict[tuple[str, str], dict] = {}
+    for fila in csv.DictReader(io.StringIO(texto)):
+        fila = {k.strip(): (v or "").strip() for k, v in fila.items() if k}
+        clave = (fila.pop("nombre_materia", ""), fila.pop("id_usuario", ""))
+        if not fila.get("estado"):
+            fila.pop("estado", None)
+        horario = horarios.setdefault(
+            clave,
+            {"nombre_materia": clave[0], "id_usuario": clave[1], "sesiones": []},
+        )
+        horario["sesiones"].append(fila)
+    return list(horarios.values())
+
+
+def validar(filas: list[dict]) -> tuple[list[HorarioClaseCreate], list[dict]]:
+    """Validar cada horario; los errores llevan su posición (``index``)."""
+    horarios, errores = [], []
+    for index, fila in enumerate(filas):
+        try:
+            horario = HorarioClaseCreate.model_validate(fila)
+        except ValidationError as e:
+            msg = "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in e.errors()
+            )
+            errores.append({"index": index, "msg": msg})
+            continue
+        for n, sesion in enumerate(horario.sesiones):
+            if sesion.hora_fin <= sesion.hora_inicio:
+                errores.append(
+                    {
+                        "index": index,
+                        "msg": f"Sesión {n}: 'hora_fin' debe ser posterior a "
+                        "'hora_inicio'",
+                    }
+                )
+        horarios.append(horario)
+    return horarios, errores
+
+
+def barrido(intervalos: list[tuple]) -> list[tuple]:
+    """Parejas de intervalos ``(inicio, fin, ref)`` que se solapan.
+
+    Cada intervalo que choca con alguno anterior se empareja con el que, de
+    los anteriores, termina más tarde.
+    """
+    choques = []
+    abierto = None
+    for intervalo in sorted(intervalos, key=lambda i: (i[0], i[1])):
+        if abierto is not None and intervalo[0] < abierto[1]:
+            choques.append((intervalo, abierto))
+        if abierto is None or intervalo[1] > abierto[1]:
+            abierto = intervalo
+    return choques
+
+
+def buscar_conflictos(
+    session: Session, horarios: list[HorarioClaseCreate]
+) -> list[ConflictoSesion]:
+    grupos: dict[tuple, list[tuple]] = defaultdict(list)
+    for h, horario in enumerate(horarios):
+        for s, sesion in enumerate(horario.sesiones):
+            if sesion.estado == EstadoSesion.activa:
+                grupos[sesion.id_ubicacion, sesion.dia_semana].append(
+                    (sesion.hora_inicio, sesion.hora_fin, (h, s))
+                )
+    if not grupos:
+        return []
+
+    # Las sesiones existentes de los laboratorios afectados, en una consulta
+    existentes = session.exec(
+        select(
+            SesionClase.id,
+            SesionClase.id_ubicacion,
+            SesionClase.dia_semana,
+            SesionClase.hora_inicio,
+            SesionClase.hora_fin,
+        ).where(
+            col(SesionClase.id_ubicacion).in_({clave[0] for clave in grupos}),
+            SesionClase.estado == EstadoSesion.activa,
+        )
+    )
+    for id, id_ubicacion, dia_semana, hora_inicio, hora_fin in existentes:
+        if (id_ubicacion, dia_semana) in grupos:
+            grupos[id_ubicacion, dia_semana].append((hora_inicio, hora_fin, id))
+
+    conflictos = []
+    for (id_ubicacion, dia_semana), intervalos in grupos.items():
+        for nueva, otra in barrido(intervalos):
+            if isinstance(nueva[2], int):
+                # La existente va siempre en ``con_id``
+                nueva, otra = otra, nueva
+            if isinstance(nueva[2], int):
+                # Choque entre dos sesiones existentes: no es de esta importación
+                continue
+            conflicto = ConflictoSesion(
+                horario=nueva[2][0],
+                sesion=nueva[2][1],
+                id_ubicacion=id_ubicacion,
+                dia_semana=dia_semana,
+                hora_inicio=nueva[0],
+                hora_fin=nueva[1],
+            )
+            if isinstance(otra[2], int):
+                conflicto.con_id = otra[2]
+            else:
+                conflicto.con_horario, conflicto.con_sesion = otra[2]
+            conflictos.append(conflicto)
+    return sorted(conflictos, key=lambda c: (c.horario, c.sesion))
+
+
+def insertar(
+    session: Session, horarios: list[HorarioClaseCreate]
+) -> list[HorarioClaseReadWithSesiones]:
+    """Insertar los horarios y sus sesiones por lotes, sin hacer commit."""
+    creados = []
+    for lote in lotes(horarios):
+        ids = session.scalars(
+            insert(HorarioClase).returning(
+                HorarioClase.id, sort_by_parameter_order=True
+            ),
+            [horario.model_dump(exclude={"sesiones"}) for horario in lote],
+        ).all()
+        sesiones = [
+            {**sesion.model_dump(), "id_horario_clase": id}
+            for id, horario in zip(ids, lote)
+            for sesion in horario.sesiones
+        ]
+        filas = []
+        for lote_sesiones in lotes(sesiones):
+            filas += session.execute(
+                insert(SesionClase).returning(
+                    *SesionClase.__table__.c, sort_by_parameter_order=True
+                ),
+                lote_sesiones,
+            ).all()
+        por_horario = defaultdict(list)
+        for fila in filas:
+            por_horario[fila.id_horario_clase].append(
+                SesionClaseRead.model_validate(fila._asdict())
+            )
+        creados += [
+            HorarioClaseReadWithSesiones(
+                **horario.model_dump(exclude={"sesiones"}),
+                id=id,
+                sesiones=por_horario[id],
+            )
+            for id, horario in zip(ids, lote)
+        ]
+    return creados
@@ -0,0 +1,532 @@
+"""Cliente HTTP compartido para consultar equipos en el servicio de laboratorios.
+
+Se mantiene un único ``httpx.Client`` con pool de conexiones por proceso para
+reutilizar las conexiones TCP entre peticiones. Los equipos se piden en lotes
+a ``GET /equipos/batch`` y, si hay más de un lote, estos se reparten en un
+pool de hilos acotado.
+
+Los detalles obtenidos se guardan en una caché local por ``id_equipo``. Si
+varias peticiones necesitan a la vez un mismo equipo que no está en caché,
+solo una lo pide al servicio de laboratorios y el resto espera su resultado.
+Con ``EQUIPOS_CACHE_STALE_SECONDS > 0`` las entradas caducadas se siguen
+sirviendo durante ese tiempo mientras se revalidan en segundo plano (como
+mucho una revalidación pendiente por equipo), de modo que un servicio de
+laboratorios lento o caído no bloquea las respuestas.
+
+Política ante fallos:
+
+- Cada llamada a ``fetch_equipos`` tiene un plazo total
+  (``LABS_DEADLINE_SECONDS``) que acota los timeouts de sus peticiones, la
+  espera por las que comparte con otras llamadas y la respuesta entera: cada
+  intento se espera como mucho hasta el plazo y deja de leer el cuerpo en
+  cuanto se agota, aunque el servidor lo envíe poco a poco.
+- Los equipos que el servicio no devuelve (no existen) se omiten. Los de un
+  lote que no se pudo obtener (plazo agotado, error de red, respuesta 5xx o
+  circuito abierto) se devuelven degradados, solo con su ``id``, y no se
+  guardan en la caché.
+- Tras ``LABS_BREAKER_FAILURES`` fallos seguidos el circuit breaker se abre:
+  durante ``LABS_BREAKER_RESET_SECONDS`` no se llama al servicio y las
+  respuestas salen al momento con lo que haya en la caché y el resto
+  degradado, sin programar revalidaciones. Después se deja pasar una
+  petición de prueba.
+- Con ``LABS_HEDGE_PERCENTILE`` (p. ej. 95) un lote que tarda más que ese
+  percentil de las últimas respuestas se vuelve a pedir en paralelo y se usa
+  la primera respuesta; recorta la cola de latencia a costa de algunas
+  peticiones extra. Desactivado por defecto.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from time import monotonic, perf_counter
+from typing import Iterable
+
+import httpx
+
+from app import metrics
+from app.cache import TTLCache
+from app.resilience import (
+    HEDGED_REQUESTS,
+    CircuitBreaker,
+    LatencyWindow,
+    UpstreamUnavailable,
+)
+
+LABS_URL = os.getenv("LABS_URL", "http://34.75.34.76/api/laboratorios/equipos/")
+
+# Máximo de equipos por petición (coincide con el límite del servicio)
+BATCH_SIZE = 100
+# Máximo de peticiones simultáneas al servicio de laboratorios
+MAX_CONCURRENCY = 10
+# Tiempo máximo por petición (segundos), también limitado por el plazo
+HTTP_TIMEOUT = httpx.Timeout(2.0, connect=1.0)
+
+# Plazo total de cada llamada a fetch_equipos (segundos)
+LABS_DEADLINE_SECONDS = float(os.getenv("LABS_DEADLINE_SECONDS", "1.5"))
+LABS_BREAKER_FAILURES = int(os.getenv("LABS_BREAKER_FAILURES", "5"))
+LABS_BREAKER_RESET_SECONDS = float(os.getenv("LABS_BREAKER_RESET_SECONDS", "30"))
+# Percentil de latencia tras el que se repite un lote; 0 lo desactiva
+LABS_HEDGE_PERCENTILE = float(os.getenv("LABS_HEDGE_PERCENTILE", "0"))
+
+EQUIPOS_CACHE_TTL_SECONDS = float(os.getenv("EQUIPOS_CACHE_TTL_SECONDS", "60"))
+EQUIPOS_CACHE_STALE_SECONDS = float(os.getenv("EQUIPOS_CACHE_STALE_SECONDS", "600"))
+EQUIPOS_CACHE_MAX_ENTRIES = int(os.getenv("EQUIPOS_CACHE_MAX_ENTRIES", "5000"))
+
+cache = TTLCache(
+    EQUIPOS_CACHE_MAX_ENTRIES, EQUIPOS_CACHE_TTL_SECONDS, EQUIPOS_CACHE_STALE_SECONDS
+)
+breaker = CircuitBreaker(
+    "laboratorios", LABS_BREAKER_FAILURES, LABS_BREAKER_RESET_SECONDS
+)
+latencias = LatencyWindow()
+
+# Errores de una petición que cuentan como fallo del servicio (ValueError:
+# cuerpo que no es JSON)
+FALLOS = (httpx.HTTPError, ValueError, UpstreamUnavailable)
+
+_client = httpx.Client(
+    timeout=HTTP_TIMEOUT,
+    transport=metrics.InstrumentedTransport(
+        httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=MAX_CONCURRENCY,
+                max_keepalive_connections=MAX_CONCURRENCY,
+            )
+        )
+    ),
+)
+_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENCY, thread_name_prefix="laboratorios"
+)
+# Cada intento corre en su propio pool y quien lo lanza lo espera como mucho
+# hasta el plazo (los timeouts de httpx se aplican a cada lectura, no a la
+# petición entera). ``fetch_lote`` puede correr dentro de ``_executor`` y no
+# debe esperar a sus propios hilos
+_attempt_executor = ThreadPoolExecutor(
+    max_workers=2 * MAX_CONCURRENCY, thread_name_prefix="laboratorios-intento"
+)
+# Las revalidaciones van en su propio hilo para no competir con (ni esperar
+# a) los lotes que se reparten en ``_executor``
+_revalidation_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="laboratorios-revalidacion"
+)
+
+# Ids con una revalidación en cola o en curso: no se vuelven a encolar hasta
+# que termine, así que la cola de ``_revalidation_executor`` no crece con el
+# número de peticiones que ven el mismo equipo obsoleto
+_revalidando: set[int] = set()
+_revalidando_lock = threading.Lock()
+
+# Peticiones en curso por id de equipo, para compartir su resultado
+_inflight: dict[int, Future] = {}
+_inflight_lock = threading.Lock()
+
+# Equivalentes para el modo asíncrono (DB_ASYNC), que corre en un único bucle
+# de eventos y por tanto no necesita locks
+_async_client: httpx.AsyncClient | None = None
+_async_inflight: dict[int, asyncio.Future] = {}
+_async_semaphore: asyncio.Semaphore | None = None
+_revalidation_tasks: set[asyncio.Task] = set()
+_async_revalidando: set[int] = set()
+
+
+def degradado(id_equipo: int) -> dict:
+    """Equipo cuyo detalle no se pudo obtener: solo su id."""
+    return {"id": id_equipo}
+
+
+def plazo() -> float:
+    return monotonic() + LABS_DEADLINE_SECONDS
+
+
+def _restante(deadline: float) -> float:
+    return max(0.0, deadline - monotonic())
+
+
+def _timeout(deadline: float) -> httpx.Timeout:
+    restante = _restante(deadline)
+    if not restante:
+        raise UpstreamUnavailable("Plazo agotado")
+    return httpx.Timeout(
+        min(HTTP_TIMEOUT.read, restante), connect=min(HTTP_TIMEOUT.connect, restante)
+    )
+
+
+def _retraso_hedge() -> float | None:
+    """Espera antes de repetir un lote, o ``None`` sin hedging."""
+    if not LABS_HEDGE_PERCENTILE:
+        return None
+    return latencias.percentile(LABS_HEDGE_PERCENTILE)
+
+
+def _leer_respuesta(status_code: int, contenido: bytes) -> list[dict]:
+    if status_code >= 500:
+        raise UpstreamUnavailable(f"Respuesta {status_code}")
+    # Otras respuestas (p. ej. 422) no indican un fallo del servicio
+    return json.loads(contenido) if status_code == 200 else []
+
+
+def _leer_hasta(r: httpx.Response, deadline: float) -> bytes:
+    """Leer el cuerpo por trozos, abandonando la lectura si se agota el plazo."""
+    contenido = bytearray()
+    for chunk in r.iter_bytes():
+        if not _restante(deadline):
+            raise UpstreamUnavailable("Plazo agotado")
+        contenido += chunk
+    return bytes(contenido)
+
+
+def _intento(ids: list[int], deadline: float) -> list[dict]:
+    """Una petición de un lote; lanza uno de ``FALLOS`` si no se obtiene."""
+    timeout = _timeout(deadline)
+    # El intento puede seguir en curso después de que su llamada lo abandone:
+    # el resultado se anota en el mismo breaker que lo dejó pasar
+    circuito = breaker
+    if not circuito.allow():
+        raise UpstreamUnavailable("Circuito abierto")
+    start = perf_counter()
+    try:
+        with _client.stream(
+            "GET",
+            f"{LABS_URL}batch",
+            params={"ids": ",".join(str(id) for id in ids)},
+            timeout=timeout,
+        ) as r:
+            contenido = _leer_hasta(r, deadline) if r.status_code == 200 else b""
+        equipos = _leer_respuesta(r.status_code, contenido)
+    except FALLOS:
+        circuito.record_failure()
+        raise
+    circuito.record_success()
+    latencias.observe(perf_counter() - start)
+    return equipos
+
+
+def _intento_con_plazo(ids: list[int], deadline: float) -> list[dict]:
+    """``_intento`` en ``_attempt_executor``, esperándolo como mucho hasta el plazo.
+
+    Un servidor que envía el cuerpo poco a poco no agota el timeout de lectura
+    de httpx; el hilo del intento lo detecta en el siguiente trozo.
+    """
+    intento = _attempt_executor.submit(_intento, ids, deadline)
+    try:
+        return intento.result(timeout=_restante(deadline))
+    except FutureTimeoutError:
+        raise UpstreamUnavailable("Plazo agotado")
+
+
+def _intento_hedged(ids: list[int], deadline: float, retraso: float) -> list[dict]:
+    intentos = [_attempt_executor.submit(_intento, ids, deadline)]
+    hechos, _ = wait(intentos, timeout=min(retraso, _restante(deadline)))
+    if not hechos:
+        HEDGED_REQUESTS.labels(breaker.name).inc()
+        intentos.append(_attempt_executor.submit(_intento, ids, deadline))
+    error: Exception = UpstreamUnavailable("Plazo agotado")
+    try:
+        for intento in as_completed(intentos, timeout=_restante(deadline)):
+            try:
+                return intento.result()
+            except FALLOS as exc:
+                error = exc
+    except FutureTimeoutError:
+        pass
+    raise error
+
+
+def fetch_lote(ids: list[int], deadline: float) -> list[dict] | None:
+    """Obtener el detalle de un lote de equipos, o ``None`` si no se pudo."""
+    try:
+        retraso = _retraso_hedge()
+        if retraso is None:
+            return _intento_con_plazo(ids, deadline)
+        return _intento_hedged(ids, deadline, retraso)
+    except FALLOS:
+        return None
+
+
+def _fetch_upstream(ids: list[int], deadline: float) -> tuple[dict, list[int]]:
+    """Equipos obtenidos por id e ids de los lotes que no se pudieron obtener."""
+    lotes = [ids[i : i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+    if len(lotes) == 1:
+        resultados = [fetch_lote(lotes[0], deadline)]
+    else:
+        futures = [_executor.submit(fetch_lote, lote, deadline) for lote in lotes]
+        wait(futures, timeout=_restante(deadline))
+        resultados = [future.result() if future.done() else None for future in futures]
+    equipos, fallidos = {}, []
+    for lote, resultado in zip(lotes, resultados):
+        if resultado is None:
+            fallidos.extend(lote)
+        else:
+            equipos.update((equipo["id"], equipo) for equipo in resultado)
+    return equipos, fallidos
+
+
+def _load(ids: list[int], deadline: float) -> dict[int, dict]:
+    """Cargar equipos del servicio, compartiendo las peticiones ya en curso."""
+    propios, ajenos = [], {}
+    with _inflight_lock:
+        for id_equipo in ids:
+            future = _inflight.get(id_equipo)
+            if future is None:
+                _inflight[id_equipo] = Future()
+                propios.append(id_equipo)
+            else:
+                ajenos[id_equipo] = future
+
+    resultado: dict[int, dict] = {}
+    if propios:
+        try:
+            resultado, fallidos = _fetch_upstream(propios, deadline)
+            for id_equipo, equipo in resultado.items():
+                cache.set(id_equipo, equipo)
+            resultado.update((id, degradado(id)) for id in fallidos)
+        finally:
+            with _inflight_lock:
+                for id_equipo in propios:
+                    _inflight.pop(id_equipo).set_result(resultado.get(id_equipo))
+
+    if ajenos:
+        wait(ajenos.values(), timeout=_restante(deadline))
+    for id_equipo, future in ajenos.items():
+        equipo = future.result() if future.done() else degradado(id_equipo)
+        if equipo is not None:
+            resultado[id_equipo] = equipo
+    return resultado
+
+
+def _revalidar(ids: list[int]):
+    try:
+        _load(ids, plazo())
+    finally:
+        with _revalidando_lock:
+            _revalidando.difference_update(ids)
+
+
+def _programar_revalidacion(ids: list[int]):
+    """Encolar la revalidación de los ids que no tengan ya una pendiente.
+
+    Con el circuito abierto no se encola nada: el intento fallaría al momento
+    y las entradas obsoletas se siguen sirviendo.
+    """
+    if not breaker.would_allow():
+        return
+    with _revalidando_lock:
+        nuevos = [id_equipo for id_equipo in ids if id_equipo not in _revalidando]
+        _revalidando.update(nuevos)
+    if nuevos:
+        _revalidation_executor.submit(_revalidar, nuevos)
+
+
+def fetch_equipos(ids: Iterable[int]) -> dict[int, dict]:
+    """Obtener el detalle de varios equipos indexado por id.
+
+    Los ids repetidos se consultan una sola vez. Los equipos que no existen
+    no aparecen en el resultado y los que no se pudieron obtener dentro del
+    plazo aparecen degradados (``{"id": id}``).
+    """
+    deadline = plazo()
+    resultado: dict[int, dict] = {}
+    pendientes, obsoletos = [], []
+    for id_equipo in dict.fromkeys(ids):
+        entry = cache.get_entry(id_equipo)
+        if entry is None:
+            pendientes.append(id_equipo)
+            continue
+        resultado[id_equipo], fresh = entry
+        if not fresh:
+            obsoletos.append(id_equipo)
+
+    if obsoletos:
+        _programar_revalidacion(obsoletos)
+    if pendientes:
+        resultado.update(_load(pendientes, deadline))
+    return resultado
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    # Se crean de forma perezosa para quedar ligados al bucle de eventos
+    global _async_client, _async_semaphore
+    if _async_client is None:
+        _async_semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        _async_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            transport=metrics.AsyncInstrumentedTransport(
+                httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONCURRENCY,
+                        max_keepalive_connections=MAX_CONCURRENCY,
+                    )
+                )
+            ),
+        )
+    return _async_client
+
+
+async def _intento_async(ids: list[int], deadline: float) -> list[dict]:
+    """Versión asíncrona de ``_intento``."""
+    client = _get_async_client()
+    async with _async_semaphore:
+        timeout = _timeout(deadline)
+        if not breaker.allow():
+            raise UpstreamUnavailable("Circuito abierto")
+        start = perf_counter()
+        try:
+            r = await client.get(
+                f"{LABS_URL}batch",
+                params={"ids": ",".join(str(id) for id in ids)},
+                timeout=timeout,
+            )
+            equipos = _leer_respuesta(r.status_code, r.content)
+        except FALLOS:
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            # Cancelado al agotarse el plazo (fallo) o por perder el hedging
+            if _restante(deadline):
+                breaker.release()
+            else:
+                breaker.record_failure()
+            raise
+    breaker.record_success()
+    latencias.observe(perf_counter() - start)
+    return equipos
+
+
+async def _intento_hedged_async(
+    ids: list[int], deadline: float, retraso: float
+) -> list[dict]:
+    intentos = [asyncio.ensure_future(_intento_async(ids, deadline))]
+    try:
+        hechos, _ = await asyncio.wait(
+            intentos, timeout=min(retraso, _restante(deadline))
+        )
+        if not hechos:
+            HEDGED_REQUESTS.labels(breaker.name).inc()
+            intentos.append(asyncio.ensure_future(_intento_async(ids, deadline)))
+        error: Exception = UpstreamUnavailable("Plazo agotado")
+        try:
+            for intento in asyncio.as_completed(intentos, timeout=_restante(deadline)):
+                try:
+                    return await intento
+                except FALLOS as exc:
+                    error = exc
+        except asyncio.TimeoutError:
+            pass
+        raise error
+    finally:
+        for intento in intentos:
+            intento.cancel()
+
+
+async def fetch_lote_async(ids: list[int], deadline: float) -> list[dict] | None:
+    """Versión asíncrona de ``fetch_lote``."""
+    try:
+        retraso = _retraso_hedge()
+        if retraso is None:
+            return await asyncio.wait_for(
+                _intento_async(ids, deadline), _restante(deadline)
+            )
+        return await _intento_hedged_async(ids, deadline, retraso)
+    except (*FALLOS, asyncio.TimeoutError):
+        return None
+
+
+async def _load_async(ids: list[int], deadline: float) -> dict[int, dict]:
+    loop = asyncio.get_running_loop()
+    propios, ajenos = [], {}
+    for id_equipo in ids:
+        future = _async_inflight.get(id_equipo)
+        if future is None:
+            _async_inflight[id_equipo] = loop.create_future()
+            propios.append(id_equipo)
+        else:
+            ajenos[id_equipo] = future
+
+    resultado: dict[int, dict] = {}
+    if propios:
+        try:
+            lotes = [
+                propios[i : i + BATCH_SIZE] for i in range(0, len(propios), BATCH_SIZE)
+            ]
+            resultados = await asyncio.gather(
+                *(fetch_lote_async(lote, deadline) for lote in lotes)
+            )
+            for lote, equipos in zip(lotes, resultados):
+                if equipos is None:
+                    resultado.update((id, degradado(id)) for id in lote)
+                    continue
+                for equipo in equipos:
+                    resultado[equipo["id"]] = equipo
+                    cache.set(equipo["id"], equipo)
+        finally:
+            for id_equipo in propios:
+                _async_inflight.pop(id_equipo).set_result(resultado.get(id_equipo))
+
+    if ajenos:
+        await asyncio.wait(ajenos.values(), timeout=_restante(deadline))
+    for id_equipo, future in ajenos.items():
+        equipo = future.result() if future.done() else degradado(id_equipo)
+        if equipo is not None:
+            resultado[id_equipo] = equipo
+    return resultado
+
+
+async def _revalidar_async(ids: list[int]):
+    try:
+        await _load_async(ids, plazo())
+    finally:
+        _async_revalidando.difference_update(ids)
+
+
+def _programar_revalidacion_async(ids: list[int]):
+    """Versión asíncrona de ``_programar_revalidacion``."""
+    if not breaker.would_allow():
+        return
+    nuevos = [id_equipo for id_equipo in ids if id_equipo not in _async_revalidando]
+    if not nuevos:
+        return
+    _async_revalidando.update(nuevos)
+    task = asyncio.create_task(_revalidar_async(nuevos))
+    _revalidation_tasks.add(task)
+    task.add_done_callback(_revalidation_tasks.discard)
+
+
+async def fetch_equipos_async(ids: Iterable[int]) -> dict[int, dict]:
+    """Versión asíncrona de ``fetch_equipos``, con la misma caché."""
+    deadline = plazo()
+    resultado: dict[int, dict] = {}
+    pendientes, obsoletos = [], []
+    for id_equipo in dict.fromkeys(ids):
+        entry = cache.get_entry(id_equipo)
+        if entry is None:
+            pendientes.append(id_equipo)
+            continue
+        resultado[id_equipo], fresh = entry
+        if not fresh:
+            obsoletos.append(id_equipo)
+
+    if obsoletos:
+        _programar_revalidacion_async(obsoletos)
+    if pendientes:
+        resultado.update(await _load_async(pendientes, deadline))
+    return resultado
+
+
+def close():
+    """Cerrar el cliente HTTP y los pools de hilos."""
+    _client.close()
+    _executor.shutdown(wait=False)
+    _attempt_executor.shutdown(wait=False)
+    _revalidation_executor.shutdown(wait=False)
+
+
+async def aclose():
+    """Cerrar el cliente HTTP asíncrono, si se llegó a crear."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
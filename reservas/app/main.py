@@ -1,6 +1,15 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.models.reserva import Reserva, ReservaPublic, CreateReserva, ReservaUpdate
+from app.models.reserva import (
+    ConflictoSerie,
+    CreateReserva,
+    CreateSerieReserva,
+    Reserva,
+    ReservaPublic,
+    ReservaUpdate,
+)
 from app.models.horario_clase import (
     HorarioClase,
     HorarioClaseCreate,
@@ -15,19 +24,51 @@ from app.models.horario_clase import (
     EstadoSesion,
 
 )
-from app.db import create_db_and_tables, get_session
+from app import stats
+from app.db import (
+    DB_ASYNC,
+    async_engine,
+    create_db_and_tables,
+    engine,
+    get_async_session,
+    get_pool_stats,
+    get_session,
+)
+from app import metrics
 from app.filters import (
     ReservaFilterParams,
     HorarioClaseFilterParams,
+    DisponibilidadParams,
+    OcupacionParams,
+    ReservaExportParams,
 )
+from app.models.estadisticas import OcupacionPeriodo
+from app.models.disponibilidad import (
+    DisponibilidadPublic,
+    IntervaloLibre,
+    IntervaloOcupado,
+)
+from app.disponibilidad import indice_ocupacion, intervalos_libres
 from app.models.equipos_reserva import EquiposReservaBase
-from app.constants import StatusReserva
-from sqlmodel import select
+from app.constants import StatusReserva, MAX_RANGO_DISPONIBILIDAD
+from app import exportacion, importacion, laboratorios_client
+from app.series import conflictos_query, expandir_serie
+from app.pagination import apply_cursor, set_next_cursor
+from app.responses import json_response
+from app.search import buscar, coincide
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlmodel import col, select
 from typing import Annotated, List
 from sqlmodel import Session
-import httpx
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
 
 # Agrega root_path para que FastAPI sepa que está detrás de un prefijo en el Ingress
@@ -41,10 +82,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Antes de las rutas, para que /metrics no quede tapada por rutas como /{id}
+metrics.instrument(app, engine, async_engine)
+
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    if stats.RESUMEN_OCUPACION:
+        with Session(engine) as session:
+            stats.reconstruir_resumen(session, solo_si_vacio=True)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    laboratorios_client.close()
+    await laboratorios_client.aclose()
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Contadores de la caché local de equipos."""
+    return laboratorios_client.cache.stats()
+
+
+@app.get("/db/pool")
+def get_db_pool():
+    """Conexiones en uso y tiempos de espera del pool de la base de datos."""
+    return get_pool_stats()
 
 
 # @app.get("/")
@@ -55,79 +120,290 @@ def on_startup():
 # --- CRUD para Reservas ---
 
 
-@app.get("/", response_model=list[ReservaPublic])
-def get_reservas(
-    session: SessionDep, filter_query: Annotated[ReservaFilterParams, Depends()]
-):
-    """Obtener listado de reservas con paginación y filtrado."""
-    query = (
-        select(Reserva)
-        .order_by(getattr(Reserva, filter_query.order_by))
-        .offset(filter_query.offset)
-        .limit(filter_query.limit)
+def equipos_por_reserva_query(reserva_ids: list[int]):
+    return select(EquiposReservaBase.id_reserva, EquiposReservaBase.id_equipo).where(
+        col(EquiposReservaBase.id_reserva).in_(reserva_ids)
+    )
+
+
+def agrupar_equipos(reserva_ids: list[int], filas) -> dict[int, list[int]]:
+    equipos_por_reserva: dict[int, list[int]] = {id: [] for id in reserva_ids}
+    for id_reserva, id_equipo in filas:
+        equipos_por_reserva[id_reserva].append(id_equipo)
+    return equipos_por_reserva
+
+
+def get_equipos_por_reserva(
+    session: Session, reserva_ids: list[int]
+) -> dict[int, list[int]]:
+    """Obtener los ids de equipos de varias reservas con una sola consulta."""
+    if not reserva_ids:
+        return {}
+    filas = session.exec(equipos_por_reserva_query(reserva_ids)).all()
+    return agrupar_equipos(reserva_ids, filas)
+
+
+async def get_equipos_por_reserva_async(
+    session: AsyncSession, reserva_ids: list[int]
+) -> dict[int, list[int]]:
+    if not reserva_ids:
+        return {}
+    filas = (await session.exec(equipos_por_reserva_query(reserva_ids))).all()
+    return agrupar_equipos(reserva_ids, filas)
+
+
+CAMPOS_RESERVA = tuple(
+    campo for campo in ReservaPublic.model_fields if campo != "equipos"
+)
+
+
+def reserva_dict(reserva: Reserva, equipos: list) -> dict:
+    """Respuesta de una reserva (``ReservaPublic``) como diccionario.
+
+    Se lee directamente de los atributos de la reserva para serializarla una
+    sola vez con ``json_response``, sin construir modelos intermedios.
+    """
+    datos = {campo: getattr(reserva, campo) for campo in CAMPOS_RESERVA}
+    datos["equipos"] = equipos
+    return datos
+
+
+def build_reserva_public(
+    reserva: Reserva, equipos_ids: list[int], detalles: dict[int, dict]
+) -> dict:
+    """Construir la respuesta de una reserva con el detalle de sus equipos.
+
+    Los equipos que no están en ``detalles`` (no existen en el servicio de
+    laboratorios) se omiten; si el servicio no respondió, ``detalles`` trae
+    solo su id.
+    """
+    return reserva_dict(
+        reserva,
+        [detalles[id_equipo] for id_equipo in equipos_ids if id_equipo in detalles],
     )
 
+
+def find_colision(
+    session: Session,
+    id_ubicacion: int,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    exclude_id: int | None = None,
+) -> Reserva | None:
+    """Buscar una reserva completada que se solape con el rango dado."""
+    query = select(Reserva).where(
+        Reserva.id_ubicacion == id_ubicacion,
+        Reserva.status == StatusReserva.COMPLETED,
+        Reserva.fecha_inicio < fecha_fin,
+        Reserva.fecha_fin > fecha_inicio,
+    )
+    if exclude_id is not None:
+        query = query.where(Reserva.id != exclude_id)
+    return session.exec(query).first()
+
+
+@contextmanager
+def rechazar_solapamiento(session: Session):
+    """Traducir la violación de la restricción de exclusión en un 409."""
+    try:
+        yield
+    except IntegrityError as e:
+        session.rollback()
+        if "ex_reserva_ubicacion_solapada" in str(e.orig):
+            raise HTTPException(
+                status_code=409,
+                detail="Ya existe una reserva para ese laboratorio y rango de fechas.",
+            )
+        raise
+
+
+def reservas_orden(filter_query: ReservaFilterParams) -> tuple:
+    return getattr(Reserva, filter_query.order_by), Reserva.id
+
+
+def reservas_query(filter_query: ReservaFilterParams):
+    query = apply_cursor(
+        select(Reserva), filter_query.cursor, *reservas_orden(filter_query)
+    ).limit(filter_query.limit)
+    if not filter_query.cursor:
+        query = query.offset(filter_query.offset)
+
     # Aplicar filtros
     if filter_query.status:
         query = query.where(Reserva.status == filter_query.status)
     if filter_query.id_laboratorio:
         query = query.where(Reserva.id_ubicacion == filter_query.id_laboratorio)
+    return query
 
-    reservas = session.exec(query).all()
 
-    # Obtener equipos para cada reserva y sus detalles
-    reservas_public = []
-    LABS_URL = "http://34.75.34.76/api/laboratorios/equipos/"  # Ajusta el puerto/host si es necesario
-    for reserva in reservas:
-        equipos_ids = session.exec(
-            select(EquiposReservaBase.id_equipo).where(
-                EquiposReservaBase.id_reserva == reserva.id
-            )
-        ).all()
-        equipos_detalles = []
-        for id_equipo in equipos_ids:
-            try:
-                with httpx.Client() as client:
-                    r = client.get(f"{LABS_URL}{id_equipo}")
-                    if r.status_code == 200:
-                        equipos_detalles.append(r.json())
-            except Exception:
-                pass
-        reserva_dict = (
-            reserva.model_dump() if hasattr(reserva, "model_dump") else reserva.dict()
+def get_reservas(
+    response: Response,
+    session: SessionDep,
+    filter_query: Annotated[ReservaFilterParams, Depends()],
+):
+    """Obtener listado de reservas con paginación y filtrado."""
+    reservas = session.exec(reservas_query(filter_query)).all()
+    set_next_cursor(
+        response, reservas, filter_query.limit, *reservas_orden(filter_query)
+    )
+
+    # Obtener los equipos de toda la página en una sola consulta y sus
+    # detalles con una única ronda de peticiones concurrentes
+    equipos_por_reserva = get_equipos_por_reserva(
+        session, [reserva.id for reserva in reservas]
+    )
+    detalles = laboratorios_client.fetch_equipos(
+        id_equipo for ids in equipos_por_reserva.values() for id_equipo in ids
+    )
+    return json_response(
+        [
+            build_reserva_public(reserva, equipos_por_reserva[reserva.id], detalles)
+            for reserva in reservas
+        ],
+        response,
+    )
+
+
+async def get_reservas_async(
+    response: Response,
+    session: AsyncSessionDep,
+    filter_query: Annotated[ReservaFilterParams, Depends()],
+):
+    """Obtener listado de reservas con paginación y filtrado."""
+    reservas = (await session.exec(reservas_query(filter_query))).all()
+    set_next_cursor(
+        response, reservas, filter_query.limit, *reservas_orden(filter_query)
+    )
+    equipos_por_reserva = await get_equipos_por_reserva_async(
+        session, [reserva.id for reserva in reservas]
+    )
+    detalles = await laboratorios_client.fetch_equipos_async(
+        id_equipo for ids in equipos_por_reserva.values() for id_equipo in ids
+    )
+    return json_response(
+        [
+            build_reserva_public(reserva, equipos_por_reserva[reserva.id], detalles)
+            for reserva in reservas
+        ],
+        response,
+    )
+
+
+app.get("/", response_model=list[ReservaPublic])(
+    get_reservas_async if DB_ASYNC else get_reservas
+)
+
+
+@app.get("/disponibilidad/{id_ubicacion}", response_model=DisponibilidadPublic)
+def get_disponibilidad(
+    id_ubicacion: int,
+    session: SessionDep,
+    params: Annotated[DisponibilidadParams, Depends()],
+):
+    """Obtener los intervalos libres y ocupados de un laboratorio en un rango."""
+    if params.hasta <= params.desde:
+        raise HTTPException(
+            status_code=422, detail="'hasta' debe ser posterior a 'desde'"
+        )
+    if params.hasta - params.desde > MAX_RANGO_DISPONIBILIDAD:
+        raise HTTPException(
+            status_code=422,
+            detail="El rango de disponibilidad no puede superar los 31 días",
+        )
+    ocupados = indice_ocupacion.ocupados(
+        session, id_ubicacion, params.desde, params.hasta
+    )
+    libres = intervalos_libres(
+        ocupados,
+        params.desde,
+        params.hasta,
+        timedelta(minutes=params.duracion_minima),
+    )
+    return DisponibilidadPublic(
+        id_ubicacion=id_ubicacion,
+        desde=params.desde,
+        hasta=params.hasta,
+        libres=[IntervaloLibre(inicio=inicio, fin=fin) for inicio, fin in libres],
+        ocupados=[
+            IntervaloOcupado(inicio=inicio, fin=fin, tipo=tipo, id=id)
+            for inicio, fin, tipo, id in ocupados
+        ],
+    )
+
+
+@app.get("/stats/ocupacion", response_model=List[OcupacionPeriodo])
+def get_ocupacion(params: Annotated[OcupacionParams, Depends()], session: SessionDep):
+    """Horas reservadas y número de reservas por laboratorio y semana o mes."""
+    if params.desde and params.hasta and params.hasta < params.desde:
+        raise HTTPException(
+            status_code=422, detail="'hasta' no puede ser anterior a 'desde'"
         )
-        reserva_dict["equipos"] = equipos_detalles
-        reservas_public.append(ReservaPublic(**reserva_dict))
-    return reservas_public
+    consulta = stats.resumen_query if stats.RESUMEN_OCUPACION else stats.ocupacion_query
+    return session.exec(
+        consulta(
+            params.periodo,
+            params.status,
+            params.desde,
+            params.hasta,
+            params.id_ubicacion,
+        )
+    ).all()
+
+
+@app.get("/export")
+def export_reservas(
+    params: Annotated[ReservaExportParams, Depends()], session: SessionDep
+):
+    """Todas las reservas que cumplen los filtros, como NDJSON o CSV.
+
+    A diferencia de ``GET /`` no hay límite de filas ni se consulta el
+    servicio de laboratorios: cada reserva lleva solo los ids de sus equipos.
+    Las filas se envían a medida que se leen de la base de datos (ver
+    ``app.exportacion``).
+    """
+    if params.desde and params.hasta and params.hasta <= params.desde:
+        raise HTTPException(
+            status_code=422, detail="'hasta' debe ser posterior a 'desde'"
+        )
+    lotes = session.exec(exportacion.export_query(params)).partitions()
+    if params.formato == "csv":
+        return StreamingResponse(
+            exportacion.iter_csv(lotes),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="reservas.csv"'},
+        )
+    return StreamingResponse(
+        exportacion.iter_ndjson(lotes), media_type="application/x-ndjson"
+    )
 
 
-@app.get("/{reserva_id}", response_model=ReservaPublic)
 def read_reserva(reserva_id: int, session: SessionDep):
     """Obtener una reserva por su ID."""
     reserva = session.get(Reserva, reserva_id)
     if not reserva:
         raise HTTPException(status_code=404, detail="Reserva no encontrada")
 
-    equipos_ids = session.exec(
-        select(EquiposReservaBase.id_equipo).where(
-            EquiposReservaBase.id_reserva == reserva.id
-        )
-    ).all()
-    equipos_detalles = []
-    LABS_URL = "http://34.75.34.76/api/laboratorios/equipos/"
-    for id_equipo in equipos_ids:
-        try:
-            with httpx.Client() as client:
-                r = client.get(f"{LABS_URL}{id_equipo}")
-                if r.status_code == 200:
-                    equipos_detalles.append(r.json())
-        except Exception:
-            pass
-    reserva_dict = (
-        reserva.model_dump() if hasattr(reserva, "model_dump") else reserva.dict()
-    )
-    reserva_dict["equipos"] = equipos_detalles
-    return ReservaPublic(**reserva_dict)
+    equipos_ids = get_equipos_por_reserva(session, [reserva.id])[reserva.id]
+    detalles = laboratorios_client.fetch_equipos(equipos_ids)
+    return json_response(build_reserva_public(reserva, equipos_ids, detalles))
+
+
+async def read_reserva_async(reserva_id: int, session: AsyncSessionDep):
+    """Obtener una reserva por su ID."""
+    reserva = await session.get(Reserva, reserva_id)
+    if not reserva:
+        raise HTTPException(status_code=404, detail="Reserva no encontrada")
+
+    equipos_ids = (await get_equipos_por_reserva_async(session, [reserva.id]))[
+        reserva.id
+    ]
+    detalles = await laboratorios_client.fetch_equipos_async(equipos_ids)
+    return json_response(build_reserva_public(reserva, equipos_ids, detalles))
+
+
+app.get("/{reserva_id}", response_model=ReservaPublic)(
+    read_reserva_async if DB_ASYNC else read_reserva
+)
 
 
 @app.post("/", response_model=ReservaPublic)
@@ -162,48 +438,89 @@ def create_reserva(reserva: CreateReserva, session: SessionDep):
             )
 
     # Revisar colisiones entre reservas
-    colision = session.exec(
-        select(Reserva).where(
-            Reserva.id_ubicacion == reserva.id_ubicacion,
-            Reserva.status == StatusReserva.COMPLETED,
-            Reserva.fecha_inicio < reserva.fecha_fin,
-            Reserva.fecha_fin > reserva.fecha_inicio,
-        )
-    ).first()
+    colision = find_colision(
+        session, reserva.id_ubicacion, reserva.fecha_inicio, reserva.fecha_fin
+    )
     if colision:
         raise HTTPException(
             status_code=409,
             detail="Ya existe una reserva para ese laboratorio y rango de fechas.",
         )
 
+    # La reserva y sus equipos se guardan en una sola transacción; en Postgres
+    # la restricción de exclusión rechaza un solapamiento concurrente
     db_reserva = Reserva.model_validate(reserva)
-    session.add(db_reserva)
-    session.commit()
-    session.refresh(db_reserva)
-
-    # Guardar equipos asociados a la reserva
     equipos_ids = reserva.equipos or []
-    for id_equipo in equipos_ids:
-        if db_reserva.id:
-            equipo_reserva = EquiposReservaBase(
-                id_reserva=db_reserva.id, id_equipo=id_equipo
+    with rechazar_solapamiento(session):
+        session.add(db_reserva)
+        session.flush()
+        for id_equipo in equipos_ids:
+            session.add(
+                EquiposReservaBase(id_reserva=db_reserva.id, id_equipo=id_equipo)
             )
-            session.add(equipo_reserva)
-    session.commit()
-
-    # Obtener equipos para la respuesta
-    equipos = session.exec(
-        select(EquiposReservaBase.id_equipo).where(
-            EquiposReservaBase.id_reserva == db_reserva.id
+        stats.registrar_reserva(session, db_reserva)
+        session.commit()
+    session.refresh(db_reserva)
+    indice_ocupacion.update_reserva(db_reserva)
+
+    return json_response(reserva_dict(db_reserva, equipos_ids))
+
+
+@app.post("/series", response_model=List[ReservaPublic])
+def create_serie_reservas(serie: CreateSerieReserva, session: SessionDep):
+    """Crear todas las reservas de una serie, o ninguna si alguna choca.
+
+    Los choques de todas las ocurrencias se buscan con una sola consulta. Si
+    hay alguno se responde 409 con la lista de ocurrencias en conflicto.
+    """
+    try:
+        ocurrencias = expandir_serie(serie)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    conflictos = session.exec(conflictos_query(serie.id_ubicacion, ocurrencias))
+    conflictos = [
+        ConflictoSerie(
+            indice=indice,
+            fecha_inicio=ocurrencias[indice][0],
+            fecha_fin=ocurrencias[indice][1],
+            tipo=tipo,
+            id=id,
         )
-    ).all()
-    reserva_dict = (
-        db_reserva.model_dump()
-        if hasattr(db_reserva, "model_dump")
-        else db_reserva.dict()
-    )
-    reserva_dict["equipos"] = equipos
-    return ReservaPublic(**reserva_dict)
+        for indice, tipo, id in conflictos
+    ]
+    if conflictos:
+        raise HTTPException(status_code=409, detail=jsonable_encoder(conflictos))
+
+    # Todas las reservas y sus equipos se insertan en la misma transacción
+    datos = serie.model_dump(include=set(Reserva.model_fields) - {"id"})
+    equipos_ids = serie.equipos or []
+    with rechazar_solapamiento(session):
+        reservas = session.scalars(
+            insert(Reserva).returning(Reserva, sort_by_parameter_order=True),
+            [
+                {**datos, "fecha_inicio": inicio, "fecha_fin": fin}
+                for inicio, fin in ocurrencias
+            ],
+        ).all()
+        if equipos_ids:
+            session.execute(
+                insert(EquiposReservaBase),
+                [
+                    {"id_reserva": reserva.id, "id_equipo": id_equipo}
+                    for reserva in reservas
+                    for id_equipo in equipos_ids
+                ],
+            )
+        for reserva in reservas:
+            stats.registrar_reserva(session, reserva)
+            # Fuera de la sesión el commit no las expira ni obliga a recargarlas
+            session.expunge(reserva)
+        session.commit()
+
+    for reserva in reservas:
+        indice_ocupacion.update_reserva(reserva)
+    return json_response([reserva_dict(reserva, equipos_ids) for reserva in reservas])
 
 
 @app.patch("/{reserva_id}", response_model=ReservaPublic)
@@ -211,10 +528,25 @@ def update_reserva(reserva_id: int, reserva: ReservaUpdate, session: SessionDep)
     reserva_db = session.get(Reserva, reserva_id)
     if not reserva_db:
         raise HTTPException(status_code=404, detail="Reserva no encontrada")
-    reserva_db.status = reserva.status
-    session.add(reserva_db)
-    session.commit()
+    if reserva.status == StatusReserva.COMPLETED and find_colision(
+        session,
+        reserva_db.id_ubicacion,
+        reserva_db.fecha_inicio,
+        reserva_db.fecha_fin,
+        exclude_id=reserva_db.id,
+    ):
+        raise HTTPException(
+            status_code=409,
+            detail="Ya existe una reserva para ese laboratorio y rango de fechas.",
+        )
+    with rechazar_solapamiento(session):
+        stats.registrar_reserva(session, reserva_db, signo=-1)
+        reserva_db.status = reserva.status
+        stats.registrar_reserva(session, reserva_db)
+        session.add(reserva_db)
+        session.commit()
     session.refresh(reserva_db)
+    indice_ocupacion.update_reserva(reserva_db)
     return reserva_db
 
 # --- CRUD para HorarioClase ---
@@ -232,33 +564,82 @@ def create_horario_clase(horario_data: HorarioClaseCreate, session: SessionDep):
     session.add(db_horario)
     session.commit()
     session.refresh(db_horario)
+    for sesion in db_horario.sesiones:
+        indice_ocupacion.update_sesion(sesion)
     return db_horario
 
 
+def importar_horarios(session: Session, filas: list[dict]):
+    horarios, errores = importacion.validar(filas)
+    if errores:
+        raise HTTPException(status_code=422, detail=errores)
+    conflictos = importacion.buscar_conflictos(session, horarios)
+    if conflictos:
+        raise HTTPException(status_code=409, detail=jsonable_encoder(conflictos))
+    creados = importacion.insertar(session, horarios)
+    session.commit()
+    for horario in creados:
+        for sesion in horario.sesiones:
+            indice_ocupacion.update_sesion(sesion)
+    return creados
+
+
+@app.post(
+    "/horarios-clase/import", response_model=List[HorarioClaseReadWithSesiones]
+)
+async def import_horarios_clase(request: Request, session: SessionDep):
+    """Alta masiva de horarios de clase desde un array JSON o un CSV.
+
+    El CSV (``Content-Type: text/csv``) lleva una fila por sesión (ver
+    ``app.importacion``). Se crean todos los horarios o ninguno: los errores
+    de validación se devuelven todos juntos con un 422 y los choques entre
+    sesiones con un 409.
+    """
+    try:
+        if "csv" in request.headers.get("content-type", ""):
+            filas = importacion.leer_csv((await request.body()).decode("utf-8-sig"))
+        else:
+            filas = importacion.leer_json(await request.json())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # Consultas e inserciones bloquean: fuera del bucle de eventos
+    return await run_in_threadpool(importar_horarios, session, filas)
+
+
 @app.get("/horarios-clase/", response_model=List[HorarioClaseReadWithSesiones])
 def get_horarios_clase(
-    session: SessionDep, filters: Annotated[HorarioClaseFilterParams, Depends()]
+    response: Response,
+    session: SessionDep,
+    filters: Annotated[HorarioClaseFilterParams, Depends()],
 ):
-    query = (
-        select(HorarioClase)
-        .order_by(getattr(HorarioClase, filters.order_by))
-        .offset(filters.offset)
-        .limit(filters.limit)
-    )
+    orden = getattr(HorarioClase, filters.order_by), HorarioClase.id
+    query = select(HorarioClase).options(selectinload(HorarioClase.sesiones))
+    if filters.q:
+        # Por relevancia no hay orden estable para el cursor: se pagina con offset
+        query = buscar(query, filters.q, HorarioClase.nombre_materia)
+        query = query.order_by(HorarioClase.id).offset(filters.offset)
+    else:
+        query = apply_cursor(query, filters.cursor, *orden)
+        if not filters.cursor:
+            query = query.offset(filters.offset)
     if filters.nombre_materia:
         query = query.where(
-            HorarioClase.nombre_materia.contains(filters.nombre_materia)
+            coincide(HorarioClase.nombre_materia, filters.nombre_materia)
         )
     if filters.id_usuario:
         query = query.where(HorarioClase.id_usuario == filters.id_usuario)
 
-    horarios = session.exec(query).all()
+    horarios = session.exec(query.limit(filters.limit)).all()
+    if not filters.q:
+        set_next_cursor(response, horarios, filters.limit, *orden)
     return horarios
 
 
 @app.get("/horarios-clase/{horario_id}", response_model=HorarioClaseReadWithSesiones)
 def get_horario_clase(horario_id: int, session: SessionDep):
-    horario = session.get(HorarioClase, horario_id)
+    horario = session.get(
+        HorarioClase, horario_id, options=[selectinload(HorarioClase.sesiones)]
+    )
     if not horario:
         raise HTTPException(status_code=404, detail="Horario de clase no encontrado")
     return horario
@@ -285,8 +666,11 @@ def delete_horario_clase(horario_id: int, session: SessionDep):
     horario = session.get(HorarioClase, horario_id)
     if not horario:
         raise HTTPException(status_code=404, detail="Horario de clase no encontrado")
+    sesion_ids = [sesion.id for sesion in horario.sesiones]
     session.delete(horario)
     session.commit()
+    for sesion_id in sesion_ids:
+        indice_ocupacion.remove_sesion(sesion_id)
     return
 
 
@@ -306,6 +690,7 @@ def add_sesion_to_horario(
     session.add(db_sesion)
     session.commit()
     session.refresh(db_sesion)
+    indice_ocupacion.update_sesion(db_sesion)
     return db_sesion
 
 
@@ -322,6 +707,7 @@ def update_sesion_clase(
     session.add(db_sesion)
     session.commit()
     session.refresh(db_sesion)
+    indice_ocupacion.update_sesion(db_sesion)
     return db_sesion
 
 
@@ -332,4 +718,5 @@ def delete_sesion_clase(sesion_id: int, session: SessionDep):
         raise HTTPException(status_code=404, detail="Sesión de clase no encontrada")
     session.delete(sesion)
     session.commit()
+    indice_ocupacion.remove_sesion(sesion_id)
     return
@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import Literal
+from sqlmodel import SQLModel
+
+
+class IntervaloLibre(SQLModel):
+    inicio: datetime
+    fin: datetime
+
+
+class IntervaloOcupado(SQLModel):
+    inicio: datetime
+    fin: datetime
+    tipo: Literal["reserva", "clase"]
+    # Id de la reserva o de la sesión de clase que ocupa el laboratorio
+    id: int
+
+
+class DisponibilidadPublic(SQLModel):
+    id_ubicacion: int
+    desde: datetime
+    hasta: datetime
+    libres: list[IntervaloLibre] = []
+    ocupados: list[IntervaloOcupado] = []
@@ -3,5 +3,5 @@ from sqlmodel import Field, SQLModel
 
 class EquiposReservaBase(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    id_reserva: int = Field(foreign_key="reserva.id")
+    id_reserva: int = Field(foreign_key="reserva.id", index=True)
     id_equipo: int
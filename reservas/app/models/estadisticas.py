@@ -0,0 +1,26 @@
+from datetime import date
+from enum import Enum
+from sqlmodel import Field, SQLModel
+
+
+class Periodo(str, Enum):
+    semana = "semana"
+    mes = "mes"
+
+
+class ResumenOcupacion(SQLModel, table=True):
+    """Horas reservadas por laboratorio, periodo y estado (ver ``app.stats``)."""
+
+    id_ubicacion: int = Field(primary_key=True)
+    periodo: Periodo = Field(primary_key=True)
+    periodo_inicio: date = Field(primary_key=True)
+    status: str = Field(primary_key=True)
+    horas: float = 0
+    reservas: int = 0
+
+
+class OcupacionPeriodo(SQLModel):
+    id_ubicacion: int
+    periodo_inicio: date
+    horas: float
+    reservas: int
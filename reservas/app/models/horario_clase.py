@@ -1,7 +1,9 @@
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 from typing import Optional, List
 from datetime import time
 from enum import Enum
+from app.search import indice_trigram
 
 
 class DiaSemana(str, Enum):
@@ -33,6 +35,17 @@ class SesionClase(SesionClaseBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     horario_clase: "HorarioClase" = Relationship(back_populates="sesiones")
 
+    __table_args__ = (
+        # Índice para la detección de choques con clases al crear reservas
+        Index(
+            "ix_sesionclase_ubicacion_dia_horas",
+            "id_ubicacion",
+            "dia_semana",
+            "hora_inicio",
+            "hora_fin",
+        ),
+    )
+
 
 # --- Modelo para el Horario de Clase (la materia o curso general) ---
 
@@ -48,6 +61,15 @@ class HorarioClase(HorarioClaseBase, table=True):
         back_populates="horario_clase", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
     )
 
+    __table_args__ = (
+        # Índice para la paginación por cursor sobre (nombre_materia, id)
+        Index("ix_horarioclase_nombre_materia_id", "nombre_materia", "id"),
+    )
+
+
+# Índice de trigramas para la búsqueda por materia (solo en Postgres)
+indice_trigram(HorarioClase.__table__, "nombre_materia")
+
 
 # --- Esquemas para la API (lectura, creación y actualización) ---
 
@@ -88,4 +110,16 @@ class SesionClaseUpdate(SQLModel):
     hora_inicio: Optional[time] = None
     hora_fin: Optional[time] = None
     id_ubicacion: Optional[int] = None
-    estado: Optional[EstadoSesion] = None
\ No newline at end of file
+    estado: Optional[EstadoSesion] = None
+
+# Choque de una sesión importada con otra de la importación o con una existente
+class ConflictoSesion(SQLModel):
+    horario: int
+    sesion: int
+    id_ubicacion: int
+    dia_semana: DiaSemana
+    hora_inicio: time
+    hora_fin: time
+    con_horario: Optional[int] = None
+    con_sesion: Optional[int] = None
+    con_id: Optional[int] = None
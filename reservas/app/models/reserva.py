@@ -1,6 +1,11 @@
-from datetime import datetime
+from datetime import date, datetime
+from enum import Enum
+from pydantic import model_validator
+from sqlalchemy import DDL, Index, event, func, literal_column
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlmodel import Field, SQLModel
 from typing import Optional
+from app.constants import MAX_OCURRENCIAS_SERIE, StatusReserva
 
 
 class ReservaBase(SQLModel):
@@ -17,6 +22,45 @@ class ReservaBase(SQLModel):
 class Reserva(ReservaBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
 
+    __table_args__ = (
+        # Índice para la detección de solapamientos por laboratorio y estado
+        Index(
+            "ix_reserva_ubicacion_status_fechas",
+            "id_ubicacion",
+            "status",
+            "fecha_inicio",
+            "fecha_fin",
+        ),
+        # Índices para la paginación por cursor sobre (order_by, id)
+        Index("ix_reserva_fecha_inicio_id", "fecha_inicio", "id"),
+        Index("ix_reserva_fecha_creacion_id", "fecha_creacion", "id"),
+        # Índice para las estadísticas de ocupación por estado y fechas
+        Index("ix_reserva_status_fecha_inicio", "status", "fecha_inicio"),
+        # En Postgres, el solapamiento entre reservas completadas se rechaza
+        # de forma atómica con una restricción de exclusión sobre el rango
+        ExcludeConstraint(
+            ("id_ubicacion", "="),
+            (
+                func.tsrange(
+                    literal_column("fecha_inicio"), literal_column("fecha_fin")
+                ),
+                "&&",
+            ),
+            name="ex_reserva_ubicacion_solapada",
+            using="gist",
+            where=f"status = '{StatusReserva.COMPLETED}'",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+# La restricción de exclusión combina igualdad (=) y rangos (&&) en un
+# índice GiST, lo que requiere la extensión btree_gist
+event.listen(
+    Reserva.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+
 class CreateReserva(ReservaBase):
     id: None = None
     equipos: Optional[list[int]] = None
@@ -29,3 +73,41 @@ class ReservaPublic(ReservaBase):
 
 class ReservaUpdate(SQLModel):
     status: str
+
+
+class FrecuenciaSerie(str, Enum):
+    diaria = "diaria"
+    semanal = "semanal"
+
+
+class CreateSerieReserva(CreateReserva):
+    """Reserva que se repite: ``fecha_inicio`` y ``fecha_fin`` son la primera.
+
+    La serie termina tras ``repeticiones`` ocurrencias o en la fecha ``hasta``
+    (incluida); hay que indicar una de las dos.
+    """
+
+    frecuencia: FrecuenciaSerie = FrecuenciaSerie.semanal
+    intervalo: int = Field(1, ge=1, description="Cada cuántos días o semanas")
+    repeticiones: int | None = Field(None, ge=1, le=MAX_OCURRENCIAS_SERIE)
+    hasta: date | None = None
+
+    @model_validator(mode="after")
+    def check_fin_serie(self):
+        if (self.repeticiones is None) == (self.hasta is None):
+            raise ValueError("Hay que indicar 'repeticiones' o 'hasta'")
+        if self.fecha_fin <= self.fecha_inicio:
+            raise ValueError("'fecha_fin' debe ser posterior a 'fecha_inicio'")
+        if self.hasta is not None and self.hasta < self.fecha_inicio.date():
+            raise ValueError("'hasta' no puede ser anterior a 'fecha_inicio'")
+        return self
+
+
+class ConflictoSerie(SQLModel):
+    """Ocurrencia de una serie que choca con una reserva o una clase."""
+
+    indice: int
+    fecha_inicio: datetime
+    fecha_fin: datetime
+    tipo: str
+    id: int
@@ -0,0 +1,74 @@
+"""Paginación por cursor (keyset) para los listados.
+
+Los listados se ordenan por la columna pedida y por ``id`` como desempate.
+Cuando una página viene completa, la respuesta incluye la cabecera
+``X-Next-Cursor`` con un cursor opaco que codifica esos valores de la última
+fila; pasándolo como ``cursor`` se obtiene la página siguiente con una
+búsqueda en el índice ``(columna, id)`` en lugar de descartar ``offset``
+filas, así que el coste por página es constante. Con ``cursor`` se ignora
+``offset``.
+"""
+
+import base64
+import binascii
+import json
+from datetime import date, datetime, time
+from typing import Any, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, (date, time)) else v for v in values]
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _coerce(column, value: Any) -> Any:
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        # Tipos propios (p. ej. el AutoString de SQLModel) se guardan como texto
+        python_type = str
+    if python_type in (datetime, date, time):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def decode_cursor(cursor: str, *columns) -> list:
+    """Decodificar un cursor con los valores de las columnas dadas."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [_coerce(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=422, detail="Cursor inválido")
+
+
+def apply_cursor(query, cursor: str | None, *columns):
+    """Ordenar por ``columns`` y, si hay cursor, continuar tras la última fila."""
+    query = query.order_by(*columns)
+    if cursor:
+        values = decode_cursor(cursor, *columns)
+        query = query.where(tuple_(*columns) > tuple_(*values))
+    return query
+
+
+def next_cursor(items: Sequence, limit: int, *columns) -> str | None:
+    """Cursor de la página siguiente, o ``None`` si esta es la última."""
+    if len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(*(getattr(last, column.key) for column in columns))
+
+
+def set_next_cursor(response: Response, items: Sequence, limit: int, *columns):
+    cursor = next_cursor(items, limit, *columns)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
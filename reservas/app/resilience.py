@@ -0,0 +1,159 @@
+"""Circuit breaker y ventana de latencias para las llamadas a otros servicios.
+
+``CircuitBreaker`` deja de llamar a un servicio tras ``failure_threshold``
+fallos seguidos (abierto): durante ``reset_timeout`` segundos ``allow()``
+devuelve ``False`` al momento, sin esperar a timeouts. Pasado ese tiempo deja
+pasar una única petición de prueba (semiabierto); si responde se cierra y si
+falla vuelve a abrirse. Es seguro entre hilos y en el bucle de eventos (las
+secciones críticas no esperan a nada).
+
+Métricas, etiquetadas con el nombre del servicio:
+
+- ``circuit_breaker_state{name,circuit_breaker_state}``: 1 en el estado
+  actual (``closed``, ``open`` o ``half_open``) y 0 en los demás.
+- ``circuit_breaker_transitions_total{name,state}``: cambios a cada estado.
+- ``circuit_breaker_rejections_total{name}``: llamadas cortadas sin intentarse.
+- ``upstream_hedged_requests_total{name}``: peticiones repetidas por tardar
+  más que el percentil de latencia configurado.
+"""
+
+import threading
+from collections import deque
+from time import monotonic
+
+from prometheus_client import Counter, Enum
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+BREAKER_STATE = Enum(
+    "circuit_breaker_state",
+    "Estado del circuit breaker de cada servicio",
+    ["name"],
+    states=[CLOSED, OPEN, HALF_OPEN],
+)
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Cambios de estado del circuit breaker",
+    ["name", "state"],
+)
+BREAKER_REJECTIONS = Counter(
+    "circuit_breaker_rejections_total",
+    "Llamadas cortadas por el circuit breaker",
+    ["name"],
+)
+HEDGED_REQUESTS = Counter(
+    "upstream_hedged_requests_total",
+    "Peticiones repetidas por superar el percentil de latencia",
+    ["name"],
+)
+
+
+class UpstreamUnavailable(Exception):
+    """El servicio no respondió a tiempo, falló o tiene el circuito abierto."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        BREAKER_STATE.labels(name).state(CLOSED)
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str):
+        self._state = state
+        BREAKER_STATE.labels(self.name).state(state)
+        BREAKER_TRANSITIONS.labels(self.name, state).inc()
+
+    def allow(self) -> bool:
+        """Indicar si se puede llamar al servicio ahora.
+
+        Cada ``True`` debe seguirse de ``record_success``, ``record_failure``
+        o ``release``.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if monotonic() - self._opened_at < self.reset_timeout:
+                    BREAKER_REJECTIONS.labels(self.name).inc()
+                    return False
+                self._set_state(HALF_OPEN)
+            # Semiabierto: una sola petición de prueba a la vez
+            if self._probing:
+                BREAKER_REJECTIONS.labels(self.name).inc()
+                return False
+            self._probing = True
+            return True
+
+    def would_allow(self) -> bool:
+        """Indicar si ``allow()`` dejaría pasar una llamada ahora.
+
+        No reserva la petición de prueba ni cuenta un rechazo.
+        """
+        with self._lock:
+            if self._state == OPEN:
+                return monotonic() - self._opened_at >= self.reset_timeout
+            return not (self._state == HALF_OPEN and self._probing)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._probing = False
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        """Liberar una llamada permitida que se abandonó sin resultado."""
+        with self._lock:
+            self._probing = False
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+
+class LatencyWindow:
+    """Latencias de las últimas respuestas, para calcular percentiles."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        """Percentil ``p`` (0-100), o ``None`` si aún hay pocas muestras."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
@@ -0,0 +1,33 @@
+"""Respuestas JSON serializadas una sola vez con orjson.
+
+Cuando un handler devuelve modelos o diccionarios, FastAPI los valida contra
+``response_model`` (construyendo otra vez cada modelo) antes de serializarlos.
+En los endpoints que devuelven muchas filas el handler construye directamente
+los diccionarios de la respuesta y devuelve una ``OrjsonResponse``, que FastAPI
+envía tal cual; ``response_model`` queda para la documentación OpenAPI.
+
+orjson serializa fechas, horas y enums igual que pydantic para los valores
+sin zona horaria que guardan estos servicios.
+"""
+
+import orjson
+from starlette.responses import JSONResponse, Response
+
+
+class OrjsonResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(
+    content, response: Response | None = None, status_code: int = 200
+) -> OrjsonResponse:
+    """Serializar ``content`` conservando las cabeceras puestas en ``response``.
+
+    FastAPI no copia las cabeceras del parámetro ``response`` a una respuesta
+    devuelta por el handler, así que se añaden aquí (p. ej. ``X-Next-Cursor``).
+    """
+    rendered = OrjsonResponse(content, status_code=status_code)
+    if response is not None:
+        rendered.headers.raw.extend(response.headers.raw)
+    return rendered
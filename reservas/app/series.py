@@ -0,0 +1,112 @@
+"""Series de reservas: expansión de la regla de repetición y choques.
+
+Las ocurrencias de una serie se comprueban todas a la vez: se pasan a la base
+de datos como una tabla ``VALUES`` (en un ``WITH``) y una única consulta las
+cruza con las reservas completadas y con las sesiones de clase activas del
+laboratorio, con las mismas condiciones de solapamiento que ``create_reserva``.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    String,
+    Time,
+    cast,
+    column,
+    literal,
+    union_all,
+    values,
+)
+from sqlmodel import select
+
+from app.constants import MAX_OCURRENCIAS_SERIE, StatusReserva
+from app.disponibilidad import DIAS_SEMANA
+from app.models.horario_clase import EstadoSesion, SesionClase
+from app.models.reserva import CreateSerieReserva, FrecuenciaSerie, Reserva
+
+
+def expandir_serie(serie: CreateSerieReserva) -> list[tuple[datetime, datetime]]:
+    """Intervalos ``(inicio, fin)`` de cada ocurrencia de la serie.
+
+    Lanza ``ValueError`` si la serie no tiene ocurrencias o tiene más de
+    ``MAX_OCURRENCIAS_SERIE``, o si una ocurrencia no termina antes de que
+    empiece la siguiente.
+    """
+    dias = 1 if serie.frecuencia == FrecuenciaSerie.diaria else 7
+    paso = timedelta(days=dias * serie.intervalo)
+    duracion = serie.fecha_fin - serie.fecha_inicio
+    if duracion > paso:
+        raise ValueError("Las ocurrencias de la serie se solapan entre sí")
+
+    ocurrencias = []
+    inicio = serie.fecha_inicio
+    while (
+        len(ocurrencias) < serie.repeticiones
+        if serie.repeticiones is not None
+        else inicio.date() <= serie.hasta
+    ):
+        if len(ocurrencias) == MAX_OCURRENCIAS_SERIE:
+            raise ValueError(
+                f"La serie no puede tener más de {MAX_OCURRENCIAS_SERIE} ocurrencias"
+            )
+        ocurrencias.append((inicio, inicio + duracion))
+        inicio += paso
+    if not ocurrencias:
+        # Una tabla VALUES vacía no es SQL válido
+        raise ValueError("La serie no tiene ninguna ocurrencia")
+    return ocurrencias
+
+
+def conflictos_query(id_ubicacion: int, ocurrencias: list[tuple[datetime, datetime]]):
+    """Consulta de los choques de las ocurrencias con reservas y clases.
+
+    Devuelve filas ``(indice, tipo, id)`` ordenadas por ocurrencia.
+    """
+    tabla = values(
+        column("indice", Integer),
+        column("inicio", DateTime),
+        column("fin", DateTime),
+        column("dia_semana", String),
+        column("hora_inicio", Time),
+        column("hora_fin", Time),
+        name="ocurrencias",
+    ).data(
+        [
+            (
+                indice,
+                inicio,
+                fin,
+                # El domingo no tiene clases: NULL no coincide con ninguna sesión
+                dia.value if (dia := DIAS_SEMANA.get(inicio.weekday())) else None,
+                inicio.time(),
+                fin.time(),
+            )
+            for indice, (inicio, fin) in enumerate(ocurrencias)
+        ]
+    )
+    ocurrencia = tabla.cte().c
+    reservas = select(
+        ocurrencia.indice, literal("reserva").label("tipo"), Reserva.id
+    ).join(
+        Reserva,
+        (Reserva.id_ubicacion == id_ubicacion)
+        & (Reserva.status == StatusReserva.COMPLETED)
+        & (Reserva.fecha_inicio < ocurrencia.fin)
+        & (Reserva.fecha_fin > ocurrencia.inicio),
+    )
+    clases = select(
+        ocurrencia.indice, literal("clase").label("tipo"), SesionClase.id
+    ).join(
+        SesionClase,
+        (SesionClase.id_ubicacion == id_ubicacion)
+        & (
+            SesionClase.dia_semana
+            == cast(ocurrencia.dia_semana, SesionClase.__table__.c.dia_semana.type)
+        )
+        & (SesionClase.estado == EstadoSesion.activa)
+        & (SesionClase.hora_inicio < ocurrencia.hora_fin)
+        & (SesionClase.hora_fin > ocurrencia.hora_inicio),
+    )
+    return union_all(reservas, clases).order_by("indice", "tipo", "id")
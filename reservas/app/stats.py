@@ -0,0 +1,251 @@
+"""Estadísticas de ocupación: horas reservadas por laboratorio y periodo.
+
+Las horas se agregan en SQL con ``GROUP BY`` por laboratorio y por inicio de
+periodo (semana, empezando en lunes, o mes). Cada reserva cuenta entera en el
+periodo en que empieza.
+
+Con ``RESUMEN_OCUPACION=true`` se mantiene además la tabla
+``resumenocupacion`` con esos agregados ya calculados: los handlers de
+escritura le aplican el cambio de cada reserva (``registrar_reserva``) en la
+misma transacción y la consulta lee directamente de ella. La tabla se llena
+desde las reservas existentes al arrancar si está vacía.
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import Date, Float, delete, func, insert, literal
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlmodel import Session, select
+
+from app.models.estadisticas import Periodo, ResumenOcupacion
+from app.models.reserva import Reserva
+
+RESUMEN_OCUPACION = os.getenv("RESUMEN_OCUPACION", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Clave del advisory lock que serializa la reconstrucción del resumen
+RESUMEN_LOCK_ID = 7_417_001
+
+
+class inicio_semana(FunctionElement):
+    """Fecha del lunes de la semana de una columna de fecha y hora."""
+
+    type = Date()
+    inherit_cache = True
+
+
+class inicio_mes(FunctionElement):
+    """Fecha del día 1 del mes de una columna de fecha y hora."""
+
+    type = Date()
+    inherit_cache = True
+
+
+def inicio_periodo(periodo: Periodo, columna):
+    return inicio_mes(columna) if periodo == Periodo.mes else inicio_semana(columna)
+
+
+class duracion_horas(FunctionElement):
+    """Horas entre dos columnas de fecha y hora."""
+
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(inicio_semana, "postgresql")
+def _inicio_semana_postgresql(element, compiler, **kw):
+    columna = compiler.process(element.clauses, **kw)
+    return f"CAST(date_trunc('week', {columna}) AS DATE)"
+
+
+@compiles(inicio_semana)
+def _inicio_semana(element, compiler, **kw):
+    columna = compiler.process(element.clauses, **kw)
+    # strftime('%w') es 0 en domingo: se retrocede hasta el lunes
+    dias = f"((CAST(strftime('%w', {columna}) AS INTEGER) + 6) % 7)"
+    return f"date({columna}, '-' || {dias} || ' days')"
+
+
+@compiles(inicio_mes, "postgresql")
+def _inicio_mes_postgresql(element, compiler, **kw):
+    columna = compiler.process(element.clauses, **kw)
+    return f"CAST(date_trunc('month', {columna}) AS DATE)"
+
+
+@compiles(inicio_mes)
+def _inicio_mes(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)}, 'start of month')"
+
+
+@compiles(duracion_horas, "postgresql")
+def _duracion_horas_postgresql(element, compiler, **kw):
+    inicio, fin = (compiler.process(c, **kw) for c in element.clauses)
+    return f"(EXTRACT(EPOCH FROM ({fin} - {inicio})) / 3600)"
+
+
+@compiles(duracion_horas)
+def _duracion_horas(element, compiler, **kw):
+    inicio, fin = (compiler.process(c, **kw) for c in element.clauses)
+    return f"((strftime('%s', {fin}) - strftime('%s', {inicio})) / 3600.0)"
+
+
+def inicio_de(periodo: Periodo, fecha: date) -> date:
+    """Equivalente en Python de ``inicio_periodo``."""
+    if isinstance(fecha, datetime):
+        fecha = fecha.date()
+    if periodo == Periodo.mes:
+        return fecha.replace(day=1)
+    return fecha - timedelta(days=fecha.weekday())
+
+
+def siguiente(periodo: Periodo, inicio: date) -> date:
+    """Inicio del periodo siguiente al que empieza en ``inicio``."""
+    if periodo == Periodo.mes:
+        return (inicio + timedelta(days=32)).replace(day=1)
+    return inicio + timedelta(days=7)
+
+
+def ocupacion_query(
+    periodo: Periodo,
+    status: str,
+    desde: date | None = None,
+    hasta: date | None = None,
+    id_ubicacion: int | None = None,
+):
+    """Horas y número de reservas por laboratorio y periodo, desde las reservas.
+
+    Devuelve los periodos completos que se solapan con ``[desde, hasta]``.
+    """
+    inicio = inicio_periodo(periodo, Reserva.fecha_inicio)
+    horas = duracion_horas(Reserva.fecha_inicio, Reserva.fecha_fin)
+    query = select(
+        Reserva.id_ubicacion,
+        inicio.label("periodo_inicio"),
+        func.sum(horas).label("horas"),
+        func.count().label("reservas"),
+    ).where(Reserva.status == status)
+    if desde:
+        desde = datetime.combine(inicio_de(periodo, desde), time())
+        query = query.where(Reserva.fecha_inicio >= desde)
+    if hasta:
+        hasta = datetime.combine(siguiente(periodo, inicio_de(periodo, hasta)), time())
+        query = query.where(Reserva.fecha_inicio < hasta)
+    if id_ubicacion is not None:
+        query = query.where(Reserva.id_ubicacion == id_ubicacion)
+    return query.group_by(Reserva.id_ubicacion, inicio).order_by(
+        Reserva.id_ubicacion, inicio
+    )
+
+
+def resumen_query(
+    periodo: Periodo,
+    status: str,
+    desde: date | None = None,
+    hasta: date | None = None,
+    id_ubicacion: int | None = None,
+):
+    """Misma consulta que ``ocupacion_query`` sobre la tabla de resumen."""
+    query = select(
+        ResumenOcupacion.id_ubicacion,
+        ResumenOcupacion.periodo_inicio,
+        ResumenOcupacion.horas,
+        ResumenOcupacion.reservas,
+    ).where(
+        ResumenOcupacion.periodo == periodo,
+        ResumenOcupacion.status == status,
+        ResumenOcupacion.reservas > 0,
+    )
+    inicio = ResumenOcupacion.periodo_inicio
+    if desde:
+        query = query.where(inicio >= inicio_de(periodo, desde))
+    if hasta:
+        query = query.where(inicio <= inicio_de(periodo, hasta))
+    if id_ubicacion is not None:
+        query = query.where(ResumenOcupacion.id_ubicacion == id_ubicacion)
+    return query.order_by(ResumenOcupacion.id_ubicacion, inicio)
+
+
+def upsert_resumen(session: Session, filas: list[dict]):
+    """Sumar ``horas`` y ``reservas`` de ``filas`` a sus claves en el resumen.
+
+    Un único ``INSERT ... ON CONFLICT DO UPDATE``: dos reservas simultáneas
+    que crean la misma clave no chocan con la clave primaria.
+    """
+    dialecto = session.get_bind().dialect.name
+    insert_dialecto = sqlite_insert if dialecto == "sqlite" else postgresql_insert
+    statement = insert_dialecto(ResumenOcupacion).values(filas)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["id_ubicacion", "periodo", "periodo_inicio", "status"],
+            set_={
+                "horas": ResumenOcupacion.horas + statement.excluded.horas,
+                "reservas": ResumenOcupacion.reservas + statement.excluded.reservas,
+            },
+        )
+    )
+
+
+def registrar_reserva(session: Session, reserva: Reserva, signo: int = 1):
+    """Sumar (``signo=1``) o restar (``-1``) una reserva en la tabla de resumen.
+
+    No hace commit: se llama dentro de la transacción que modifica la reserva.
+    """
+    if not RESUMEN_OCUPACION:
+        return
+    horas = (reserva.fecha_fin - reserva.fecha_inicio).total_seconds() / 3600
+    upsert_resumen(
+        session,
+        [
+            dict(
+                id_ubicacion=reserva.id_ubicacion,
+                periodo=periodo,
+                periodo_inicio=inicio_de(periodo, reserva.fecha_inicio),
+                status=reserva.status,
+                horas=signo * horas,
+                reservas=signo,
+            )
+            for periodo in Periodo
+        ],
+    )
+
+
+def reconstruir_resumen(session: Session, solo_si_vacio: bool = False):
+    """Recalcular la tabla de resumen a partir de las reservas.
+
+    En Postgres se toma antes un advisory lock de transacción: si varias
+    réplicas arrancan a la vez, solo la primera la llena y el resto, tras
+    esperar al lock, la encuentra ya llena.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(select(func.pg_advisory_xact_lock(RESUMEN_LOCK_ID)))
+    if solo_si_vacio and session.exec(select(ResumenOcupacion).limit(1)).first():
+        session.commit()
+        return
+    session.execute(delete(ResumenOcupacion))
+    for periodo in Periodo:
+        inicio = inicio_periodo(periodo, Reserva.fecha_inicio)
+        horas = duracion_horas(Reserva.fecha_inicio, Reserva.fecha_fin)
+        agregados = select(
+            Reserva.id_ubicacion,
+            literal(periodo.name),
+            inicio,
+            Reserva.status,
+            func.sum(horas),
+            func.count(),
+        ).group_by(Reserva.id_ubicacion, inicio, Reserva.status)
+        columnas = [
+            "id_ubicacion",
+            "periodo",
+            "periodo_inicio",
+            "status",
+            "horas",
+            "reservas",
+        ]
+        session.execute(insert(ResumenOcupacion).from_select(columnas, agregados))
+    session.commit()
@@ -0,0 +1,858 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from jose import jwt
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import laboratorios_client, main, metrics, stats
+from app.db import get_async_session, get_session
+from app.disponibilidad import IndiceOcupacion, indice_ocupacion, inicio_ventana
+from app.main import app
+from app.models.equipos_reserva import EquiposReservaBase
+from app.models.estadisticas import Periodo, ResumenOcupacion
+from app.models.reserva import Reserva
+from app.resilience import CLOSED, OPEN, CircuitBreaker, LatencyWindow
+from app.verify import JWT_KEYS, decode_token
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture(name="client")
+def client_fixture(session: Session):
+    app.dependency_overrides[get_session] = lambda: session
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(name="equipos_remotos")
+def equipos_remotos_fixture(monkeypatch):
+    """Sustituye las llamadas al servicio de laboratorios."""
+    llamadas = []
+
+    def fake_fetch_lote(ids: list[int], deadline: float):
+        llamadas.append(ids)
+        return [{"id": id, "nombre": f"Equipo {id}"} for id in ids if id != 99]
+
+    async def fake_fetch_lote_async(ids: list[int], deadline: float):
+        return fake_fetch_lote(ids, deadline)
+
+    monkeypatch.setattr(laboratorios_client, "fetch_lote", fake_fetch_lote)
+    monkeypatch.setattr(
+        laboratorios_client, "fetch_lote_async", fake_fetch_lote_async
+    )
+    laboratorios_client.cache.clear()
+    return llamadas
+
+
+@contextmanager
+def count_queries(session: Session):
+    """Contar las sentencias SQL ejecutadas sobre el engine de ``session``."""
+    queries: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    engine = session.get_bind()
+    # Sin objetos en la sesión, cada relación cargada de forma perezosa se
+    # ve como una consulta más
+    session.expunge_all()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def crear_reserva(session: Session, equipos: list[int], hora: int = 8) -> Reserva:
+    reserva = Reserva(
+        fecha_inicio=datetime(2025, 3, 3, hora),
+        fecha_fin=datetime(2025, 3, 3, hora + 1),
+        id_usuario=1,
+        id_ubicacion=1,
+    )
+    session.add(reserva)
+    session.commit()
+    session.refresh(reserva)
+    for id_equipo in equipos:
+        session.add(EquiposReservaBase(id_reserva=reserva.id, id_equipo=id_equipo))
+    session.commit()
+    return reserva
+
+
+def test_get_reservas_fetches_equipos_in_one_batch(
+    session: Session, client: TestClient, equipos_remotos: list
+):
+    crear_reserva(session, [1, 2], hora=8)
+    crear_reserva(session, [2, 3], hora=10)
+    crear_reserva(session, [], hora=12)
+
+    response = client.get("/")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [[e["id"] for e in r["equipos"]] for r in data] == [[1, 2], [2, 3], []]
+    assert equipos_remotos == [[1, 2, 3]]
+
+
+def test_read_reserva_omits_unavailable_equipos(
+    session: Session, client: TestClient, equipos_remotos: list
+):
+    reserva = crear_reserva(session, [1, 99])
+
+    response = client.get(f"/{reserva.id}")
+
+    assert response.status_code == 200
+    assert [e["id"] for e in response.json()["equipos"]] == [1]
+
+
+def test_fetch_equipos_uses_cache(equipos_remotos: list):
+    laboratorios_client.fetch_equipos([1, 2])
+    laboratorios_client.fetch_equipos([2, 3])
+
+    assert equipos_remotos == [[1, 2], [3]]
+
+
+def test_fetch_equipos_coalesces_concurrent_misses(monkeypatch, equipos_remotos):
+    liberar = threading.Event()
+    fetch_lote = laboratorios_client.fetch_lote
+
+    def slow_fetch_lote(ids, deadline):
+        liberar.wait(timeout=5)
+        return fetch_lote(ids, deadline)
+
+    monkeypatch.setattr(laboratorios_client, "fetch_lote", slow_fetch_lote)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(laboratorios_client.fetch_equipos, [7]) for _ in range(4)
+        ]
+        time.sleep(0.1)
+        liberar.set()
+        resultados = [future.result() for future in futures]
+
+    assert equipos_remotos == [[7]]
+    assert all(resultado[7]["id"] == 7 for resultado in resultados)
+
+
+def test_fetch_equipos_serves_stale_while_revalidating(monkeypatch, equipos_remotos):
+    monkeypatch.setattr(laboratorios_client.cache, "ttl", 0)
+    laboratorios_client.fetch_equipos([5])
+    monkeypatch.setattr(
+        laboratorios_client, "fetch_lote", lambda ids, deadline: None
+    )
+
+    resultado = laboratorios_client.fetch_equipos([5])
+
+    assert resultado[5]["id"] == 5
+
+
+def test_fetch_equipos_queues_one_revalidation_per_equipo(
+    monkeypatch, equipos_remotos
+):
+    monkeypatch.setattr(laboratorios_client.cache, "ttl", 0)
+    laboratorios_client.fetch_equipos([5, 6])
+    liberar = threading.Event()
+    fetch_lote = laboratorios_client.fetch_lote
+
+    def slow_fetch_lote(ids, deadline):
+        liberar.wait(timeout=5)
+        return fetch_lote(ids, deadline)
+
+    monkeypatch.setattr(laboratorios_client, "fetch_lote", slow_fetch_lote)
+    # Mientras la primera revalidación está en curso, las peticiones que ven
+    # los mismos equipos obsoletos no encolan otra
+    for _ in range(20):
+        assert laboratorios_client.fetch_equipos([5, 6])[6]["id"] == 6
+    liberar.set()
+    laboratorios_client._revalidation_executor.submit(lambda: None).result()
+    assert equipos_remotos == [[5, 6], [5, 6]]
+    assert not laboratorios_client._revalidando
+
+    # Terminada la revalidación, el siguiente acceso obsoleto encola otra
+    laboratorios_client.fetch_equipos([6])
+    laboratorios_client._revalidation_executor.submit(lambda: None).result()
+    assert equipos_remotos == [[5, 6], [5, 6], [6]]
+
+
+def test_fetch_equipos_async_revalidates_once_and_not_with_open_circuit(
+    monkeypatch, equipos_remotos
+):
+    monkeypatch.setattr(laboratorios_client.cache, "ttl", 0)
+    breaker = CircuitBreaker("laboratorios-revalidacion", 1, 60)
+    monkeypatch.setattr(laboratorios_client, "breaker", breaker)
+
+    async def escenario():
+        await laboratorios_client.fetch_equipos_async([5, 6])
+        for _ in range(20):
+            await laboratorios_client.fetch_equipos_async([5, 6])
+        assert len(laboratorios_client._revalidation_tasks) == 1
+        await asyncio.gather(*laboratorios_client._revalidation_tasks)
+        assert equipos_remotos == [[5, 6], [5, 6]]
+
+        # Con el circuito abierto las entradas obsoletas se sirven sin
+        # programar revalidaciones
+        breaker.record_failure()
+        resultado = await laboratorios_client.fetch_equipos_async([5, 6])
+        assert resultado[5]["id"] == 5
+        assert not laboratorios_client._revalidation_tasks
+        assert REGISTRY.get_sample_value(
+            "circuit_breaker_rejections_total", {"name": breaker.name}
+        ) in (None, 0)
+
+    asyncio.run(escenario())
+    assert equipos_remotos == [[5, 6], [5, 6]]
+    assert not laboratorios_client._async_revalidando
+
+    # Lo mismo en el modo síncrono
+    laboratorios_client.fetch_equipos([5, 6])
+    laboratorios_client._revalidation_executor.submit(lambda: None).result()
+    assert equipos_remotos == [[5, 6], [5, 6]]
+
+
+def upstream_laboratorios(monkeypatch, handler) -> list:
+    """Sustituye el transporte HTTP hacia laboratorios por ``handler``."""
+    llamadas = []
+
+    def registrar(request: httpx.Request) -> httpx.Response:
+        llamadas.append(request.url.params["ids"])
+        return handler(request)
+
+    monkeypatch.setattr(
+        laboratorios_client,
+        "_client",
+        httpx.Client(transport=httpx.MockTransport(registrar)),
+    )
+    laboratorios_client.cache.clear()
+    return llamadas
+
+
+def test_circuit_breaker_degrades_to_ids_and_fails_fast(monkeypatch):
+    respuesta = httpx.Response(503)
+    llamadas = upstream_laboratorios(monkeypatch, lambda request: respuesta)
+    breaker = CircuitBreaker("laboratorios-test", 2, 60)
+    monkeypatch.setattr(laboratorios_client, "breaker", breaker)
+
+    assert laboratorios_client.fetch_equipos([1, 2]) == {
+        1: {"id": 1},
+        2: {"id": 2},
+    }
+    laboratorios_client.fetch_equipos([3])
+    assert breaker.state == OPEN
+    # Abierto: responde al momento sin llamar al servicio
+    assert laboratorios_client.fetch_equipos([4]) == {4: {"id": 4}}
+    assert len(llamadas) == 2
+    assert laboratorios_client.cache.get_entry(1) is None
+
+    # Pasado el tiempo de espera, una petición de prueba lo vuelve a cerrar
+    breaker.reset_timeout = 0
+    respuesta = httpx.Response(200, json=[{"id": 4, "nombre": "Equipo 4"}])
+    assert laboratorios_client.fetch_equipos([4])[4]["nombre"] == "Equipo 4"
+    assert breaker.state == CLOSED
+    labels = {"name": "laboratorios-test"}
+    assert REGISTRY.get_sample_value(
+        "circuit_breaker_state", {**labels, "circuit_breaker_state": CLOSED}
+    ) == 1
+    assert REGISTRY.get_sample_value(
+        "circuit_breaker_transitions_total", {**labels, "state": OPEN}
+    ) == 1
+    assert REGISTRY.get_sample_value(
+        "circuit_breaker_rejections_total", labels
+    ) == 1
+
+
+def test_fetch_lote_hedges_slow_requests(monkeypatch):
+    primera = threading.Event()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if not primera.is_set():
+            primera.set()
+            time.sleep(1)
+        return httpx.Response(200, json=[{"id": 1, "nombre": "Equipo 1"}])
+
+    llamadas = upstream_laboratorios(monkeypatch, handler)
+    monkeypatch.setattr(laboratorios_client, "LABS_HEDGE_PERCENTILE", 95)
+    latencias = LatencyWindow()
+    for _ in range(latencias.min_samples):
+        latencias.observe(0.01)
+    monkeypatch.setattr(laboratorios_client, "latencias", latencias)
+
+    start = time.perf_counter()
+    resultado = laboratorios_client.fetch_equipos([1])
+
+    assert time.perf_counter() - start < 0.5
+    assert resultado[1]["nombre"] == "Equipo 1"
+    assert llamadas == ["1", "1"]
+
+
+@pytest.mark.parametrize("primera_pausa", [0.1, 1.0])
+def test_fetch_equipos_honors_deadline_with_trickling_upstream(
+    monkeypatch, primera_pausa
+):
+    enviados = []
+
+    def goteo():
+        # Cabeceras al momento y un byte cada 0,1 s (el primero tras
+        # ``primera_pausa``): ninguna lectura agota el timeout de httpx, pero
+        # la respuesta entera tarda más de 2 s
+        for byte in b'[{"id": 1, "nombre": "Equipo 1"}]'.ljust(20):
+            time.sleep(primera_pausa if not enviados else 0.1)
+            enviados.append(byte)
+            yield bytes([byte])
+
+    upstream_laboratorios(
+        monkeypatch, lambda request: httpx.Response(200, content=goteo())
+    )
+    breaker = CircuitBreaker("laboratorios-goteo", 5, 60)
+    monkeypatch.setattr(laboratorios_client, "breaker", breaker)
+    monkeypatch.setattr(laboratorios_client, "LABS_DEADLINE_SECONDS", 0.3)
+
+    start = time.perf_counter()
+    resultado = laboratorios_client.fetch_equipos([1])
+
+    assert time.perf_counter() - start < 0.6
+    assert resultado == {1: {"id": 1}}
+    assert laboratorios_client.cache.get_entry(1) is None
+    # El intento abandonado deja de leer en el siguiente trozo y cuenta como
+    # fallo
+    time.sleep(1.0)
+    assert len(enviados) < 8
+    assert breaker._failures == 1
+
+
+def test_update_reserva_rejects_overlapping_completed(
+    session: Session, client: TestClient
+):
+    primera = crear_reserva(session, [], hora=8)
+    segunda = crear_reserva(session, [], hora=8)
+    completada = client.patch(f"/{primera.id}", json={"status": "completed"})
+
+    response = client.patch(f"/{segunda.id}", json={"status": "completed"})
+
+    assert completada.status_code == 200
+    assert response.status_code == 409
+
+
+def test_create_reserva_rejects_overlapping_completed(client: TestClient):
+    reserva = {
+        "fecha_inicio": "2025-03-03T08:00:00",
+        "fecha_fin": "2025-03-03T10:00:00",
+        "id_usuario": 1,
+        "id_ubicacion": 1,
+        "status": "completed",
+        "equipos": [4, 5],
+    }
+    creada = client.post("/", json=reserva)
+
+    solapada = client.post("/", json={**reserva, "fecha_inicio": "2025-03-03T09:00:00"})
+
+    assert creada.status_code == 200
+    assert creada.json()["equipos"] == [4, 5]
+    assert solapada.status_code == 409
+
+
+def test_create_serie_reservas_is_all_or_nothing(
+    session: Session, client: TestClient
+):
+    indice_ocupacion.clear()
+    client.post(
+        "/horarios-clase/",
+        json={
+            "nombre_materia": "Redes",
+            "id_usuario": 1,
+            "sesiones": [
+                {
+                    "dia_semana": "lunes",
+                    "hora_inicio": "09:00:00",
+                    "hora_fin": "11:00:00",
+                    "id_ubicacion": 1,
+                }
+            ],
+        },
+    )
+    client.post(
+        "/",
+        json={
+            "fecha_inicio": "2025-03-12T08:00:00",
+            "fecha_fin": "2025-03-12T10:00:00",
+            "id_usuario": 1,
+            "id_ubicacion": 1,
+            "status": "completed",
+        },
+    )
+    serie = {
+        "fecha_inicio": "2025-03-09T08:00:00",
+        "fecha_fin": "2025-03-09T10:00:00",
+        "id_usuario": 2,
+        "id_ubicacion": 1,
+        "equipos": [4],
+        "frecuencia": "diaria",
+        "hasta": "2025-03-12",
+    }
+
+    with count_queries(session) as queries:
+        conflicto = client.post("/series", json=serie)
+    creadas = client.post("/series", json={**serie, "id_ubicacion": 2})
+
+    # El lunes 10 choca con la clase y el miércoles 12 con la reserva
+    assert conflicto.status_code == 409
+    assert [(c["indice"], c["tipo"]) for c in conflicto.json()["detail"]] == [
+        (1, "clase"),
+        (3, "reserva"),
+    ]
+    assert len(queries) == 1
+    assert not session.exec(
+        select(Reserva).where(Reserva.id_usuario == 2, Reserva.id_ubicacion == 1)
+    ).all()
+    assert creadas.status_code == 200
+    assert [r["fecha_inicio"] for r in creadas.json()] == [
+        "2025-03-09T08:00:00",
+        "2025-03-10T08:00:00",
+        "2025-03-11T08:00:00",
+        "2025-03-12T08:00:00",
+    ]
+    assert all(r["equipos"] == [4] for r in creadas.json())
+
+
+def test_create_serie_without_occurrences_is_rejected(client: TestClient):
+    response = client.post(
+        "/series",
+        json={
+            "fecha_inicio": "2025-03-09T08:00:00",
+            "fecha_fin": "2025-03-09T10:00:00",
+            "id_usuario": 2,
+            "id_ubicacion": 1,
+            "hasta": "2025-03-01",
+        },
+    )
+
+    assert response.status_code == 422
+
+
+def test_export_reservas_streams_csv_and_ndjson(
+    session: Session, client: TestClient
+):
+    primera = crear_reserva(session, equipos=[7, 3], hora=8)
+    segunda = crear_reserva(session, equipos=[], hora=12)
+    otra = crear_reserva(session, equipos=[1], hora=14)
+    otra.id_ubicacion = 2
+    session.add(otra)
+    session.commit()
+
+    ndjson = client.get("/export", params={"id_ubicacion": 1})
+    csv = client.get(
+        "/export",
+        params={"formato": "csv", "desde": "2025-03-03T10:00:00Z", "status": "pending"},
+    )
+
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    filas = [json.loads(linea) for linea in ndjson.text.splitlines()]
+    assert [(f["id"], f["equipos"]) for f in filas] == [
+        (primera.id, [3, 7]),
+        (segunda.id, []),
+    ]
+    assert csv.text.splitlines() == [
+        "id,fecha_creacion,fecha_inicio,fecha_fin,id_usuario,id_ubicacion,status,"
+        "equipos",
+        f"{segunda.id},{segunda.fecha_creacion.isoformat()},2025-03-03T12:00:00,"
+        "2025-03-03T13:00:00,1,1,pending,",
+        f"{otra.id},{otra.fecha_creacion.isoformat()},2025-03-03T14:00:00,"
+        "2025-03-03T15:00:00,1,2,pending,1",
+    ]
+
+
+def test_get_disponibilidad(session: Session, client: TestClient):
+    indice_ocupacion.clear()
+    client.post(
+        "/horarios-clase/",
+        json={
+            "nombre_materia": "Redes",
+            "id_usuario": 1,
+            "sesiones": [
+                {
+                    "dia_semana": "lunes",
+                    "hora_inicio": "10:00:00",
+                    "hora_fin": "12:00:00",
+                    "id_ubicacion": 1,
+                }
+            ],
+        },
+    )
+    params = {"desde": "2025-03-03T08:00:00", "hasta": "2025-03-03T18:00:00"}
+    assert len(client.get("/disponibilidad/1", params=params).json()["libres"]) == 2
+
+    # Las reservas nuevas se reflejan sin recargar el índice
+    reserva = crear_reserva(session, [], hora=14)
+    client.patch(f"/{reserva.id}", json={"status": "completed"})
+    response = client.get("/disponibilidad/1", params=params)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [(i["inicio"][11:16], i["fin"][11:16]) for i in data["libres"]] == [
+        ("08:00", "10:00"),
+        ("12:00", "14:00"),
+        ("15:00", "18:00"),
+    ]
+    assert [i["tipo"] for i in data["ocupados"]] == ["clase", "reserva"]
+
+
+def test_indice_ocupacion_loads_window_and_keeps_updates_during_load(
+    monkeypatch, session: Session
+):
+    hoy = inicio_ventana()
+
+    def reserva(dias: int, hora: int) -> Reserva:
+        inicio = hoy + timedelta(days=dias, hours=hora)
+        r = Reserva(
+            fecha_inicio=inicio,
+            fecha_fin=inicio + timedelta(hours=1),
+            id_usuario=1,
+            id_ubicacion=1,
+            status="completed",
+        )
+        session.add(r)
+        session.commit()
+        session.refresh(r)
+        return r
+
+    pasada, futura = reserva(-10, 8), reserva(1, 8)
+    durante_carga = reserva(1, 12)
+    durante_carga.status = "pending"
+    indice = IndiceOcupacion(ttl=60)
+    load = indice._load
+
+    def load_con_escritura_concurrente(*args, **kwargs):
+        ocupacion = load(*args, **kwargs)
+        # Confirmada después de la lectura y antes de publicar el índice
+        durante_carga.status = "completed"
+        indice.update_reserva(durante_carga)
+        return ocupacion
+
+    monkeypatch.setattr(indice, "_load", load_con_escritura_concurrente)
+    ocupados = indice.ocupados(session, 1, hoy, hoy + timedelta(days=2))
+    monkeypatch.setattr(indice, "_load", load)
+
+    assert [(tipo, id) for _, _, tipo, id in ocupados] == [
+        ("reserva", futura.id),
+        ("reserva", durante_carga.id),
+    ]
+    # Las reservas anteriores a la ventana no se cargan en el índice
+    assert pasada.id not in indice._laboratorios[1].reservas_por_id
+    assert not indice._cargas
+    # pero un rango pasado se sigue resolviendo con una carga puntual
+    ocupados = indice.ocupados(
+        session, 1, hoy - timedelta(days=11), hoy - timedelta(days=9)
+    )
+    assert [id for *_, id in ocupados] == [pasada.id]
+
+
+def test_get_disponibilidad_rejects_invalid_range(client: TestClient):
+    params = {"desde": "2025-03-03T18:00:00", "hasta": "2025-03-03T08:00:00"}
+
+    assert client.get("/disponibilidad/1", params=params).status_code == 422
+
+
+def test_stats_ocupacion_live_and_summary_match(
+    monkeypatch, session: Session, client: TestClient
+):
+    def crear(dia: int, hora: int, horas: int, id_ubicacion: int = 1):
+        return client.post(
+            "/",
+            json={
+                # Marzo de 2025: el lunes 3 empieza una semana
+                "fecha_inicio": f"2025-03-{dia:02d}T{hora:02d}:00:00",
+                "fecha_fin": f"2025-03-{dia:02d}T{hora + horas:02d}:00:00",
+                "id_usuario": 1,
+                "id_ubicacion": id_ubicacion,
+            },
+        ).json()
+
+    monkeypatch.setattr(stats, "RESUMEN_OCUPACION", True)
+    reservas = [crear(3, 8, 2), crear(9, 8, 1), crear(10, 8, 3), crear(4, 8, 4, 2)]
+    for reserva in reservas:
+        client.patch(f"/{reserva['id']}", json={"status": "completed"})
+    # Una reserva que deja de estar completada deja de contar
+    client.patch(f"/{reservas[2]['id']}", json={"status": "cancelled"})
+
+    resumen = client.get("/stats/ocupacion").json()
+    monkeypatch.setattr(stats, "RESUMEN_OCUPACION", False)
+    en_vivo = client.get("/stats/ocupacion").json()
+    por_mes = client.get(
+        "/stats/ocupacion", params={"periodo": "mes", "id_ubicacion": 1}
+    ).json()
+
+    assert en_vivo == resumen
+    assert [(o["id_ubicacion"], o["periodo_inicio"], o["horas"]) for o in en_vivo] == [
+        (1, "2025-03-03", 3.0),
+        (2, "2025-03-03", 4.0),
+    ]
+    assert por_mes == [
+        {"id_ubicacion": 1, "periodo_inicio": "2025-03-01", "horas": 3.0, "reservas": 2}
+    ]
+
+
+def test_resumen_ocupacion_upsert_is_one_statement(monkeypatch, session: Session):
+    monkeypatch.setattr(stats, "RESUMEN_OCUPACION", True)
+    reserva = Reserva(
+        fecha_inicio=datetime(2025, 3, 3, 8),
+        fecha_fin=datetime(2025, 3, 3, 10),
+        id_usuario=1,
+        id_ubicacion=1,
+    )
+
+    with count_queries(session) as queries:
+        stats.registrar_reserva(session, reserva)
+    session.commit()
+    # La misma clave otra vez (p. ej. creada a la vez por otra petición)
+    stats.registrar_reserva(session, reserva)
+    session.commit()
+
+    # Un INSERT ... ON CONFLICT para ambos periodos: sin carrera entre un
+    # UPDATE que no encuentra la fila y el INSERT posterior
+    assert len(queries) == 1
+    filas = session.exec(select(ResumenOcupacion)).all()
+    assert sorted((f.periodo, f.horas, f.reservas) for f in filas) == [
+        (Periodo.mes, 4.0, 2),
+        (Periodo.semana, 4.0, 2),
+    ]
+
+
+def test_async_handlers(tmp_path, equipos_remotos: list):
+    database = tmp_path / "reservas.db"
+    with Session(create_engine(f"sqlite:///{database}")) as session:
+        SQLModel.metadata.create_all(session.get_bind())
+        crear_reserva(session, [1, 2], hora=8)
+        crear_reserva(session, [2, 99], hora=10)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+    # En modo DB_ASYNC la aplicación registra estas variantes de los handlers
+    async_app = FastAPI()
+    async_app.get("/")(main.get_reservas_async)
+    async_app.get("/{reserva_id}")(main.read_reserva_async)
+    async_app.dependency_overrides[get_async_session] = get_async_session_override
+    with TestClient(async_app) as client:
+        reservas = client.get("/").json()
+        reserva = client.get("/2").json()
+
+    assert [[e["id"] for e in r["equipos"]] for r in reservas] == [[1, 2], [2]]
+    assert [e["id"] for e in reserva["equipos"]] == [2]
+    # Los equipos inexistentes no se cachean
+    assert equipos_remotos == [[1, 2, 99], [99]]
+
+
+def test_metrics_by_route_with_queries_and_upstream_calls(
+    session: Session, client: TestClient, equipos_remotos: list
+):
+    metrics.instrument_engine(session.get_bind())
+    reserva = crear_reserva(session, equipos=[1])
+    labels = {"method": "GET", "route": "/{reserva_id}"}
+
+    def sample(name: str, **extra) -> float:
+        return REGISTRY.get_sample_value(name, {**labels, **extra}) or 0
+
+    peticiones = sample("http_request_duration_seconds_count", status="200")
+    consultas = sample("db_queries_per_request_sum")
+    reserva_id = reserva.id
+    session.expunge_all()
+    client.get(f"/{reserva_id}")
+    transport = metrics.InstrumentedTransport(
+        httpx.MockTransport(lambda request: httpx.Response(204))
+    )
+    with httpx.Client(transport=transport) as upstream:
+        upstream.get("http://laboratorios.test/batch")
+
+    assert sample("http_request_duration_seconds_count", status="200") == (
+        peticiones + 1
+    )
+    assert sample("db_queries_per_request_sum") == consultas + 2
+    assert REGISTRY.get_sample_value(
+        "http_client_request_duration_seconds_count",
+        {"host": "laboratorios.test", "method": "GET", "status": "204"},
+    )
+    assert "http_requests_in_progress" in client.get("/metrics").text
+
+
+def test_get_reservas_cursor_pagination(session: Session, client: TestClient):
+    for hora in (8, 10, 12, 14, 16):
+        crear_reserva(session, [], hora=hora)
+
+    paginas = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/", params=params)
+        paginas.append([r["fecha_inicio"][11:13] for r in response.json()])
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+        params = {"limit": 2, "cursor": cursor}
+
+    assert paginas == [["08", "10"], ["12", "14"], ["16"]]
+    assert client.get("/", params={"cursor": "no-es-un-cursor"}).status_code == 422
+
+
+def test_get_reservas_query_count_is_constant(session: Session, client: TestClient):
+    for hora in (8, 10, 12):
+        crear_reserva(session, [1, 2], hora=hora)
+
+    with count_queries(session) as queries:
+        assert len(client.get("/").json()) == 3
+
+    # Una consulta para las reservas y otra para todos sus equipos
+    assert len(queries) == 2
+
+
+def test_get_horarios_clase_loads_sesiones_eagerly(
+    session: Session, client: TestClient
+):
+    for materia in ("Redes", "Bases de datos", "Sistemas"):
+        client.post(
+            "/horarios-clase/",
+            json={
+                "nombre_materia": materia,
+                "id_usuario": 1,
+                "sesiones": [
+                    {
+                        "dia_semana": dia,
+                        "hora_inicio": "10:00:00",
+                        "hora_fin": "12:00:00",
+                        "id_ubicacion": 1,
+                    }
+                    for dia in ("lunes", "miercoles")
+                ],
+            },
+        )
+
+    with count_queries(session) as queries:
+        horarios = client.get("/horarios-clase/").json()
+    with count_queries(session) as queries_detalle:
+        horario = client.get(f"/horarios-clase/{horarios[0]['id']}").json()
+
+    assert [len(h["sesiones"]) for h in horarios] == [2, 2, 2]
+    assert len(horario["sesiones"]) == 2
+    assert len(queries) == 2
+    assert len(queries_detalle) == 2
+
+
+def test_import_horarios_clase_reports_every_conflict(
+    session: Session, client: TestClient
+):
+    def sesion(dia: str, inicio: str, fin: str, id_ubicacion: int = 1):
+        return {
+            "dia_semana": dia,
+            "hora_inicio": inicio,
+            "hora_fin": fin,
+            "id_ubicacion": id_ubicacion,
+        }
+
+    existente = client.post(
+        "/horarios-clase/",
+        json={
+            "nombre_materia": "Redes",
+            "id_usuario": 1,
+            "sesiones": [sesion("lunes", "08:00:00", "10:00:00")],
+        },
+    ).json()
+    horarios = [
+        {
+            "nombre_materia": "Física",
+            "id_usuario": 2,
+            "sesiones": [
+                sesion("lunes", "09:00:00", "11:00:00"),
+                sesion("martes", "08:00:00", "10:00:00"),
+            ],
+        },
+        {
+            "nombre_materia": "Química",
+            "id_usuario": 3,
+            "sesiones": [
+                sesion("martes", "07:00:00", "12:00:00"),
+                sesion("martes", "08:00:00", "09:00:00", id_ubicacion=2),
+            ],
+        },
+    ]
+
+    conflicto = client.post("/horarios-clase/import", json=horarios)
+    csv = (
+        "nombre_materia,id_usuario,dia_semana,hora_inicio,hora_fin,id_ubicacion\n"
+        "Física,2,lunes,10:00,12:00,1\n"
+        "Química,3,martes,07:00,12:00,1\n"
+        "Física,2,martes,12:00,13:00,1\n"
+    )
+    creados = client.post(
+        "/horarios-clase/import", content=csv, headers={"content-type": "text/csv"}
+    )
+
+    assert conflicto.status_code == 409
+    assert [
+        (c["horario"], c["sesion"], c["con_id"], c["con_horario"], c["con_sesion"])
+        for c in conflicto.json()["detail"]
+    ] == [
+        (0, 0, existente["id"], None, None),
+        (0, 1, None, 1, 0),
+    ]
+    assert creados.status_code == 200, creados.json()
+    assert [
+        (h["nombre_materia"], len(h["sesiones"])) for h in creados.json()
+    ] == [("Física", 2), ("Química", 1)]
+    assert len(client.get("/horarios-clase/").json()) == 3
+
+
+def test_search_horarios_clase_ignores_accents(client: TestClient):
+    for materia in ("Física I", "Química", "Física II", "Biofísica"):
+        client.post(
+            "/horarios-clase/",
+            json={"nombre_materia": materia, "id_usuario": 1, "sesiones": []},
+        )
+
+    buscados = client.get("/horarios-clase/", params={"q": "fisica"}).json()
+    filtrados = client.get("/horarios-clase/", params={"nombre_materia": "QUIMICA"})
+
+    # Primero las que empiezan por el texto buscado
+    assert [h["nombre_materia"] for h in buscados] == [
+        "Física I",
+        "Física II",
+        "Biofísica",
+    ]
+    assert [h["nombre_materia"] for h in filtrados.json()] == ["Química"]
+
+
+def test_decode_token_verifies_locally():
+    def token(kid="default", minutes=5, **claims):
+        exp = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+        claims = {"sub": "a@uni.edu", "uid": 7, "type": "PROFESOR", **claims}
+        return jwt.encode(
+            {"exp": exp, **claims},
+            JWT_KEYS["default"],
+            algorithm="HS256",
+            headers={"kid": kid},
+        )
+
+    assert decode_token(token()).uid == 7
+    for invalido in (token(minutes=-1), token(kid="otra"), token(uid="x")):
+        with pytest.raises(HTTPException) as error:
+            decode_token(invalido)
+        assert error.value.status_code == 401
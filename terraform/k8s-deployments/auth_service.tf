@@ -203,6 +203,12 @@ resource "kubernetes_deployment_v1" "auth_deployment" {
         labels = {
           app = "auth"
         }
+        # Métricas de Prometheus en GET /metrics (app/metrics.py)
+        annotations = {
+          "prometheus.io/scrape" = "true"
+          "prometheus.io/port"   = "8000"
+          "prometheus.io/path"   = "/metrics"
+        }
       }
       spec {
         container {
@@ -243,6 +249,16 @@ resource "kubernetes_deployment_v1" "auth_deployment" {
             name  = "SSL"
             value = "false"
           }
+          # Pool de bcrypt acorde al límite de CPU (500m): un hilo y como mucho
+          # 4 operaciones admitidas; por encima, 503 con Retry-After
+          env {
+            name  = "HASH_WORKERS"
+            value = "1"
+          }
+          env {
+            name  = "HASH_MAX_PENDING"
+            value = "4"
+          }
           # Se asume que el Dockerfile de tu aplicación Python define el CMD o ENTRYPOINT
           # correcto para iniciar la aplicación (ej. CMD ["uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000"]).
           resources {
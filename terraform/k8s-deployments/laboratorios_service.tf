@@ -186,6 +186,12 @@ resource "kubernetes_deployment_v1" "laboratorios_deployment" {
         labels = {
           app = "laboratorios"
         }
+        # Métricas de Prometheus en GET /metrics (app/metrics.py)
+        annotations = {
+          "prometheus.io/scrape" = "true"
+          "prometheus.io/port"   = "8000"
+          "prometheus.io/path"   = "/metrics"
+        }
       }
       spec {
         container {
@@ -212,6 +218,17 @@ resource "kubernetes_deployment_v1" "laboratorios_deployment" {
             }
           }
 
+          env {
+            # Clave compartida con auth para verificar los JWT localmente
+            name  = "JWT_SECRET"
+            value_from {
+              secret_key_ref {
+                name = kubernetes_secret_v1.auth_db_credentials.metadata[0].name
+                key  = "JWT_SECRET"
+              }
+            }
+          }
+
           env { # Variable de entorno SSL para la conexión a la DB
             name  = "SSL"
             value = "false"
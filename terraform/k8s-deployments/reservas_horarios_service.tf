@@ -154,6 +154,12 @@ resource "kubernetes_deployment_v1" "reservas_horarios_deployment" {
         labels = {
           app = "reservas-horarios"
         }
+        # Métricas de Prometheus en GET /metrics (app/metrics.py)
+        annotations = {
+          "prometheus.io/scrape" = "true"
+          "prometheus.io/port"   = "8000"
+          "prometheus.io/path"   = "/metrics"
+        }
       }
       spec {
         container {
@@ -172,6 +178,31 @@ resource "kubernetes_deployment_v1" "reservas_horarios_deployment" {
               }
             }
           }
+          env {
+            # URL interna del servicio de laboratorios para consultar equipos
+            name  = "LABS_URL"
+            value = "http://laboratorios-service/equipos/"
+          }
+          env {
+            # Clave compartida con auth para verificar los JWT localmente
+            name  = "JWT_SECRET"
+            value_from {
+              secret_key_ref {
+                name = kubernetes_secret_v1.auth_db_credentials.metadata[0].name
+                key  = "JWT_SECRET"
+              }
+            }
+          }
+          # Pool de conexiones por réplica: con max_replicas = 5 en el HPA son
+          # como máximo 5 * (5 + 5) = 50 conexiones (Postgres admite 100)
+          env {
+            name  = "DB_POOL_SIZE"
+            value = "5"
+          }
+          env {
+            name  = "DB_MAX_OVERFLOW"
+            value = "5"
+          }
 
            resources {
             requests = { # Lo mínimo que el Pod necesita para ser programado